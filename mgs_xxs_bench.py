@@ -0,0 +1,416 @@
+"""Benchmarks and bit-exactness checks, run with `mgs_xxs_cli.py bench`.
+
+Everything runs on synthetic inputs made in a scratch folder: random bytes
+for the crypto paths and, when OpenCV is installed, a small MP4 written with
+cv2.VideoWriter for the viewer paths. Results are plain JSON, so a run can
+be saved and later ones compared against it with regression thresholds.
+
+Speeds are the best of `repeat` runs, which is the least noisy figure on a
+busy machine. Every fast path is also checked against the original 4-byte
+loop (or, for long offsets, against a path that was checked against it).
+"""
+import hashlib
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+from mgs_xxs_core import (JUMP_MIN_BLOCKS, KEYSTREAM_BACKENDS, N, KeystreamEngine, MersenneTwister, XxsReader,
+                          advance_state, convert_in_place, gen_seed, initial_state, keystream_at,
+                          process_file_threaded, verify_keystream_backend, xor_file_parallel)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RESULTS_VERSION = 1
+DEFAULT_SIZE = 64 * 1024 * 1024
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.10 # Relative slowdown reported as a regression
+BENCH_NAME = "s000a" # Seed source for the synthetic files
+JUMP_CHECK_NAME = "s999z" # Seed no other step uses, so no cached state is close enough to skip the jump
+REFERENCE_BYTES = 256 * 1024 # The original loop runs at ~1 MB/s, check a slice with it
+PYTHON_BACKEND_BYTES = 2 * 1024 * 1024 # The pure-Python backend is too slow for full sizes
+VIDEO_FRAMES = 150
+VIDEO_SIZE = (640, 360)
+VIDEO_FPS = 30
+SEEK_SAMPLES = 20
+
+# Metric fields and which direction is better
+HIGHER_IS_BETTER = ('mb_s', 'fps')
+LOWER_IS_BETTER = ('ms_p50', 'ms_p95')
+
+# --- Reference and Inputs ---
+
+def reference_xor(data, seed):
+    """The original read-4-bytes / gen_rand_int32 / pack loop, on bytes in memory"""
+    mt = MersenneTwister()
+    mt._initialize(seed)
+    out = bytearray()
+    for i in range(0, len(data), 4):
+        chunk = data[i:i + 4]
+        rand_bytes = mt.gen_rand_int32().to_bytes(4, 'little')
+        out += bytes(b ^ rand_bytes[j] for j, b in enumerate(chunk))
+    return bytes(out)
+
+def make_random_file(path, size, chunk_size=16 * 1024 * 1024):
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining:
+            n = min(chunk_size, remaining)
+            f.write(os.urandom(n))
+            remaining -= n
+    return path
+
+def make_synthetic_mp4(path, frames=VIDEO_FRAMES, size=VIDEO_SIZE, fps=VIDEO_FPS):
+    """Moving gradient plus noise, so frames neither compress to nothing nor repeat.
+
+    Returns the path, or None if OpenCV (or its mp4v encoder) isn't available.
+    """
+    try:
+        import cv2
+    except ImportError:
+        return None
+    width, height = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if not writer.isOpened():
+        return None
+    x = np.arange(width, dtype=np.uint16)[None, :]
+    y = np.arange(height, dtype=np.uint16)[:, None]
+    rng = np.random.default_rng(0)
+    frame = np.empty((height, width, 3), np.uint8)
+    for n in range(frames):
+        frame[..., 0] = (x + 3 * n) & 0xFF
+        frame[..., 1] = (y + 2 * n) & 0xFF
+        frame[..., 2] = ((x + y) // 2 + n) & 0xFF
+        frame[::8] = rng.integers(0, 256, frame[::8].shape, dtype=np.uint8)
+        writer.write(frame)
+    writer.release()
+    return path if os.path.getsize(path) else None
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(4 * 1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# --- Measurement ---
+
+def _best_time(run, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def _rate(nbytes, seconds):
+    return round(nbytes / max(seconds, 1e-9) / (1024 ** 2), 1)
+
+def _percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {'ms_p50': round(pick(0.50) * 1000, 2), 'ms_p95': round(pick(0.95) * 1000, 2)}
+
+def _convert(input_path, output_path, **kwargs):
+    outcome = []
+    messages = []
+    process_file_threaded(input_path, output_path, messages.append, lambda value: None, outcome.append, **kwargs)
+    if outcome != [True]:
+        raise RuntimeError(messages[-1] if messages else "Conversion failed")
+
+def bench_keystream(size, repeat):
+    """Seed + PRNG setup + keystream generation, per available backend"""
+    results = {}
+    for name, backend_cls in KEYSTREAM_BACKENDS.items():
+        if not backend_cls.available():
+            continue
+        nbytes = min(size, PYTHON_BACKEND_BYTES) if name == 'python' else size
+        words = nbytes // 4
+
+        def run():
+            engine = KeystreamEngine(gen_seed(BENCH_NAME + ".xxs"), name)
+            for _ in range(words // N):
+                engine.next_block()
+            engine.words(words % N)
+
+        results[f"keystream.{name}"] = {'mb_s': _rate(nbytes, _best_time(run, repeat)), 'bytes': nbytes}
+    return results
+
+def bench_conversion(work_dir, plain_path, repeat, workers):
+    """Sequential encrypt/decrypt and the parallel pipeline, all through the public entry points"""
+    size = os.path.getsize(plain_path)
+    xxs_path = os.path.join(work_dir, BENCH_NAME + ".xxs")
+    mp4_path = os.path.join(work_dir, BENCH_NAME + ".dec.mp4")
+    parallel_path = os.path.join(work_dir, BENCH_NAME + ".par.xxs")
+    seed = gen_seed(xxs_path)
+    results = {
+        'encrypt': {'mb_s': _rate(size, _best_time(lambda: _convert(plain_path, xxs_path), repeat))},
+        'decrypt': {'mb_s': _rate(size, _best_time(lambda: _convert(xxs_path, mp4_path), repeat))},
+    }
+    # Segments sized so every worker gets a few, whatever the input size
+    segment_size = max(N * 4, size // (workers * 4))
+    results['parallel'] = {
+        'mb_s': _rate(size, _best_time(lambda: xor_file_parallel(plain_path, parallel_path, seed, workers,
+                                                                  segment_size), repeat)),
+        'workers': workers,
+    }
+    return results, xxs_path, mp4_path, parallel_path
+
+def bench_viewer(video_path, repeat):
+    """Decode thread throughput, seek latency and (with a display) present cost"""
+    import cv2
+    from mgs_xxs_mp4 import read_video_index_file
+    from mgs_xxs_tool import DISPLAY_MAX_SIZE, FrameDecoder
+
+    def poll(decoder, timeout=10.0):
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            item = decoder.next_frame()
+            if item is not None:
+                return item
+            time.sleep(0.0005)
+        raise RuntimeError("Decoder stalled")
+
+    results = {}
+    best = None
+    for _ in range(repeat):
+        decoder = FrameDecoder(cv2.VideoCapture(video_path))
+        decoder.start()
+        frame_times = []
+        start = last = time.perf_counter()
+        decoder.seek(0)
+        frames = 0
+        while True:
+            frame_number, rgb = poll(decoder)
+            now = time.perf_counter()
+            if rgb is None:
+                break
+            frame_times.append(now - last)
+            last = now
+            frames += 1
+        decoder.stop()
+        elapsed = last - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, frames, frame_times)
+    elapsed, frames, frame_times = best
+    results['viewer.decode'] = dict({'fps': round(frames / max(elapsed, 1e-9), 1), 'frames': frames},
+                                    **_percentiles(frame_times))
+
+    # Seeks as show_frame() issues them: random targets, time until that frame is ready
+    decoder = FrameDecoder(cv2.VideoCapture(video_path))
+    decoder.index = read_video_index_file(video_path)
+    decoder.start()
+    targets = [(i * 7919) % max(frames - 1, 1) for i in range(1, SEEK_SAMPLES + 1)]
+    latencies = []
+    for target in targets:
+        start = time.perf_counter()
+        decoder.seek(target)
+        while True:
+            frame_number, rgb = poll(decoder)
+            if rgb is None or frame_number >= target:
+                break
+        latencies.append(time.perf_counter() - start)
+    decoder.stop()
+    results['viewer.seek'] = _percentiles(latencies)
+
+    present = _bench_present(video_path, DISPLAY_MAX_SIZE)
+    if present is not None:
+        results['viewer.present'] = present
+    return results
+
+def _bench_present(video_path, max_size):
+    """PhotoImage paste per frame, like VideoViewer._present(); None without a display"""
+    try:
+        import tkinter as tk
+        from PIL import Image, ImageTk
+        root = tk.Tk()
+    except Exception:
+        return None
+    try:
+        import cv2
+        from mgs_xxs_tool import fit_size
+        cap = cv2.VideoCapture(video_path)
+        frames = []
+        while len(frames) < 60:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            width, height = fit_size(frame.shape[1], frame.shape[0], *max_size)
+            frames.append(cv2.cvtColor(cv2.resize(frame, (width, height)), cv2.COLOR_BGR2RGB))
+        cap.release()
+        if not frames:
+            return None
+        height, width = frames[0].shape[:2]
+        photo = ImageTk.PhotoImage('RGB', (width, height))
+        label = tk.Label(root, image=photo)
+        label.pack()
+        times = []
+        for rgb in frames:
+            start = time.perf_counter()
+            photo.paste(Image.fromarray(rgb))
+            root.update_idletasks()
+            times.append(time.perf_counter() - start)
+        return dict({'fps': round(len(times) / max(sum(times), 1e-9), 1)}, **_percentiles(times))
+    finally:
+        root.destroy()
+
+# --- Bit-Exactness ---
+
+def run_checks(work_dir, plain_path, xxs_path, mp4_path, parallel_path):
+    """Every fast path against the reference loop (or a checked path), name -> bool"""
+    size = os.path.getsize(plain_path)
+    seed = gen_seed(xxs_path)
+    checks = {}
+    for name, backend_cls in KEYSTREAM_BACKENDS.items():
+        if backend_cls.available():
+            checks[f"backend.{name}"] = verify_keystream_backend(name)
+
+    with open(plain_path, 'rb') as f:
+        head = f.read(REFERENCE_BYTES)
+    with open(xxs_path, 'rb') as f:
+        checks['encrypt.reference'] = f.read(len(head)) == reference_xor(head, seed)
+
+    # Offsets within JUMP_MIN_BLOCKS generate forward, so check those against one
+    # sequential engine. Offsets past it use the GF(2) jump, whatever the file
+    # size, and are checked against a state walked there by plain generation
+    engine = KeystreamEngine(seed)
+    sequential = b''.join(engine.read(N * 4) for _ in range(64))
+    jump_ok = all(keystream_at(seed, offset, 4099) == sequential[offset:offset + 4099]
+                  for offset in (0, 3, N * 4 - 2, 17 * N * 4 + 1))
+    jump_seed = gen_seed(JUMP_CHECK_NAME + ".xxs")
+    block = JUMP_MIN_BLOCKS + 3
+    walked = advance_state(initial_state(jump_seed), block)
+    walked_keystream = KeystreamEngine(jump_seed, state=(walked, N)).read(3 * N * 4)
+    jump_ok = jump_ok and all(keystream_at(jump_seed, block * N * 4 + offset, 4099)
+                              == walked_keystream[offset:offset + 4099] for offset in (0, 5, N * 4 - 2))
+    far = size - size % 4 - 8192 if size > 8192 else 0
+    tail = keystream_at(seed, far, size - far)
+    with open(plain_path, 'rb') as f_plain, open(xxs_path, 'rb') as f_xxs:
+        f_plain.seek(far)
+        f_xxs.seek(far)
+        jump_ok = jump_ok and bytes(a ^ b for a, b in zip(f_plain.read(), tail)) == f_xxs.read()
+    checks['keystream_at'] = jump_ok
+
+    encrypted = sha256_file(xxs_path)
+    checks['decrypt.roundtrip'] = sha256_file(mp4_path) == sha256_file(plain_path)
+    checks['parallel'] = sha256_file(parallel_path) == encrypted
+
+    in_place_path = os.path.join(work_dir, BENCH_NAME + ".inplace.mp4")
+    in_place_target = os.path.join(work_dir, BENCH_NAME + ".inplace.xxs")
+    shutil.copyfile(plain_path, in_place_path)
+    convert_in_place(in_place_path, in_place_target, seed)
+    checks['in_place'] = sha256_file(in_place_target) == encrypted
+    os.remove(in_place_target)
+
+    ok = True
+    with XxsReader(xxs_path, seed=seed) as reader, open(plain_path, 'rb') as f:
+        for offset in (0, 1, 4095, size // 2 + 3, max(0, size - 5)):
+            reader.seek(offset)
+            f.seek(offset)
+            ok = ok and reader.read(65537) == f.read(65537)
+    checks['reader'] = ok
+    return checks
+
+# --- Running and Comparing ---
+
+def run_benchmarks(size=DEFAULT_SIZE, repeat=DEFAULT_REPEAT, work_dir=None, viewer=True, workers=None, log=None):
+    """Make the inputs, run every benchmark and check, return the results dict.
+
+    Args:
+        size (int): Bytes of random input. 3 bytes are added so the 1-3
+            byte tail path is exercised too.
+        repeat (int): Runs per measurement, the best one is kept.
+        work_dir (str): Scratch folder, a temporary one by default.
+        viewer (bool): Also benchmark the viewer (needs OpenCV).
+        workers (int): Processes for the parallel benchmark, defaults to
+            the CPU count (at least 2, so the pool is really used).
+        log (function): Called with progress lines.
+    """
+    log = log or (lambda message: None)
+    workers = workers or max(2, os.cpu_count() or 1)
+    owned = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="mgs_xxs_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        plain_path = make_random_file(os.path.join(work_dir, BENCH_NAME + ".mp4"), size + 3)
+        results = {}
+        log("Keystream backends...")
+        results.update(bench_keystream(size, repeat))
+        log("Encrypt / decrypt / parallel...")
+        conversion, xxs_path, mp4_path, parallel_path = bench_conversion(work_dir, plain_path, repeat, workers)
+        results.update(conversion)
+        log("Bit-exactness checks...")
+        checks = run_checks(work_dir, plain_path, xxs_path, mp4_path, parallel_path)
+        video = None
+        if viewer:
+            video = make_synthetic_mp4(os.path.join(work_dir, "synthetic.mp4"))
+            if video is None:
+                log("OpenCV not available, skipping the viewer benchmarks.")
+            else:
+                log("Viewer decode / seek / present...")
+                results.update(bench_viewer(video, repeat))
+    finally:
+        if owned:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'version': RESULTS_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__ if np is not None else None,
+            'opencv': _opencv_version() if viewer else None,
+        },
+        'size': size + 3,
+        'repeat': repeat,
+        'results': results,
+        'checks': checks,
+    }
+
+def _opencv_version():
+    try:
+        import cv2
+        return cv2.__version__
+    except ImportError:
+        return None
+
+def iter_metrics(results):
+    """Yield (name, field, value) for every comparable metric"""
+    for name, values in sorted(results.get('results', {}).items()):
+        for field, value in values.items():
+            if field in HIGHER_IS_BETTER or field in LOWER_IS_BETTER:
+                yield name, field, value
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Metrics that got worse than threshold (a fraction) relative to baseline.
+
+    The baseline may carry a 'thresholds' dict keyed by "name.field" (for
+    example "viewer.seek.ms_p95") to override the threshold per metric.
+
+    Returns:
+        list: dicts with metric, baseline, current and change (a fraction,
+            negative = worse).
+    """
+    overrides = baseline.get('thresholds', {})
+    previous = {(name, field): value for name, field, value in iter_metrics(baseline)}
+    regressions = []
+    for name, field, value in iter_metrics(current):
+        before = previous.get((name, field))
+        if not before:
+            continue
+        if field in HIGHER_IS_BETTER:
+            change = (value - before) / before
+        else:
+            change = (before - value) / before
+        metric = f"{name}.{field}"
+        if change < -overrides.get(metric, threshold):
+            regressions.append({'metric': metric, 'baseline': before, 'current': value,
+                                'change': round(change, 3)})
+    return regressions
@@ -0,0 +1,665 @@
+"""Headless command line for MG-REXXS (no Tk, OpenCV or PIL needed).
+
+Examples:
+    python mgs_xxs_cli.py convert "C:/Games/MGS2/movie"      # decrypt every .xxs in the tree
+    python mgs_xxs_cli.py convert mods/*.mp4 -j 4             # encrypt back to .xxs
+    python mgs_xxs_cli.py convert movie -p "*.mp4"            # encrypt a whole tree
+    python mgs_xxs_cli.py convert big.xxs --workers 4         # split one large file over 4 processes
+    python mgs_xxs_cli.py convert edited.mp4 --incremental    # only rewrite the changed parts of edited.xxs
+    python mgs_xxs_cli.py convert movie --telemetry log.jsonl --profile cpu   # per-step timings and a .prof
+    python mgs_xxs_cli.py probe "C:/Games/MGS2/movie"        # list duration, resolution and codecs
+    python mgs_xxs_cli.py verify mod/movie --write sums.json  # hash .xxs and decrypted content, write nothing else
+    python mgs_xxs_cli.py serve "C:/Games/MGS2/movie"        # play .xxs files in any player over HTTP
+    python mgs_xxs_cli.py recover renamed.xxs -g "s{000..999}{a..z}"   # find the name the key came from
+    python mgs_xxs_cli.py bench --json base.json             # benchmark and check bit-exactness
+    python mgs_xxs_cli.py bench --baseline base.json         # ... and flag regressions against a saved run
+"""
+import argparse
+import concurrent.futures
+import functools
+import json
+import os
+import re
+import signal
+import sys
+import threading
+import time
+
+from mgs_xxs_core import (DEFAULT_BLOCK_SIZE, DEFAULT_CACHE_MAX_BYTES, DEFAULT_SEGMENT_SIZE, HASH_ALGORITHMS, KEYSTREAM_BACKENDS,
+                          KeystreamCache, ProgressBus, TelemetryLog, collect_inputs, compare_manifest_entry,
+                          format_duration, format_rate, hash_file, hash_xxs, journal_path_for, new_manifest,
+                          output_path_for, parse_profile_modes, probe_file, process_file_threaded, read_manifest,
+                          recover_names, rollback_in_place, write_manifest)
+
+# --- Helpers ---
+
+def parse_size(text):
+    """Parse sizes like 4194304, 512K, 4M or 1G"""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    text = text.strip().upper().rstrip('B')
+    try:
+        if text and text[-1] in units:
+            return int(float(text[:-1]) * units[text[-1]])
+        return int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid size: {text}")
+
+def positive_int(text):
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid number: {text}")
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"Must be at least 1: {value}")
+    return value
+
+def format_bytes(count):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if count < 1024 or unit == 'GB':
+            return f"{count:.1f} {unit}" if unit != 'B' else f"{count} B"
+        count /= 1024
+
+def profile_modes(text):
+    try:
+        return parse_profile_modes(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+_BRACE_RE = re.compile(r"\{([^{}]*)\}")
+_RANGE_RE = re.compile(r"^(-?\d+)\.\.(-?\d+)$|^([a-zA-Z])\.\.([a-zA-Z])$")
+
+def _brace_options(body):
+    match = _RANGE_RE.match(body)
+    if not match:
+        return body.split(',')
+    if match.group(1) is not None:
+        first, last = match.group(1), match.group(2)
+        # Zero padded like the bounds: {000..999} -> 000, 001, ...
+        width = max(len(first), len(last)) if first.lstrip('-').startswith('0') and len(first) > 1 else 0
+        step = 1 if int(last) >= int(first) else -1
+        return [str(i).zfill(width) for i in range(int(first), int(last) + step, step)]
+    first, last = ord(match.group(3)), ord(match.group(4))
+    step = 1 if last >= first else -1
+    return [chr(i) for i in range(first, last + step, step)]
+
+def expand_braces(pattern):
+    """Shell-style brace expansion: "s{000..002}{a,b}" -> s000a, s000b, s001a, ...
+
+    Yields names lazily, so huge patterns don't need to fit in memory.
+    """
+    match = _BRACE_RE.search(pattern)
+    if not match:
+        yield pattern
+        return
+    head, tail = pattern[:match.start()], pattern[match.end():]
+    for option in _brace_options(match.group(1)):
+        for rest in expand_braces(tail):
+            yield head + option + rest
+
+def read_name_list(path):
+    """Candidate names from a wordlist or manifest: one name or path per line, # comments"""
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield os.path.basename(line.replace('\\', '/'))
+
+def run_jobs(worker, jobs, workers, report):
+    """Run worker(job) for every job, on a process pool when workers > 1"""
+    if workers <= 1:
+        for job in jobs:
+            report(worker(job))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(worker, job) for job in jobs]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    report(future.result())
+            except KeyboardInterrupt:
+                for future in futures:
+                    future.cancel() # Don't start queued files on the way out
+                raise
+
+class ProgressLine:
+    """ProgressBus subscriber that keeps one updating line on stderr"""
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self.width = 0
+
+    def show(self, event):
+        if event.kind != 'progress':
+            return
+        text = f"  {os.path.basename(event.job)} {event.value:3.0f}%"
+        self.stream.write("\r" + text.ljust(self.width))
+        self.stream.flush()
+        self.width = len(text)
+
+    def clear(self):
+        if self.width:
+            self.stream.write("\r" + " " * self.width + "\r")
+            self.stream.flush()
+            self.width = 0
+
+# --- Commands ---
+
+def _convert_one(job, events=None):
+    """Process pool worker: convert one file, return a result dict.
+
+    events (ProgressBus) also gets the status and progress of the job when
+    running in-process.
+    """
+    (input_path, block_size, backend, in_place, cache_spec, incremental, telemetry_path, profile,
+     workers, segment_size) = job
+    output_path = output_path_for(input_path)
+    cache = KeystreamCache(*cache_spec) if cache_spec else None
+    telemetry = TelemetryLog(telemetry_path) if telemetry_path else None
+    size = os.path.getsize(input_path) if os.path.isfile(input_path) else 0
+    messages = []
+    outcome = []
+    on_progress = lambda value: None
+    on_status = messages.append
+    if events is not None:
+        post_status, on_progress, _ = events.callbacks(input_path)
+
+        def on_status(message):
+            messages.append(message)
+            post_status(message)
+    # Ctrl+C stops at the next block boundary and leaves a checkpoint to resume from
+    cancel_event = threading.Event()
+    previous_handler = signal.signal(signal.SIGINT, lambda signum, frame: cancel_event.set())
+    start = time.perf_counter()
+    try:
+        process_file_threaded(input_path, output_path, on_status, on_progress, outcome.append,
+                              block_size=block_size, backend=backend, workers=workers,
+                              segment_size=segment_size, in_place=in_place, cache=cache,
+                              incremental=incremental, cancel_event=cancel_event, telemetry=telemetry,
+                              profile=profile)
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+    return {
+        'input': input_path,
+        'output': output_path,
+        'ok': outcome == [True],
+        'bytes': size,
+        'seconds': time.perf_counter() - start,
+        'message': messages[-1] if messages else "",
+        'detail': next((m for m in messages if m.startswith("Incremental:")), ""),
+        'profiles': [m[len("Profile saved to "):] for m in messages if m.startswith("Profile saved to ")],
+        'cancelled': cancel_event.is_set(),
+    }
+
+def _rollback(inputs):
+    failed = []
+    for path in inputs:
+        if not os.path.exists(journal_path_for(path)):
+            continue
+        try:
+            windows = rollback_in_place(path)
+            if windows is None:
+                print(f"NOTHING TO ROLL BACK  {path} (only its journal was left, removed)")
+            else:
+                print(f"ROLLED BACK  {path} ({windows} window(s) restored)")
+        except Exception as e:
+            print(f"FAIL  {path}: {e}")
+            failed.append(path)
+    if failed:
+        print(f"Failed ({len(failed)}):", file=sys.stderr)
+        for path in failed:
+            print(f"  {path}", file=sys.stderr)
+        return 1
+    return 0
+
+def cmd_convert(args):
+    inputs = collect_inputs(args.paths, args.pattern)
+    if not inputs:
+        print("No input files found.", file=sys.stderr)
+        return 1
+    if args.rollback:
+        return _rollback(inputs)
+
+    cache_spec = None
+    if args.cache or args.cache_dir:
+        cache_spec = (args.cache_dir, args.cache_max)
+    if args.incremental and args.in_place:
+        print("--incremental and --in-place can't be combined.", file=sys.stderr)
+        return 2
+    if args.incremental and cache_spec:
+        print("--incremental can't use the keystream cache, drop --cache/--cache-dir.", file=sys.stderr)
+        return 2
+    jobs = [(path, args.block_size, args.backend, args.in_place, cache_spec, args.incremental,
+             args.telemetry, args.profile, args.workers, args.segment_size) for path in inputs]
+    workers = min(args.jobs or os.cpu_count() or 1, len(jobs))
+    print(f"Converting {len(jobs)} file(s) with {workers} worker(s)...")
+    if args.workers != 1 and (args.in_place or args.incremental):
+        print("--workers has no effect with --in-place or --incremental.", file=sys.stderr)
+    elif args.workers != 1 and workers > 1:
+        print(f"Note: each of the {workers} files at a time may start --workers processes of its own; "
+              "-j 1 is usually best with --workers.", file=sys.stderr)
+
+    worker = _convert_one
+    progress = None
+    if args.progress:
+        if workers == 1:
+            progress = ProgressLine()
+            events = ProgressBus()
+            events.subscribe(progress.show)
+            worker = functools.partial(_convert_one, events=events)
+        else:
+            print("--progress needs a single worker (-j 1), showing per-file results only.", file=sys.stderr)
+
+    start = time.perf_counter()
+    results = []
+
+    def report(result):
+        results.append(result)
+        if progress:
+            progress.clear()
+        if result['ok']:
+            print(f"OK    {result['input']} -> {os.path.basename(result['output'])} "
+                  f"({format_bytes(result['bytes'])}, {format_rate(result['bytes'], result['seconds'])})"
+                  + (f" {result['detail']}" if result['detail'] else ""))
+        elif result['cancelled']:
+            print(f"STOP  {result['input']}: {result['message']}")
+            raise KeyboardInterrupt # Stop the whole batch, not just this file
+        else:
+            print(f"FAIL  {result['input']}: {result['message']}")
+        for path in result['profiles']:
+            print(f"      profile: {path}")
+
+    try:
+        run_jobs(worker, jobs, workers, report)
+    except KeyboardInterrupt:
+        print("Interrupted. Run the same command again to resume.", file=sys.stderr)
+        return 130
+
+    elapsed = time.perf_counter() - start
+    done = [r for r in results if r['ok']]
+    total_bytes = sum(r['bytes'] for r in done)
+    print(f"Converted {len(done)}/{len(results)} file(s), {format_bytes(total_bytes)} in {elapsed:.2f} s "
+          f"({format_rate(total_bytes, elapsed)} aggregate)")
+    if args.telemetry:
+        print(f"Telemetry appended to {args.telemetry}")
+
+    failed = [r for r in results if not r['ok']]
+    if failed:
+        print(f"Failed ({len(failed)}):", file=sys.stderr)
+        for result in failed:
+            print(f"  {result['input']}", file=sys.stderr)
+        return 1
+    return 0
+
+def _verify_one(job):
+    """Process pool worker: hash one .xxs (and its source .mp4), return a result dict"""
+    input_path, algorithm, source_path = job
+    result = {'input': input_path, 'source': source_path, 'entry': None, 'source_match': None, 'error': None}
+    start = time.perf_counter()
+    try:
+        result['entry'] = hash_xxs(input_path, algorithm)
+        if source_path and os.path.isfile(source_path):
+            result['source_match'] = hash_file(source_path, algorithm) == result['entry']['plaintext']
+    except (OSError, ValueError, KeyError) as e: # One bad file fails, the batch goes on
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def _manifest_key(path, base):
+    return os.path.relpath(os.path.abspath(path), base).replace(os.sep, '/')
+
+def cmd_verify(args):
+    manifest = None
+    if args.check:
+        try:
+            manifest = read_manifest(args.check) # JSON errors are ValueErrors too
+        except (OSError, ValueError) as e:
+            print(f"Could not read manifest: {e}", file=sys.stderr)
+            return 1
+        check_base = os.path.dirname(os.path.abspath(args.check))
+    if args.paths:
+        inputs = collect_inputs(args.paths, args.pattern)
+    elif manifest is not None: # Everything the manifest lists, missing files are reported below
+        inputs = [os.path.join(check_base, *key.split('/')) for key in manifest['files']]
+        inputs = [path for path in inputs if os.path.exists(path)]
+    else:
+        inputs = []
+    if not inputs and manifest is None:
+        print("No input files found.", file=sys.stderr)
+        return 1
+
+    algorithm = manifest['algorithm'] if manifest is not None else args.algorithm
+    jobs = []
+    for path in inputs:
+        source = None
+        if args.source_dir:
+            source = os.path.join(args.source_dir, os.path.splitext(os.path.basename(path))[0] + ".mp4")
+        jobs.append((path, algorithm, source))
+    workers = max(1, min(args.jobs or os.cpu_count() or 1, len(jobs)))
+    print(f"Verifying {len(jobs)} file(s) with {workers} worker(s) ({algorithm})...")
+
+    written = new_manifest(algorithm)
+    write_base = os.path.dirname(os.path.abspath(args.write)) if args.write else None
+    seen = set()
+    problems = []
+    total_bytes = 0
+    start = time.perf_counter()
+
+    def report(result):
+        nonlocal total_bytes
+        path = result['input']
+        entry = result['entry']
+        if entry is None:
+            problems.append(path)
+            print(f"FAIL  {path}: {result['error']}")
+            return
+        total_bytes += entry['size']
+        issues = []
+        if not entry['mp4']:
+            issues.append("does not decrypt to an MP4 (wrong filename?)")
+        if result['source_match'] is False:
+            issues.append("plaintext differs from the source .mp4")
+        elif result['source'] and result['source_match'] is None:
+            issues.append(f"source {os.path.basename(result['source'])} not found")
+        if manifest is not None:
+            key = _manifest_key(path, check_base)
+            seen.add(key)
+            expected = manifest['files'].get(key)
+            if expected is None:
+                issues.append("not in manifest")
+            elif not isinstance(expected, dict):
+                issues.append("manifest entry is corrupt")
+            else:
+                issues.extend(f"{field} differs from manifest" for field in compare_manifest_entry(expected, entry))
+        if write_base:
+            written['files'][_manifest_key(path, write_base)] = entry
+        if issues:
+            problems.append(path)
+            print(f"FAIL  {path}: {'; '.join(issues)}")
+        else:
+            note = ", matches source" if result['source_match'] else ""
+            print(f"OK    {path}  {entry['plaintext'][:16]}{note} ({format_rate(entry['size'], result['seconds'])})")
+
+    run_jobs(_verify_one, jobs, workers, report)
+
+    if manifest is not None:
+        for key in manifest['files']:
+            if key not in seen and not os.path.exists(os.path.join(check_base, *key.split('/'))):
+                problems.append(key)
+                print(f"FAIL  {key}: listed in manifest but missing")
+    if write_base:
+        written['files'] = dict(sorted(written['files'].items()))
+        write_manifest(args.write, written)
+        print(f"Wrote manifest for {len(written['files'])} file(s) to {args.write}")
+
+    elapsed = time.perf_counter() - start
+    print(f"Verified {len(jobs)} file(s), {format_bytes(total_bytes)} in {elapsed:.2f} s "
+          f"({format_rate(total_bytes, elapsed)} aggregate)")
+    if problems:
+        print(f"Problems ({len(problems)}):", file=sys.stderr)
+        for path in problems:
+            print(f"  {path}", file=sys.stderr)
+        return 1
+    return 0
+
+def describe_probe(info):
+    """One-line summary of a probe_file() result"""
+    parts = [format_duration(info.get('duration', 0.0))]
+    for track in info['tracks']:
+        if track.get('type') == 'vide':
+            parts.append(f"{track.get('codec', '?')} {track.get('width', '?')}x{track.get('height', '?')}"
+                         + (f" {track['fps']:.2f} fps" if 'fps' in track else "")
+                         + (f" {track['samples']} frames" if 'samples' in track else ""))
+        elif track.get('type') == 'soun':
+            parts.append(f"{track.get('codec', '?')} {track.get('channels', '?')}ch {track.get('sample_rate', '?')} Hz")
+    if not info.get('faststart'):
+        parts.append("moov at end")
+    return ", ".join(parts)
+
+def cmd_probe(args):
+    inputs = collect_inputs(args.paths, args.pattern)
+    if not inputs:
+        print("No input files found.", file=sys.stderr)
+        return 1
+
+    results = []
+    failed = 0
+    start = time.perf_counter()
+    for path in inputs:
+        file_start = time.perf_counter()
+        try:
+            info = probe_file(path)
+        except Exception as e:
+            failed += 1
+            info = {'error': str(e)}
+        elapsed = time.perf_counter() - file_start
+        info['path'] = path
+        results.append(info)
+        if not args.json:
+            if 'error' in info:
+                print(f"FAIL  {path}: {info['error']}")
+            else:
+                print(f"{path}  {describe_probe(info)}  ({elapsed * 1000:.1f} ms)")
+
+    elapsed = time.perf_counter() - start
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print(f"Probed {len(results)} file(s) in {elapsed:.2f} s ({elapsed * 1000 / len(results):.1f} ms per file)")
+    return 1 if failed else 0
+
+def cmd_recover(args):
+    inputs = collect_inputs(args.paths, "*.xxs")
+    if not inputs:
+        print("No input files found.", file=sys.stderr)
+        return 1
+    if not (args.wordlist or args.name or args.generate):
+        print("Give candidate names with -w, -n or -g.", file=sys.stderr)
+        return 1
+
+    def candidates():
+        for name in args.name or ():
+            yield name
+        for path in args.wordlist or ():
+            yield from read_name_list(path)
+        for pattern in args.generate or ():
+            yield from expand_braces(pattern)
+
+    failed = 0
+    for path in inputs:
+        tested = [0]
+        start = time.perf_counter()
+        try:
+            found = recover_names(path, candidates(), progress_callback=lambda n: tested.__setitem__(0, n))
+        except (OSError, ValueError) as e:
+            print(f"FAIL  {path}: {e}")
+            failed += 1
+            continue
+        elapsed = time.perf_counter() - start
+        rate = f"{tested[0]} names in {elapsed:.2f} s, {tested[0] / max(elapsed, 1e-9):,.0f}/s"
+        if not found:
+            print(f"NONE  {path}: no candidate matched ({rate})")
+            failed += 1
+            continue
+        names = ", ".join(f"{name} (seed 0x{seed:08x})" for name, seed in found)
+        print(f"FOUND {path}: {names} ({rate})")
+        if args.rename:
+            base = os.path.basename(found[0][0]).split('.', 1)[0]
+            target = os.path.join(os.path.dirname(path), base + ".xxs")
+            if os.path.normcase(os.path.abspath(target)) == os.path.normcase(os.path.abspath(path)):
+                continue
+            if os.path.exists(target):
+                print(f"      not renamed, {target} already exists")
+                failed += 1
+            else:
+                os.rename(path, target)
+                print(f"      renamed to {target}")
+    return 1 if failed else 0
+
+def cmd_serve(args):
+    from mgs_xxs_server import XxsHTTPServer # Only needed for this command
+
+    if not os.path.isdir(args.root):
+        print(f"Not a directory: {args.root}", file=sys.stderr)
+        return 1
+    server = XxsHTTPServer(args.root, (args.host, args.port), threads=args.threads,
+                           page_cache_mb=args.cache_mb, verbose=args.verbose)
+    print(f"Serving .xxs files from {server.root} at {server.url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+def describe_metrics(values):
+    parts = []
+    for field, value in values.items():
+        if field == 'mb_s':
+            parts.append(f"{value:.1f} MB/s")
+        elif field == 'fps':
+            parts.append(f"{value:.1f} fps")
+        elif field.startswith('ms_'):
+            parts.append(f"{field[3:]} {value:.2f} ms")
+        else:
+            parts.append(f"{field} {value}")
+    return ", ".join(parts)
+
+def cmd_bench(args):
+    from mgs_xxs_bench import compare_results, run_benchmarks # Pulls in OpenCV for the viewer part
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    results = run_benchmarks(args.size, args.repeat, args.dir, viewer=not args.no_viewer, workers=args.workers,
+                             log=lambda message: print(message, file=sys.stderr))
+
+    for name, values in sorted(results['results'].items()):
+        print(f"{name:<20} {describe_metrics(values)}")
+    failed = [name for name, ok in results['checks'].items() if not ok]
+    print(f"Bit-exact checks: {len(results['checks']) - len(failed)}/{len(results['checks'])} passed"
+          + (f", FAILED: {', '.join(failed)}" if failed else ""))
+
+    if baseline is not None:
+        if baseline.get('size') != results['size']:
+            print(f"Note: the baseline used a {format_bytes(baseline.get('size') or 0)} input, "
+                  f"this run {format_bytes(results['size'])}; speeds may not compare.", file=sys.stderr)
+        results['regressions'] = compare_results(baseline, results, args.threshold)
+        for regression in results['regressions']:
+            print(f"REGRESSION  {regression['metric']}: {regression['baseline']} -> {regression['current']} "
+                  f"({regression['change'] * 100:+.1f}%)")
+        if not results['regressions']:
+            print(f"No regressions against {args.baseline} (threshold {args.threshold * 100:.0f}%).")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 1 if failed or results.get('regressions') else 0
+
+# --- Entry Point ---
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="mgs_xxs_cli",
+                                     description="Encrypt/decrypt MGS Master Collection .xxs files without the GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser("convert", help="Convert files, globs or directory trees (.xxs <-> .mp4)")
+    convert.add_argument("paths", nargs="+", help="Files, glob patterns or directories")
+    convert.add_argument("-p", "--pattern", default="*.xxs",
+                         help="Files to pick up inside directories (default: *.xxs)")
+    convert.add_argument("-j", "--jobs", type=int, default=None,
+                         help="Files converted concurrently (default: CPU count)")
+    convert.add_argument("--workers", type=positive_int, default=1,
+                         help="Processes that split up each file larger than --segment-size "
+                              "(default: 1). Not used with --in-place or --incremental")
+    convert.add_argument("--segment-size", type=parse_size, default=DEFAULT_SEGMENT_SIZE,
+                         help="Bytes per --workers task (default: 64M)")
+    convert.add_argument("--block-size", type=parse_size, default=DEFAULT_BLOCK_SIZE,
+                         help="Read/XOR block size, e.g. 4M (default: %(default)s)")
+    convert.add_argument("--backend", choices=list(KEYSTREAM_BACKENDS),
+                         help="Keystream backend (default: fastest available)")
+    convert.add_argument("--in-place", action="store_true",
+                         help="Convert each file in place and rename it (no second copy, resumable)")
+    convert.add_argument("--rollback", action="store_true",
+                         help="Undo interrupted --in-place conversions of the given files")
+    convert.add_argument("--progress", action="store_true",
+                         help="Show a live progress line (with -j 1)")
+    convert.add_argument("--incremental", action="store_true",
+                         help="When encrypting over an existing .xxs, only rewrite blocks that changed "
+                              "(keeps a .xxsblocks manifest next to it)")
+    convert.add_argument("--cache", action="store_true",
+                         help="Reuse keystreams from an on-disk cache keyed by seed")
+    convert.add_argument("--cache-dir", default=None,
+                         help="Cache directory (implies --cache, default: user cache folder)")
+    convert.add_argument("--cache-max", type=parse_size, default=DEFAULT_CACHE_MAX_BYTES,
+                         help="Cache size cap, least recently used entries go first (default: 1G)")
+    convert.add_argument("--telemetry", metavar="LOG",
+                         help="Append per-job timings (seed, PRNG, read, XOR, write), speed and peak memory "
+                              "to this JSON-lines file")
+    convert.add_argument("--profile", type=profile_modes, default=(), metavar="MODES",
+                         help="Profile each job with cpu (cProfile, .prof) and/or memory (tracemalloc, "
+                              ".memory.txt), saved next to the output")
+    convert.set_defaults(func=cmd_convert)
+
+    probe = commands.add_parser("probe", help="Show MP4 metadata of .xxs files, decrypting only the headers")
+    probe.add_argument("paths", nargs="+", help="Files, glob patterns or directories")
+    probe.add_argument("-p", "--pattern", default="*.xxs",
+                       help="Files to pick up inside directories (default: *.xxs)")
+    probe.add_argument("--json", action="store_true", help="Print the full metadata as JSON")
+    probe.set_defaults(func=cmd_probe)
+
+    recover = commands.add_parser("recover", help="Find the filename an .xxs was encrypted with from candidate names")
+    recover.add_argument("paths", nargs="+", help=".xxs files, globs or directories")
+    recover.add_argument("-w", "--wordlist", action="append",
+                         help="File with one candidate name (or path) per line, e.g. a game manifest")
+    recover.add_argument("-n", "--name", action="append", help="A single candidate name")
+    recover.add_argument("-g", "--generate", action="append",
+                         help='Brace pattern of candidates, e.g. "s{000..999}{a..z}" or "{demo,title}_{mgs2,mgs3}"')
+    recover.add_argument("--rename", action="store_true",
+                         help="Rename each file to the name found (keeps .xxs)")
+    recover.set_defaults(func=cmd_recover)
+
+    verify = commands.add_parser("verify", help="Hash .xxs files and their decrypted content, write or check a manifest")
+    verify.add_argument("paths", nargs="*", help="Files, globs or directories (default: everything in --check)")
+    verify.add_argument("-p", "--pattern", default="*.xxs",
+                        help="Files to pick up inside directories (default: *.xxs)")
+    verify.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Files hashed concurrently (default: CPU count)")
+    verify.add_argument("--algorithm", choices=HASH_ALGORITHMS, default="sha256",
+                        help="Hash for new manifests (default: %(default)s)")
+    verify.add_argument("--write", metavar="MANIFEST", help="Write a JSON manifest of the hashes")
+    verify.add_argument("--check", metavar="MANIFEST", help="Compare against a manifest written earlier")
+    verify.add_argument("--source-dir", help="Folder with the source .mp4 files the plaintext must match")
+    verify.set_defaults(func=cmd_verify)
+
+    serve = commands.add_parser("serve", help="Serve .xxs files as video/mp4 over HTTP, decrypted on the fly")
+    serve.add_argument("root", help="Folder to serve (subfolders included)")
+    serve.add_argument("--host", default="127.0.0.1", help="Address to bind (default: %(default)s, local only)")
+    serve.add_argument("--port", type=int, default=8765, help="Port (default: %(default)s)")
+    serve.add_argument("--threads", type=int, default=8, help="Connections handled at once (default: %(default)s)")
+    serve.add_argument("--cache-mb", type=int, default=64,
+                       help="Keystream page cache shared by all clients, in MB (default: %(default)s)")
+    serve.add_argument("-v", "--verbose", action="store_true", help="Log every request")
+    serve.set_defaults(func=cmd_serve)
+
+    bench = commands.add_parser("bench", help="Benchmark keystream, conversion and viewer paths on synthetic "
+                                              "inputs and check them for bit-exactness")
+    bench.add_argument("--size", type=parse_size, default=64 * 1024 * 1024,
+                       help="Size of the random input, e.g. 256M (default: 64M)")
+    bench.add_argument("--repeat", type=int, default=3, help="Runs per measurement, best is kept (default: %(default)s)")
+    bench.add_argument("--workers", type=int, default=None,
+                       help="Processes for the parallel benchmark (default: CPU count, at least 2)")
+    bench.add_argument("--no-viewer", action="store_true", help="Skip the viewer benchmarks (no OpenCV needed)")
+    bench.add_argument("--dir", default=None, help="Scratch folder for the inputs (default: a temporary one)")
+    bench.add_argument("--json", default=None, help="Write the results to this JSON file")
+    bench.add_argument("--baseline", default=None, help="Earlier --json results to compare against")
+    bench.add_argument("--threshold", type=float, default=0.10,
+                       help="Slowdown that counts as a regression, as a fraction (default: %(default)s)")
+    bench.set_defaults(func=cmd_bench)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2510 @@
+"""Core .xxs crypto: seed derivation, keystream generation and file conversion.
+
+Only needs the standard library. NumPy is used when installed for the fast
+keystream backends and XOR, but everything works without it.
+"""
+import array
+import concurrent.futures
+import contextlib
+import fnmatch
+import functools
+import glob
+import hashlib
+import io
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+
+from mgs_xxs_mp4 import iter_boxes, probe_mp4
+
+try:
+    import numpy as np
+except ImportError: # NumPy is optional, the pure-Python keystream still works
+    np = None
+
+try:
+    import resource
+except ImportError: # Windows, peak_rss() asks the Win32 API instead
+    resource = None
+
+# --- Constants and Core Logic (Copied from the base script) ---
+
+# Constants for Mersenne Twister (MT19937) - standard parameters
+N = 624
+M = 397
+MATRIX_A = 0x9908b0df
+UPPER_MASK = 0x80000000 # 32-bit MSB
+LOWER_MASK = 0x7fffffff # 32-bit LSBs
+
+class MersenneTwister:
+    def __init__(self):
+        self.mt = [0] * N
+        self.mti = N + 1
+
+    def _initialize(self, seed):
+        current_value = seed & 0xFFFFFFFF
+        for i in range(N):
+            term1 = (current_value * 69069 + 1) & 0xFFFFFFFF
+            self.mt[i] = ((term1 >> 16) | (current_value & 0xffff0000)) & 0xFFFFFFFF
+            current_value = (term1 * 69069 + 1) & 0xFFFFFFFF
+        self.mti = N
+
+    def _twist(self):
+        for i in range(N):
+            val_term1 = self.mt[i] & UPPER_MASK
+            val_term2 = self.mt[(i + 1) % N] & LOWER_MASK
+            y = (val_term1 + val_term2) & 0xFFFFFFFF
+            self.mt[i] = self.mt[(i + M) % N] ^ (y >> 1)
+            if (y & 1) != 0:
+                self.mt[i] = (self.mt[i] ^ MATRIX_A) & 0xFFFFFFFF
+            self.mt[i] &= 0xFFFFFFFF
+        self.mti = 0
+
+    def gen_rand_int32(self):
+        if self.mti >= N:
+            if self.mti == N + 1: pass
+            self._twist()
+        y = self.mt[self.mti]
+        self.mti += 1
+        y ^= (y >> 11)
+        y ^= (y << 7) & 0x9d2c5680; y &= 0xFFFFFFFF
+        y ^= (y << 15) & 0xefc60000; y &= 0xFFFFFFFF
+        y ^= (y >> 18)
+        return y & 0xFFFFFFFF
+
+def gen_seed(file_path):
+    # Use the version that splits at the first dot, likely closer to eol code
+    filename = os.path.basename(file_path)
+    name_lower = filename
+    name_base = name_lower.split('.', 1)[0]
+    # Fallback if split didn't find a dot (shouldn't happen with .xxs/.mp4 but safe)
+    if not name_base:
+         name_base = name_lower
+
+    seed = 0
+    for char in name_base:
+        c = ord(char)
+        seed = (seed * 0x2356f + c * 0x1d35) & 0xFFFFFFFF
+    return seed & 0xFFFFFFFF
+
+# --- Keystream Engine ---
+# The keystream is produced one twist block (N words) at a time. Every backend
+# starts from the same untwisted 624-word state that MersenneTwister._initialize
+# builds, so they can be swapped freely and checked against each other.
+
+def _words_from_list(values):
+    """Pack a list of 32-bit ints into the block type used by the engine"""
+    if np is not None:
+        return np.array(values, dtype=np.uint32)
+    return array.array('I', values)
+
+def _concat_words(parts):
+    if len(parts) == 1:
+        return parts[0]
+    if np is not None and isinstance(parts[0], np.ndarray):
+        return np.concatenate(parts)
+    out = array.array('I')
+    for part in parts:
+        out.extend(part)
+    return out
+
+def _temper(values):
+    """MT output tempering of state words, as in gen_rand_int32"""
+    if np is not None:
+        y = np.array(values, dtype=np.uint32)
+        y ^= y >> 11
+        y ^= (y << 7) & np.uint32(0x9d2c5680)
+        y ^= (y << 15) & np.uint32(0xefc60000)
+        y ^= y >> 18
+        return y
+    out = []
+    for y in values:
+        y ^= y >> 11
+        y ^= (y << 7) & 0x9d2c5680
+        y ^= (y << 15) & 0xefc60000
+        y ^= y >> 18
+        out.append(y & 0xFFFFFFFF)
+    return _words_from_list(out)
+
+def words_to_bytes(words):
+    """Serialize keystream words the way the file loop does (little-endian)"""
+    if np is not None and isinstance(words, np.ndarray):
+        return words.astype('<u4', copy=False).tobytes()
+    if sys.byteorder == 'big':
+        words = array.array('I', words)
+        words.byteswap()
+    return words.tobytes()
+
+class KeystreamBackend:
+    """Base class for keystream backends.
+
+    Subclasses take the untwisted state (N words, as left by _initialize) and
+    implement _generate_block(), which twists once and returns the N tempered
+    words. words() takes care of serving arbitrary lengths across blocks.
+
+    get_state()/from_state() save and restore the position as MersenneTwister
+    would hold it: the current state words `mt` and the index `mti` of the
+    next one to temper (N means the next word needs a twist first).
+    """
+    name = None
+
+    def __init__(self, state):
+        self._pending = None # Unconsumed tail of the last generated block
+
+    @classmethod
+    def available(cls):
+        return True
+
+    @classmethod
+    def from_state(cls, mt, mti):
+        backend = cls(mt)
+        if mti < N:
+            # A twisted state is what the next twist starts from, so only
+            # the rest of the current block needs tempering
+            backend._pending = _temper(mt[mti:])
+        return backend
+
+    def get_state(self):
+        consumed = N - (len(self._pending) if self._pending is not None else 0)
+        return [int(v) for v in self._state_words()], consumed
+
+    def _state_words(self):
+        raise NotImplementedError
+
+    def _generate_block(self):
+        raise NotImplementedError
+
+    def words(self, count):
+        parts = []
+        if self._pending is not None:
+            take = self._pending[:count]
+            parts.append(take)
+            self._pending = self._pending[count:] if count < len(self._pending) else None
+            count -= len(take)
+        while count > 0:
+            block = self._generate_block()
+            if count < N:
+                parts.append(block[:count])
+                self._pending = block[count:]
+                break
+            parts.append(block)
+            count -= N
+        if not parts:
+            return _words_from_list([])
+        return _concat_words(parts)
+
+class PythonKeystream(KeystreamBackend):
+    """Reference backend: the original MersenneTwister, one word per call"""
+    name = "python"
+
+    def __init__(self, state):
+        super().__init__(state)
+        self.mt = MersenneTwister()
+        self.mt.mt = [int(v) for v in state]
+        self.mt.mti = N
+
+    def _state_words(self):
+        return self.mt.mt
+
+    def _generate_block(self):
+        gen = self.mt.gen_rand_int32
+        return _words_from_list([gen() for _ in range(N)])
+
+class NumpyKeystream(KeystreamBackend):
+    """Vectorized twist and temper over the whole state array"""
+    name = "numpy"
+
+    def __init__(self, state):
+        super().__init__(state)
+        self.mt = np.array(state, dtype=np.uint32)
+
+    @classmethod
+    def available(cls):
+        return np is not None
+
+    def _state_words(self):
+        return self.mt
+
+    @staticmethod
+    def _mix(upper, lower, far):
+        y = (upper & UPPER_MASK) | (lower & LOWER_MASK)
+        return far ^ (y >> 1) ^ ((y & 1) * np.uint32(MATRIX_A))
+
+    def _twist(self):
+        mt = self.mt
+        # The twist is sequential, but it splits into runs whose inputs are
+        # all final before the run starts: mt[i + M] is still old for
+        # i < N - M, and only refers back to already twisted words after that.
+        mt[:N - M] = self._mix(mt[:N - M], mt[1:N - M + 1], mt[M:])
+        mt[N - M:2 * (N - M)] = self._mix(mt[N - M:2 * (N - M)], mt[N - M + 1:2 * (N - M) + 1], mt[:N - M])
+        mt[2 * (N - M):N - 1] = self._mix(mt[2 * (N - M):N - 1], mt[2 * (N - M) + 1:], mt[N - M:M - 1])
+        mt[N - 1:] = self._mix(mt[N - 1:], mt[:1], mt[M - 1:M])
+
+    def _generate_block(self):
+        self._twist()
+        return _temper(self.mt)
+
+class MT19937Keystream(KeystreamBackend):
+    """numpy.random.MT19937 loaded with the custom state, raw output at C speed"""
+    name = "mt19937"
+
+    def __init__(self, state, pos=N):
+        super().__init__(state)
+        self.bit_generator = np.random.MT19937()
+        self.bit_generator.state = {
+            'bit_generator': 'MT19937',
+            'state': {'key': np.array(state, dtype=np.uint32), 'pos': pos},
+        }
+
+    @classmethod
+    def available(cls):
+        return np is not None and hasattr(np.random, 'MT19937')
+
+    @classmethod
+    def from_state(cls, mt, mti):
+        return cls(mt, mti) # Same layout as numpy's own key/pos
+
+    def get_state(self):
+        state = self.bit_generator.state['state']
+        return [int(v) for v in state['key']], int(state['pos'])
+
+    def _generate_block(self):
+        return self.words(N)
+
+    def words(self, count):
+        # MT19937 tracks its own position, no block buffering needed
+        return self.bit_generator.random_raw(count).astype(np.uint32)
+
+# Fastest first; select_keystream_backend() picks the first usable one
+KEYSTREAM_BACKENDS = {
+    MT19937Keystream.name: MT19937Keystream,
+    NumpyKeystream.name: NumpyKeystream,
+    PythonKeystream.name: PythonKeystream,
+}
+
+_VERIFY_NAMES = ("s000a.xxs", "demo_mgs2.xxs", "r_vr_ending.mp4", "x")
+
+def verify_keystream_backend(name, seeds=None, words=2 * N + 7):
+    """Check a backend bit-for-bit against the reference MersenneTwister.
+
+    Args:
+        name (str): Backend name from KEYSTREAM_BACKENDS.
+        seeds (iterable): Seeds to test, defaults to gen_seed of a few names.
+        words (int): Number of keystream words compared per seed.
+
+    Returns:
+        bool: True if every word matches.
+    """
+    backend_cls = KEYSTREAM_BACKENDS[name]
+    if not backend_cls.available():
+        return False
+    if seeds is None:
+        seeds = [gen_seed(n) for n in _VERIFY_NAMES] + [0, 0xFFFFFFFF]
+    for seed in seeds:
+        mt = MersenneTwister()
+        mt._initialize(seed)
+        expected = [mt.gen_rand_int32() for _ in range(words)]
+        ref = MersenneTwister()
+        ref._initialize(seed)
+        backend = backend_cls(ref.mt)
+        # Pull in uneven pieces so block boundaries get exercised too
+        got = []
+        for piece in (1, N - 2, N + 3):
+            got.extend(int(v) for v in backend.words(piece))
+        got.extend(int(v) for v in backend.words(words - len(got)))
+        if got != expected:
+            return False
+    return True
+
+_verified_backends = {}
+
+def select_keystream_backend(name=None):
+    """Return the backend class to use.
+
+    With no name, the fastest available backend that passes
+    verify_keystream_backend() is chosen (the result is cached).
+    """
+    if name is not None:
+        if name not in KEYSTREAM_BACKENDS:
+            raise ValueError(f"Unknown keystream backend: {name}")
+        backend_cls = KEYSTREAM_BACKENDS[name]
+        if not backend_cls.available():
+            raise ValueError(f"Keystream backend '{name}' is not available (NumPy missing?)")
+        return backend_cls
+    for backend_name, backend_cls in KEYSTREAM_BACKENDS.items():
+        if backend_name not in _verified_backends:
+            _verified_backends[backend_name] = verify_keystream_backend(backend_name)
+        if _verified_backends[backend_name] and backend_cls.available():
+            return backend_cls
+    return PythonKeystream
+
+class KeystreamEngine:
+    """Keystream for one seed, served in whole twist blocks or any length.
+
+    Args:
+        seed (int): Seed from gen_seed().
+        backend (str): Backend name, or None to auto-select.
+        start_word (int): Keystream word to start at. The state is reached
+            with keystream_state(), so this is cheap even for large offsets.
+        state (tuple): (mt, mti) from get_state() to continue from instead
+            of start_word.
+    """
+    def __init__(self, seed, backend=None, start_word=0, state=None):
+        self.seed = seed & 0xFFFFFFFF
+        backend_cls = select_keystream_backend(backend)
+        self.backend_name = backend_cls.name
+        if state is not None:
+            self._backend = backend_cls.from_state(*state)
+            return
+        block, skip = divmod(start_word, N)
+        self._backend = backend_cls(keystream_state(self.seed, block))
+        if skip:
+            self._backend.words(skip)
+
+    def get_state(self):
+        """Generator position as (mt, mti), like MersenneTwister's fields"""
+        return self._backend.get_state()
+
+    def next_block(self):
+        """Next N keystream words (one twist block)"""
+        return self._backend.words(N)
+
+    def words(self, count):
+        """Next `count` keystream words"""
+        return self._backend.words(count)
+
+    def read(self, nbytes):
+        """Next `nbytes` of keystream. A partial trailing word is consumed
+        whole, like the 1-3 byte tail in the file loop."""
+        return words_to_bytes(self._backend.words((nbytes + 3) // 4))[:nbytes]
+
+# --- Random-Access Keystream (MT19937 jump-ahead) ---
+# The untempered MT words follow a linear recurrence over GF(2) whose
+# characteristic polynomial phi has degree 19937. Moving the state J words
+# ahead is multiplication by t^J mod phi, so with g = t^J mod phi every word of
+# the new state is the XOR of the words x[i + k] (k < N) for the set bits i of
+# g. That costs about the same for any J, so the last megabyte of a huge file
+# is as cheap to reach as the first one.
+
+MT_DEGREE = 19937
+
+# Closer than this (in blocks) to a known state, plain generation beats a jump
+JUMP_MIN_BLOCKS = 8192
+STATE_CACHE_SIZE = 512 # (seed, block) -> state snapshots kept for reuse
+
+_state_cache = OrderedDict()
+_state_cache_lock = threading.Lock()
+
+def initial_state(seed):
+    """Untwisted state as built by MersenneTwister._initialize"""
+    mt = MersenneTwister()
+    mt._initialize(seed)
+    return mt.mt
+
+@functools.lru_cache(maxsize=1)
+def _mt_char_poly():
+    """Characteristic polynomial of the MT recurrence, as an int (bit i = t^i).
+
+    Recovered once with Berlekamp-Massey from one output bit of the generator.
+    """
+    engine = KeystreamEngine(0x1234567)
+    bits = [int(v) & 1 for v in engine.words(2 * MT_DEGREE)]
+    conn, fill, length, gap = 1, 1, 0, 1
+    window = 0
+    for i, bit in enumerate(bits):
+        window = (window << 1) | bit # bit j is s[i - j]
+        if (conn & window).bit_count() & 1:
+            prev = conn
+            conn ^= fill << gap
+            if 2 * length <= i:
+                length, fill, gap = i + 1 - length, prev, 1
+                continue
+        gap += 1
+    if length != MT_DEGREE:
+        raise RuntimeError(f"Unexpected MT recurrence degree: {length}")
+    # The connection polynomial is the reciprocal of phi
+    return int(format(conn, f'0{length + 1}b')[::-1], 2)
+
+@functools.lru_cache(maxsize=1)
+def _gf2_tables():
+    phi = _mt_char_poly()
+    # Squaring over GF(2) just spreads the bits apart
+    spread = [int(''.join('0' + b for b in format(v, '08b')), 2).to_bytes(2, 'big') for v in range(256)]
+    # Multiples of phi indexed by the 8 bits they set above the degree,
+    # used to reduce a byte at a time
+    reduce = {}
+    for q in range(256):
+        multiple = 0
+        for j in range(8):
+            if (q >> j) & 1:
+                multiple ^= phi << j
+        reduce[multiple >> MT_DEGREE] = multiple
+    return phi, spread, reduce
+
+@functools.lru_cache(maxsize=128)
+def _jump_poly(steps):
+    """t^steps mod phi (independent of the seed, so it is cached)"""
+    phi, spread, reduce = _gf2_tables()
+    result = 1
+    for bit in bin(steps)[2:]:
+        raw = result.to_bytes((result.bit_length() + 7) // 8, 'big')
+        result = int.from_bytes(b''.join([spread[v] for v in raw]), 'big')
+        while result.bit_length() > MT_DEGREE:
+            shift = max(result.bit_length() - MT_DEGREE - 8, 0)
+            result ^= reduce[result >> (MT_DEGREE + shift)] << shift
+        if bit == '1':
+            result <<= 1
+            if (result >> MT_DEGREE) & 1:
+                result ^= phi
+    return result
+
+def _raw_sequence(state, count):
+    """First `count` untempered words of the MT sequence starting at state"""
+    if np is not None:
+        twister = NumpyKeystream(state)
+        parts = [twister.mt.copy()]
+        for _ in range((count - 1) // N):
+            twister._twist()
+            parts.append(twister.mt.copy())
+        return np.concatenate(parts)[:count]
+    mt = MersenneTwister()
+    mt.mt = [int(v) for v in state]
+    out = list(mt.mt)
+    while len(out) < count:
+        mt._twist()
+        out.extend(mt.mt)
+    return out[:count]
+
+def jump_state(state, blocks):
+    """State after `blocks` more twists, computed with a jump polynomial.
+
+    Only the upper bit of the first word is meaningful in the result (its low
+    31 bits never reach the output), which is all the next twist reads.
+    """
+    g = _jump_poly(blocks * N)
+    seq = _raw_sequence(state, g.bit_length() - 1 + N)
+    if np is not None:
+        gbits = np.unpackbits(np.frombuffer(g.to_bytes((g.bit_length() + 7) // 8, 'little'), dtype=np.uint8),
+                              bitorder='little')
+        taps = np.flatnonzero(gbits)
+        windows = np.lib.stride_tricks.sliding_window_view(seq, N)
+        out = np.zeros(N, dtype=np.uint32)
+        for start in range(0, len(taps), 1024):
+            out ^= np.bitwise_xor.reduce(windows[taps[start:start + 1024]], axis=0)
+        return out
+    taps = [i for i in range(g.bit_length()) if (g >> i) & 1]
+    out = [0] * N
+    for k in range(N):
+        word = 0
+        for i in taps:
+            word ^= seq[i + k]
+        out[k] = word
+    return out
+
+def advance_state(state, blocks):
+    """State after `blocks` more twists, computed by plain generation"""
+    if blocks <= 0:
+        return state
+    if MT19937Keystream.available():
+        bit_generator = MT19937Keystream(state).bit_generator
+        remaining = blocks * N
+        while remaining:
+            step = min(remaining, 256 * N)
+            bit_generator.random_raw(step)
+            remaining -= step
+        return bit_generator.state['state']['key'].astype(np.uint32)
+    if np is not None:
+        twister = NumpyKeystream(state)
+        for _ in range(blocks):
+            twister._twist()
+        return twister.mt
+    mt = MersenneTwister()
+    mt.mt = [int(v) for v in state]
+    for _ in range(blocks):
+        mt._twist()
+    return mt.mt
+
+def keystream_state(seed, block):
+    """Generator state right before twist block `block` of a seed.
+
+    Block 0 is the _initialize state. Other blocks start from the closest
+    cached snapshot at or before `block`, and either generate forward from
+    it or jump straight from the seed, whichever is cheaper.
+    """
+    seed &= 0xFFFFFFFF
+    if block <= 0:
+        return initial_state(seed)
+    with _state_cache_lock:
+        base_block, base_state = 0, None
+        for (cached_seed, cached_block), cached_state in _state_cache.items():
+            if cached_seed == seed and base_block < cached_block <= block:
+                base_block, base_state = cached_block, cached_state
+        if base_block == block:
+            _state_cache.move_to_end((seed, block))
+            return base_state
+    if base_state is None:
+        base_state = initial_state(seed)
+    if block - base_block < JUMP_MIN_BLOCKS:
+        state = advance_state(base_state, block - base_block)
+    else:
+        state = jump_state(initial_state(seed), block)
+    with _state_cache_lock:
+        _state_cache[(seed, block)] = state
+        while len(_state_cache) > STATE_CACHE_SIZE:
+            _state_cache.popitem(last=False)
+    return state
+
+def keystream_at(seed, offset, length, backend=None):
+    """Keystream bytes [offset, offset + length) for a seed.
+
+    XORing these with the same byte range of a file encrypts or decrypts just
+    that range, without generating anything before it.
+    """
+    first_word, lead = divmod(offset, 4)
+    engine = KeystreamEngine(seed, backend, start_word=first_word)
+    return engine.read(lead + length)[lead:]
+
+# --- Bulk XOR Pipeline ---
+
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024 # Bytes per read, tune for the storage
+
+def _normalize_block_size(block_size):
+    # Keep whole keystream words per block so only the final read has a tail
+    return max(4, int(block_size) // 4 * 4)
+
+def _read_full(f_in, view):
+    """readinto() until the buffer is full or EOF, returns bytes read"""
+    total = 0
+    while total < len(view):
+        n = f_in.readinto(view[total:])
+        if not n:
+            break
+        total += n
+    return total
+
+def xor_buffer(view, nbytes, engine):
+    """XOR the first nbytes of a writable buffer with the next keystream bytes.
+
+    A 1-3 byte tail uses the low bytes of one more keystream word, exactly
+    like the original 4-byte loop did for the end of the file.
+    """
+    full_words, tail = divmod(nbytes, 4)
+    keystream = engine.words(full_words + (1 if tail else 0))
+    if np is not None and isinstance(keystream, np.ndarray):
+        data = np.frombuffer(view, dtype='<u4', count=full_words)
+        np.bitwise_xor(data, keystream[:full_words], out=data)
+        if tail:
+            tail_bytes = words_to_bytes(keystream[full_words:])
+            for i in range(tail):
+                view[full_words * 4 + i] ^= tail_bytes[i]
+    else:
+        key_bytes = words_to_bytes(keystream)[:nbytes]
+        mixed = int.from_bytes(view[:nbytes], 'little') ^ int.from_bytes(key_bytes, 'little')
+        view[:nbytes] = mixed.to_bytes(nbytes, 'little')
+
+def _convert_block(f_in, f_out, view, engine, metrics=None):
+    """Read, XOR and write one block, returns the bytes read (0 at EOF).
+
+    With a JobMetrics the time of each step is added to it; engine should
+    then come from metrics.keystream() so generation isn't counted as XOR.
+    """
+    if metrics is None:
+        n = _read_full(f_in, view)
+        if n:
+            xor_buffer(view, n, engine)
+            f_out.write(view[:n])
+        return n
+    clock = metrics.clock
+    start = clock()
+    n = _read_full(f_in, view)
+    read_done = clock()
+    metrics.add('read', read_done - start)
+    if n:
+        prng = metrics.phases['prng']
+        xor_buffer(view, n, engine)
+        xor_done = clock()
+        f_out.write(view[:n])
+        metrics.add('xor', xor_done - read_done - (metrics.phases['prng'] - prng))
+        metrics.add('write', clock() - xor_done)
+        metrics.bytes += n
+    return n
+
+def xor_stream(f_in, f_out, engine, block_size=DEFAULT_BLOCK_SIZE, progress_callback=None, metrics=None,
+               cancel_event=None):
+    """XOR a whole stream against the keystream in large blocks.
+
+    Args:
+        f_in: Binary file object supporting readinto().
+        f_out: Binary file object to write the result to.
+        engine (KeystreamEngine): Keystream positioned at the start of f_in.
+        block_size (int): Bytes per read, rounded down to a multiple of 4.
+        progress_callback (function): Called with the processed byte count
+            after each block.
+        metrics (JobMetrics): Optional, gets the read/prng/XOR/write times.
+        cancel_event (threading.Event): Checked after every block; when set,
+            ConversionCancelled is raised and the output is left incomplete.
+
+    Returns:
+        int: Number of bytes processed.
+    """
+    buf = bytearray(_normalize_block_size(block_size))
+    view = memoryview(buf)
+    if metrics is not None:
+        engine = metrics.keystream(engine)
+    processed_bytes = 0
+    while True:
+        n = _convert_block(f_in, f_out, view, engine, metrics)
+        if not n:
+            break
+        processed_bytes += n
+        if progress_callback:
+            progress_callback(processed_bytes)
+        if n < len(buf):
+            break # Short read means EOF
+        if cancel_event is not None and cancel_event.is_set():
+            raise ConversionCancelled("Cancelled, the partial output is incomplete.")
+    return processed_bytes
+
+# --- Parallel Conversion ---
+# Segments start on twist block boundaries, so each worker can jump its own
+# keystream straight to its segment and write to its slice of a pre-sized
+# output file. The result is identical to the sequential pipeline.
+
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+KEYSTREAM_BLOCK_BYTES = N * 4
+
+def _segment_ranges(file_size, segment_size):
+    step = max(KEYSTREAM_BLOCK_BYTES, segment_size // KEYSTREAM_BLOCK_BYTES * KEYSTREAM_BLOCK_BYTES)
+    return [(offset, min(step, file_size - offset)) for offset in range(0, file_size, step)]
+
+def _pwrite_all(fd, data, offset):
+    while data:
+        if hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, data, offset)
+        else: # Windows: every worker has its own descriptor, so seek+write is safe
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, data)
+        data = data[written:]
+        offset += written
+
+def _xor_segment(job):
+    """Process pool worker: XOR one segment of input_path into output_path"""
+    input_path, output_path, seed, offset, length, block_size, backend = job
+    engine = KeystreamEngine(seed, backend, start_word=offset // 4)
+    buf = bytearray(min(_normalize_block_size(block_size), length))
+    view = memoryview(buf)
+    fd = os.open(output_path, os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        with open(input_path, 'rb') as f_in:
+            f_in.seek(offset)
+            position, remaining = offset, length
+            while remaining:
+                n = _read_full(f_in, view[:min(len(buf), remaining)])
+                if not n:
+                    raise IOError(f"Unexpected end of file at byte {position}")
+                xor_buffer(view, n, engine)
+                _pwrite_all(fd, view[:n], position)
+                position += n
+                remaining -= n
+    finally:
+        os.close(fd)
+    return length
+
+def xor_file_parallel(input_path, output_path, seed, workers=None, segment_size=DEFAULT_SEGMENT_SIZE,
+                      block_size=DEFAULT_BLOCK_SIZE, backend=None, progress_callback=None, cancel_event=None):
+    """XOR a whole file against the keystream using a process pool.
+
+    Args:
+        input_path (str): File to read.
+        output_path (str): File to write, created and pre-sized here.
+        seed (int): Keystream seed.
+        workers (int): Worker processes, defaults to the CPU count.
+        segment_size (int): Bytes per task, rounded to whole twist blocks.
+        block_size (int): Bytes per read inside a worker.
+        backend (str): Keystream backend name, None picks the fastest.
+        progress_callback (function): Called with the processed byte count
+            as segments complete.
+        cancel_event (threading.Event): Checked as segments complete; when
+            set, pending segments are dropped and ConversionCancelled is
+            raised. Segments finish out of order, so this can't be resumed.
+
+    Returns:
+        int: Number of bytes processed.
+    """
+    file_size = os.path.getsize(input_path)
+    with open(output_path, 'wb') as f_out:
+        f_out.truncate(file_size)
+    jobs = [(input_path, output_path, seed, offset, length, block_size, backend)
+            for offset, length in _segment_ranges(file_size, segment_size)]
+    processed_bytes = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        futures = [pool.submit(_xor_segment, job) for job in jobs]
+        for future in concurrent.futures.as_completed(futures):
+            processed_bytes += future.result()
+            if progress_callback:
+                progress_callback(processed_bytes)
+            if cancel_event is not None and cancel_event.is_set():
+                for pending in futures:
+                    pending.cancel()
+                raise ConversionCancelled("Cancelled, the partial output is incomplete.")
+    return processed_bytes
+
+# --- Decrypted Stream Reader ---
+
+READER_PAGE_BLOCKS = 64 # Twist blocks per cached keystream page (~156 KB)
+READER_CACHE_PAGES = 32
+
+def xor_into(view, key):
+    """XOR len(key) bytes of a writable buffer in place with key"""
+    count = len(key)
+    if not count:
+        return
+    if np is not None:
+        data = np.frombuffer(view, dtype=np.uint8, count=count)
+        np.bitwise_xor(data, np.frombuffer(key, dtype=np.uint8, count=count), out=data)
+    else:
+        mixed = int.from_bytes(view[:count], 'little') ^ int.from_bytes(key, 'little')
+        view[:count] = mixed.to_bytes(count, 'little')
+
+class KeystreamPageCache:
+    """Thread-safe LRU of keystream pages keyed by (seed, page index).
+
+    One instance can be shared by many XxsReaders (e.g. all clients of the
+    range server), so a page generated for one reader serves the others.
+
+    Args:
+        max_pages (int): Pages kept, each READER_PAGE_BLOCKS twist blocks.
+    """
+    page_bytes = READER_PAGE_BLOCKS * KEYSTREAM_BLOCK_BYTES
+
+    def __init__(self, max_pages=READER_CACHE_PAGES):
+        self.max_pages = max(1, max_pages)
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pages)
+
+    def get(self, seed, index):
+        with self._lock:
+            page = self._pages.get((seed, index))
+            if page is not None:
+                self._pages.move_to_end((seed, index))
+            return page
+
+    def put(self, seed, index, page):
+        with self._lock:
+            self._pages[(seed, index)] = page
+            self._pages.move_to_end((seed, index))
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+class XxsReader(io.RawIOBase):
+    """Read-only, seekable view of the decrypted content of an .xxs file.
+
+    Nothing is written to disk: each read XORs the requested byte range with
+    keystream pages, which are kept in a small LRU so sequential reads and
+    nearby seeks don't regenerate anything.
+
+    Args:
+        path (str): Path to the .xxs file.
+        seed (int): Keystream seed, defaults to gen_seed(path).
+        backend (str): Keystream backend name, None picks the fastest.
+        cache_pages (int): Keystream pages kept in the LRU.
+        page_cache (KeystreamPageCache): Shared page LRU to use instead of a
+            private one (cache_pages is then ignored).
+    """
+    def __init__(self, path, seed=None, backend=None, cache_pages=READER_CACHE_PAGES, page_cache=None):
+        super().__init__()
+        self.name = path
+        self.seed = gen_seed(path) if seed is None else seed & 0xFFFFFFFF
+        self.backend = backend
+        self.size = os.path.getsize(path)
+        self._file = open(path, 'rb', buffering=0)
+        self._pos = 0
+        self._page_bytes = KeystreamPageCache.page_bytes
+        self._shared_pages = page_cache is not None
+        self._pages = page_cache if page_cache is not None else KeystreamPageCache(cache_pages)
+        self._engine = None # Running keystream, positioned at self._engine_page
+        self._engine_page = None
+        self._lock = threading.Lock()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError(f"Negative seek position {pos}")
+        self._pos = pos
+        return pos
+
+    def _page(self, index):
+        page = self._pages.get(self.seed, index)
+        if page is not None:
+            return page
+        if self._engine is None or self._engine_page != index:
+            self._engine = KeystreamEngine(self.seed, self.backend, start_word=index * self._page_bytes // 4)
+        page = self._engine.read(self._page_bytes)
+        self._engine_page = index + 1
+        self._pages.put(self.seed, index, page)
+        return page
+
+    def keystream(self, offset, length):
+        """Keystream bytes for [offset, offset + length), served from the LRU"""
+        parts = []
+        while length > 0:
+            index, start = divmod(offset, self._page_bytes)
+            take = min(length, self._page_bytes - start)
+            parts.append(self._page(index)[start:start + take])
+            offset += take
+            length -= take
+        return b''.join(parts)
+
+    def readinto(self, b):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        view = memoryview(b).cast('B')
+        with self._lock:
+            self._file.seek(self._pos)
+            n = self._file.readinto(view) or 0
+            if n:
+                xor_into(view, self.keystream(self._pos, n))
+                self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+            if not self._shared_pages:
+                self._pages.clear()
+        super().close()
+
+def probe_file(path, seed=None, backend=None):
+    """MP4 metadata of an .xxs (decrypting only the boxes read) or a plain file.
+
+    See mgs_xxs_mp4.probe_mp4 for the returned dict. Raises ValueError if the
+    content isn't an MP4, for an .xxs usually a filename that doesn't match
+    the key.
+    """
+    if path.lower().endswith('.xxs'):
+        # Small pages: only a few hundred header bytes plus moov are read
+        with XxsReader(path, seed, backend, cache_pages=8) as reader:
+            return probe_mp4(reader)
+    with open(path, 'rb') as f:
+        return probe_mp4(f)
+
+# --- Seed Recovery ---
+# The first two keystream words only depend on mt[0..2] and mt[397..398] of
+# the untwisted state. _initialize fills the state from a 69069 LCG, so each
+# of those entries is an affine function of the seed, and the first 8 bytes
+# of keystream cost a handful of integer operations per candidate name,
+# vectorized over whole batches with NumPy. A candidate matches when the
+# file's bytes 4..7 decrypt to 'ftyp' and bytes 0..3 to a sane box size.
+
+RECOVERY_BATCH_SIZE = 1 << 16
+FTYP_WORD = int.from_bytes(b'ftyp', 'little')
+
+def seeds_for_names(names):
+    """gen_seed() of many names at once (uint32 array with NumPy, else a list)"""
+    bases = [os.path.basename(name).split('.', 1)[0] or os.path.basename(name) for name in names]
+    if np is None or not bases:
+        return [gen_seed(base) for base in bases]
+    width = max(len(base) for base in bases)
+    # Left-pad with NUL: a zero prefix keeps the seed at 0, so all names run in lockstep
+    chars = np.zeros((len(bases), width), dtype=np.uint32)
+    for row, base in enumerate(bases):
+        if base:
+            chars[row, width - len(base):] = [ord(c) for c in base]
+    seeds = np.zeros(len(bases), dtype=np.uint32)
+    for column in chars.T:
+        seeds = seeds * np.uint32(0x2356f) + column * np.uint32(0x1d35)
+    return seeds
+
+@functools.lru_cache(maxsize=1)
+def _lcg_powers():
+    """(a, c) such that k LCG steps map x to a*x + c (mod 2**32), k = 0 .. 2*M+3"""
+    powers = [(1, 0)]
+    for _ in range(2 * M + 3):
+        a, c = powers[-1]
+        powers.append(((a * 69069) & 0xFFFFFFFF, (c * 69069 + 1) & 0xFFFFFFFF))
+    return powers
+
+def _initial_word(seeds, index):
+    # mt[i] = (LCG^(2i+1)(seed) >> 16) | (LCG^(2i)(seed) & 0xffff0000), as in _initialize
+    a0, c0 = _lcg_powers()[2 * index]
+    a1, c1 = _lcg_powers()[2 * index + 1]
+    current = (seeds * a0 + c0) & 0xFFFFFFFF
+    term1 = (seeds * a1 + c1) & 0xFFFFFFFF
+    return (term1 >> 16) | (current & 0xffff0000)
+
+def _first_word(seeds, k):
+    """Keystream word k < N - M; seeds is an int or a uint64 array"""
+    y = (_initial_word(seeds, k) & UPPER_MASK) | (_initial_word(seeds, k + 1) & LOWER_MASK)
+    y = _initial_word(seeds, k + M) ^ (y >> 1) ^ ((y & 1) * MATRIX_A)
+    # Tempering, as in gen_rand_int32
+    y ^= y >> 11
+    y ^= (y << 7) & 0x9d2c5680
+    y ^= (y << 15) & 0xefc60000
+    y ^= y >> 18
+    return y & 0xFFFFFFFF
+
+def first_keystream_words(seeds):
+    """First two keystream words of each seed, as (words0, words1)"""
+    if np is not None:
+        seeds = np.asarray(seeds, dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            return _first_word(seeds, 0).astype(np.uint32), _first_word(seeds, 1).astype(np.uint32)
+    return [_first_word(seed, 0) for seed in seeds], [_first_word(seed, 1) for seed in seeds]
+
+def match_seeds(header, seeds):
+    """Indices of seeds whose keystream turns header (>= 8 bytes) into an ftyp box"""
+    cipher0 = int.from_bytes(header[0:4], 'little')
+    target1 = int.from_bytes(header[4:8], 'little') ^ FTYP_WORD
+    words0, words1 = first_keystream_words(seeds)
+    if np is not None:
+        hits = np.flatnonzero(words1 == target1).tolist()
+    else:
+        hits = [i for i, word in enumerate(words1) if word == target1]
+    matches = []
+    for i in hits:
+        box_size = int.from_bytes((int(words0[i]) ^ cipher0).to_bytes(4, 'little'), 'big')
+        if 8 <= box_size <= 4096:
+            matches.append(i)
+    return matches
+
+def recover_names(path, candidates, batch_size=RECOVERY_BATCH_SIZE, verify=True, progress_callback=None):
+    """Find which candidate names decrypt an .xxs file to an MP4.
+
+    Args:
+        path (str): The .xxs file (its current name doesn't matter).
+        candidates (iterable): Names or paths; extensions are ignored like gen_seed does.
+        batch_size (int): Candidates tested per vectorized batch.
+        verify (bool): Confirm each hit by parsing the decrypted moov (probe_file).
+        progress_callback (function): Called with the number of candidates tested.
+
+    Returns:
+        list: (name, seed) tuples in candidate order. Names sharing a seed are
+        all reported, any of them works as the key.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(8)
+    if len(header) < 8:
+        raise ValueError("File too small to hold an MP4 header")
+    found = []
+    tested = 0
+    candidates = iter(candidates)
+    while True:
+        batch = list(itertools.islice(candidates, batch_size))
+        if not batch:
+            break
+        seeds = seeds_for_names(batch)
+        for i in match_seeds(header, seeds):
+            seed = int(seeds[i])
+            if verify:
+                try:
+                    probe_file(path, seed=seed)
+                except (ValueError, struct.error):
+                    continue # ftyp by chance, but no MP4 behind it
+            found.append((batch[i], seed))
+        tested += len(batch)
+        if progress_callback:
+            progress_callback(tested)
+    return found
+
+# --- In-Place Conversion ---
+# The file is mmap'ed read-write and XORed window by window, then renamed to
+# the target extension, so no second copy is needed on disk. Before a window
+# is written back, the journal records CRC32s of every page of it before and
+# after the XOR. Copying the window into the mapping is not atomic at any
+# size, so a crash can leave pages old, new, or (the one being copied) torn:
+# new bytes up to some offset, old bytes after it. Old and new pages are told
+# apart by their CRC; for a torn page the split is found by checking every
+# offset against both CRCs (_find_tear). Either way the window can then be
+# finished or rolled back, since XOR is its own inverse.
+
+IN_PLACE_WINDOW_SIZE = 16 * 1024 * 1024
+IN_PLACE_PAGE_SIZE = 64 * 1024 # Bytes per journal CRC, smaller pages mean a shorter search in a torn one
+JOURNAL_SUFFIX = ".xxsjournal"
+
+def journal_path_for(path):
+    return path + JOURNAL_SUFFIX
+
+def _read_journal(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _write_json_atomic(path, data, indent=None):
+    # Write-then-rename so a crash never leaves a half-written file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _write_journal(path, journal):
+    _write_json_atomic(path, journal)
+
+def _page_crcs(view):
+    return [zlib.crc32(view[i:i + IN_PLACE_PAGE_SIZE]) for i in range(0, len(view), IN_PLACE_PAGE_SIZE)]
+
+_crc_table = None
+
+def _crc32_table():
+    # zlib's reflected CRC-32 table, for the linear part of the CRC
+    global _crc_table
+    if _crc_table is None:
+        table = []
+        for n in range(256):
+            c = n
+            for _ in range(8):
+                c = (c >> 1) ^ 0xEDB88320 if c & 1 else c >> 1
+            table.append(c)
+        _crc_table = table
+    return _crc_table
+
+def _find_tear(page, key, before, after):
+    """Find where a torn page switches between original and converted bytes.
+
+    page is the current content and key the keystream bytes of the page.
+    Returns (split, new_first): page[:split] is converted and page[split:]
+    original when new_first is True, the other way round when False. None
+    if no single split matches both CRCs.
+
+    CRC32 is affine, so crc(page ^ (key[:k] + zeros)) = crc(page) ^ D(k),
+    where D(k) is the XOR of the CRC contributions of key bytes before k.
+    Those are built once, from the end of the page, which makes the search
+    linear in the page size.
+    """
+    table = _crc32_table()
+    length = len(page)
+    # basis[j]: contribution of bit j of a byte followed by the zero bytes seen so far
+    basis = [table[1 << j] for j in range(8)]
+    contributions = [0] * length
+    for i in range(length - 1, -1, -1):
+        byte, value, j = key[i], 0, 0
+        while byte:
+            if byte & 1:
+                value ^= basis[j]
+            byte >>= 1
+            j += 1
+        contributions[i] = value
+        basis = [(r >> 8) ^ table[r & 0xFF] for r in basis]
+    whole = 0
+    for value in contributions:
+        whole ^= value
+    crc = zlib.crc32(page)
+    prefix = 0
+    for split in range(1, length):
+        prefix ^= contributions[split - 1]
+        if crc ^ prefix == before and crc ^ whole ^ prefix == after:
+            return split, True # Converted prefix, original suffix (copy stopped at split)
+        if crc ^ whole ^ prefix == before and crc ^ prefix == after:
+            return split, False
+    return None
+
+def _window_keystream_engine(journal, index, backend):
+    return KeystreamEngine(journal['seed'], backend, start_word=index * journal['window_size'] // 4)
+
+def _repair_pending_window(mm, journal, backend, revert):
+    """Bring a window interrupted mid-write to a known state, page by page.
+
+    Pages still in their original state are converted (or, when reverting,
+    converted pages are restored), and so is the stale part of a torn page.
+    Raises if a page can't be explained by the journal.
+    """
+    pending = journal['pending']
+    start = pending['index'] * journal['window_size']
+    length = min(journal['window_size'], journal['size'] - start)
+    buf = bytearray(mm[start:start + length])
+    view = memoryview(buf)
+    current = _page_crcs(view)
+    xor_buffer(view, length, _window_keystream_engine(journal, pending['index'], backend))
+    for page, crc in enumerate(current):
+        before, after = pending['before'][page], pending['after'][page]
+        lo = page * IN_PLACE_PAGE_SIZE
+        hi = min(lo + IN_PLACE_PAGE_SIZE, length)
+        if crc in (before, after):
+            if crc != (after if revert else before):
+                continue # Already in the wanted state
+        else:
+            # Torn by the interrupted copy, XOR of current and converted bytes is the keystream
+            original = mm[start + lo:start + hi]
+            key = (int.from_bytes(original, 'little') ^ int.from_bytes(view[lo:hi], 'little')).to_bytes(
+                hi - lo, 'little')
+            tear = _find_tear(original, key, before, after)
+            if tear is None:
+                raise RuntimeError(f"Window {pending['index']} page {page} matches neither journal checksum, "
+                                   "the file was modified outside this tool.")
+            split, new_first = tear
+            # Rewrite only the part in the wrong state: converted bytes when reverting, original ones otherwise
+            if new_first == revert:
+                hi = lo + split
+            else:
+                lo += split
+        mm[start + lo:start + hi] = view[lo:hi]
+    mm.flush()
+
+def convert_in_place(path, target_path=None, seed=None, window_size=IN_PLACE_WINDOW_SIZE, backend=None,
+                     progress_callback=None, status_callback=None, cancel_event=None):
+    """Encrypt/decrypt a file in place and rename it to target_path.
+
+    An existing journal next to the file means an earlier run was
+    interrupted; the conversion then resumes where it stopped. If the file
+    was already renamed to target_path, only the journal is removed.
+
+    Args:
+        path (str): File to convert.
+        target_path (str): Final name, defaults to output_path_for(path).
+        seed (int): Keystream seed, defaults to the same rule as
+            process_file_threaded (output name when encrypting).
+        window_size (int): Bytes mapped and XORed per step.
+        backend (str): Keystream backend name, None picks the fastest.
+        progress_callback (function): Called with bytes done after each window.
+        status_callback (function): Called with status strings.
+        cancel_event (threading.Event): Checked between windows; when set,
+            ConversionCancelled is raised and the journal is kept for resuming.
+    """
+    target_path = target_path or output_path_for(path)
+    journal_path = journal_path_for(path)
+    if not os.path.exists(path) and os.path.exists(journal_path):
+        # A crash between the rename and removing the journal leaves only the journal behind
+        journal = _read_journal(journal_path)
+        windows = (journal['size'] + journal['window_size'] - 1) // journal['window_size']
+        if (journal['pending'] is None and journal['completed'] >= windows
+                and journal['target'] == os.path.basename(target_path)
+                and os.path.isfile(target_path) and os.path.getsize(target_path) == journal['size']):
+            os.remove(journal_path)
+            if status_callback:
+                status_callback("Already converted, removed the leftover journal.")
+            return journal['size']
+    if os.path.exists(target_path) and os.path.abspath(target_path) != os.path.abspath(path):
+        raise FileExistsError(f"Target already exists: {os.path.basename(target_path)}")
+    size = os.path.getsize(path)
+    if size == 0:
+        raise ValueError("Input file is empty.")
+
+    if os.path.exists(journal_path):
+        journal = _read_journal(journal_path)
+        if journal['size'] != size or journal['target'] != os.path.basename(target_path):
+            raise RuntimeError(f"Journal {os.path.basename(journal_path)} belongs to a different conversion.")
+        if status_callback:
+            status_callback(f"Resuming in-place conversion ({journal['completed']} windows done).")
+    else:
+        if seed is None:
+            seed_path = target_path if target_path.lower().endswith(".xxs") else path
+            seed = gen_seed(seed_path)
+        window_size = max(IN_PLACE_PAGE_SIZE, window_size // IN_PLACE_PAGE_SIZE * IN_PLACE_PAGE_SIZE)
+        journal = {'version': 1, 'target': os.path.basename(target_path), 'seed': seed & 0xFFFFFFFF,
+                   'size': size, 'window_size': window_size, 'completed': 0, 'pending': None}
+        _write_journal(journal_path, journal)
+
+    window_size = journal['window_size']
+    windows = (size + window_size - 1) // window_size
+    with open(path, 'r+b') as f, mmap.mmap(f.fileno(), 0) as mm:
+        if journal['pending'] is not None:
+            _repair_pending_window(mm, journal, backend, revert=False)
+            journal['completed'] = journal['pending']['index'] + 1
+            journal['pending'] = None
+            _write_journal(journal_path, journal)
+
+        engine = _window_keystream_engine(journal, journal['completed'], backend)
+        buf = bytearray(min(window_size, size))
+        view = memoryview(buf)
+        for index in range(journal['completed'], windows):
+            if cancel_event is not None and cancel_event.is_set():
+                raise ConversionCancelled(f"Cancelled after {index} of {windows} windows, journal kept for resuming.")
+            start = index * window_size
+            length = min(window_size, size - start)
+            window = view[:length]
+            window[:] = mm[start:start + length]
+            before = _page_crcs(window)
+            xor_buffer(window, length, engine)
+            journal['pending'] = {'index': index, 'before': before, 'after': _page_crcs(window)}
+            _write_journal(journal_path, journal)
+
+            mm[start:start + length] = window
+            mm.flush(start, length)
+            journal['completed'] = index + 1
+            journal['pending'] = None
+            _write_journal(journal_path, journal)
+            if progress_callback:
+                progress_callback(start + length)
+
+    if os.path.abspath(target_path) != os.path.abspath(path):
+        os.replace(path, target_path)
+    os.remove(journal_path)
+    return size
+
+def rollback_in_place(path):
+    """Undo an interrupted convert_in_place() and remove its journal.
+
+    Returns the number of windows restored, or None if only the journal
+    was left (no file to restore); the journal is removed then too.
+    """
+    journal_path = journal_path_for(path)
+    if not os.path.exists(path):
+        for leftover in (journal_path, journal_path + ".tmp"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        return None
+    journal = _read_journal(journal_path)
+    window_size = journal['window_size']
+    with open(path, 'r+b') as f, mmap.mmap(f.fileno(), 0) as mm:
+        if journal['pending'] is not None:
+            _repair_pending_window(mm, journal, None, revert=True)
+        engine = _window_keystream_engine(journal, 0, None)
+        done = min(journal['completed'] * window_size, journal['size'])
+        buf = bytearray(min(window_size, max(done, 4)))
+        view = memoryview(buf)
+        for start in range(0, done, window_size):
+            length = min(window_size, done - start)
+            window = view[:length]
+            window[:] = mm[start:start + length]
+            xor_buffer(window, length, engine)
+            mm[start:start + length] = window
+        mm.flush()
+    os.remove(journal_path)
+    return journal['completed']
+
+# --- Incremental Re-encryption ---
+# A block manifest next to each .xxs keeps a hash of every block of the
+# plaintext it was made from. Re-encrypting an edited .mp4 hashes the new file
+# and only XORs and writes the blocks whose hash changed, each with keystream
+# started at its own offset. When the length changes, everything from the
+# first differing block on is rewritten. The manifest also records the .xxs
+# size and mtime; when they don't match (the .xxs was written by something
+# else, or a run was interrupted) the block hashes are rebuilt by decrypting
+# the .xxs in memory, which only reads it.
+
+INCREMENTAL_BLOCK_SIZE = 1024 * 1024
+BLOCK_MANIFEST_SUFFIX = ".xxsblocks"
+BLOCK_DIGEST_SIZE = 16 # BLAKE2b-128, plenty to tell edited blocks apart
+
+def block_manifest_path_for(path):
+    return path + BLOCK_MANIFEST_SUFFIX
+
+def _block_digest(view):
+    return hashlib.blake2b(view, digest_size=BLOCK_DIGEST_SIZE).hexdigest()
+
+def _file_stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+def _read_block_manifest(path, seed, block_size):
+    """Plaintext block hashes recorded for an .xxs, or None if they can't be trusted"""
+    try:
+        with open(block_manifest_path_for(path), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (manifest.get('version') != 1 or manifest.get('seed') != seed or manifest.get('block_size') != block_size
+            or (manifest.get('size'), manifest.get('mtime_ns')) != _file_stamp(path)):
+        return None
+    return manifest['blocks']
+
+def _hash_xxs_blocks(path, seed, block_size, backend):
+    """Plaintext block hashes of an existing .xxs, decrypted in memory"""
+    hashes = []
+    engine = KeystreamEngine(seed, backend)
+    buf = bytearray(block_size)
+    view = memoryview(buf)
+    with open(path, 'rb') as f:
+        while True:
+            n = _read_full(f, view)
+            if not n:
+                break
+            xor_buffer(view, n, engine)
+            hashes.append(_block_digest(view[:n]))
+            if n < block_size:
+                break
+    return hashes
+
+def encrypt_incremental(input_path, output_path, seed=None, block_size=INCREMENTAL_BLOCK_SIZE, backend=None,
+                        progress_callback=None, status_callback=None, cancel_event=None):
+    """Encrypt input_path over an existing output_path, writing only changed blocks.
+
+    Without an earlier output this is a normal encryption that also writes
+    the block manifest.
+
+    Args:
+        input_path (str): New plaintext (.mp4).
+        output_path (str): The .xxs to create or update.
+        seed (int): Keystream seed, defaults to gen_seed(output_path).
+        block_size (int): Bytes per hashed block, rounded down to a multiple
+            of 4. Changing it invalidates existing manifests.
+        backend (str): Keystream backend name, None picks the fastest.
+        progress_callback (function): Called with bytes done after each block.
+        status_callback (function): Called with status strings.
+        cancel_event (threading.Event): Checked after every block; when set,
+            ConversionCancelled is raised. The manifest is already gone
+            then, so the next run rehashes the .xxs and only rewrites the
+            blocks that still differ.
+
+    Returns:
+        dict: size, blocks, rewritten (blocks written) and bytes_written.
+    """
+    block_size = _normalize_block_size(block_size)
+    seed = gen_seed(output_path) if seed is None else seed & 0xFFFFFFFF
+    size = os.path.getsize(input_path)
+    if size == 0:
+        raise ValueError("Input file is empty.")
+    manifest_path = block_manifest_path_for(output_path)
+
+    old_size = 0
+    old_hashes = []
+    if os.path.exists(output_path):
+        old_size = os.path.getsize(output_path)
+        old_hashes = _read_block_manifest(output_path, seed, block_size)
+        if old_hashes is None:
+            if status_callback:
+                status_callback("No valid block manifest, hashing the existing .xxs...")
+            old_hashes = _hash_xxs_blocks(output_path, seed, block_size, backend)
+    # Drop the manifest before writing: if this run is interrupted, the next
+    # one rebuilds the hashes from the .xxs instead of trusting stale ones
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    hashes = []
+    rewritten = 0
+    bytes_written = 0
+    rewrite_rest = False
+    engine = None
+    engine_offset = -1
+    buf = bytearray(block_size)
+    view = memoryview(buf)
+    fd = os.open(output_path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        with open(input_path, 'rb') as f_in:
+            for index, offset in enumerate(range(0, size, block_size)):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise ConversionCancelled(f"Cancelled at byte {offset} of {size}, "
+                                              "running it again only rewrites what still differs.")
+                n = _read_full(f_in, view)
+                if not n:
+                    raise IOError(f"Unexpected end of file at byte {offset}")
+                digest = _block_digest(view[:n])
+                hashes.append(digest)
+                if not rewrite_rest and index < len(old_hashes) and old_hashes[index] == digest:
+                    continue
+                # Same length: only this block. Otherwise the layout shifts from here on.
+                rewrite_rest = size != old_size
+                if engine_offset != offset:
+                    engine = KeystreamEngine(seed, backend, start_word=offset // 4)
+                xor_buffer(view, n, engine)
+                _pwrite_all(fd, view[:n], offset)
+                engine_offset = offset + n
+                rewritten += 1
+                bytes_written += n
+                if progress_callback:
+                    progress_callback(offset + n)
+        if size != old_size:
+            os.ftruncate(fd, size)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    if progress_callback:
+        progress_callback(size)
+
+    stamp_size, stamp_mtime = _file_stamp(output_path)
+    _write_json_atomic(manifest_path, {'version': 1, 'seed': seed, 'block_size': block_size,
+                                       'size': stamp_size, 'mtime_ns': stamp_mtime, 'blocks': hashes})
+    return {'size': size, 'blocks': len(hashes), 'rewritten': rewritten, 'bytes_written': bytes_written}
+
+# --- Resumable Conversion ---
+# A ConversionJob streams like xor_stream(), but checks a cancel flag after
+# every block and every so often saves a checkpoint next to the output: the
+# output offset and the generator state (mt, mti) at that offset, taken after
+# an fsync of the output. A later job for the same files continues from there
+# and produces exactly the same bytes as an uninterrupted run.
+
+CHECKPOINT_SUFFIX = ".xxsresume"
+CHECKPOINT_INTERVAL = 128 * 1024 * 1024 # Bytes between checkpoints, each costs an fsync
+CHECKPOINT_CRC_BYTES = 64 * 1024 # Output bytes before the offset that must still match on resume
+
+class ConversionCancelled(Exception):
+    """Raised when a conversion stops because it was cancelled"""
+
+def checkpoint_path_for(output_path):
+    return output_path + CHECKPOINT_SUFFIX
+
+def _tail_crc(f, offset):
+    start = max(0, offset - CHECKPOINT_CRC_BYTES)
+    f.seek(start)
+    return zlib.crc32(f.read(offset - start))
+
+class ConversionJob:
+    """One cancellable, resumable conversion (encrypt or decrypt) of a file.
+
+    Call run() on a worker thread and cancel() from anywhere. A checkpoint
+    left by an earlier cancelled, interrupted or crashed job for the same
+    input, output and seed is picked up automatically.
+
+    Args:
+        input_path (str): File to read.
+        output_path (str): File to write.
+        seed (int): Keystream seed, defaults to the same rule as
+            process_file_threaded (output name when encrypting).
+        block_size (int): Bytes per read, rounded down to a multiple of 4.
+        backend (str): Keystream backend name, None picks the fastest.
+        checkpoint_interval (int): Bytes between checkpoints.
+        progress_callback (function): Called with the processed byte count
+            after each block.
+        status_callback (function): Called with status strings.
+        cancel_event (threading.Event): Shared cancel flag, a private one
+            is made if not given.
+        metrics (JobMetrics): Optional, gets the time of every step.
+    """
+    def __init__(self, input_path, output_path, seed=None, block_size=DEFAULT_BLOCK_SIZE, backend=None,
+                 checkpoint_interval=CHECKPOINT_INTERVAL, progress_callback=None, status_callback=None,
+                 cancel_event=None, metrics=None):
+        if seed is None:
+            seed = gen_seed(output_path if output_path.lower().endswith(".xxs") else input_path)
+        self.input_path = input_path
+        self.output_path = output_path
+        self.seed = seed & 0xFFFFFFFF
+        self.block_size = _normalize_block_size(block_size)
+        self.backend = backend
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_path = checkpoint_path_for(output_path)
+        self.progress_callback = progress_callback
+        self.status_callback = status_callback
+        self.processed = 0
+        self.metrics = metrics
+        self._cancel = cancel_event or threading.Event()
+
+    def cancel(self):
+        """Ask the job to stop after the current block (saving a checkpoint)"""
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def _status(self, message):
+        if self.status_callback:
+            self.status_callback(message)
+
+    def _input_stamp(self):
+        st = os.stat(self.input_path)
+        return {'input': os.path.basename(self.input_path), 'input_size': st.st_size,
+                'input_mtime_ns': st.st_mtime_ns, 'seed': self.seed}
+
+    def _load_checkpoint(self):
+        """(offset, state) to resume from, or None to start over"""
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if checkpoint.get('version') != 1 or any(checkpoint.get(k) != v for k, v in self._input_stamp().items()):
+            self._status("Ignoring a checkpoint from a different input.")
+            return None
+        offset = checkpoint['offset']
+        try:
+            with open(self.output_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < offset or _tail_crc(f, offset) != checkpoint['tail_crc']:
+                    self._status("Output changed since the checkpoint, starting over.")
+                    return None
+        except OSError:
+            return None
+        return offset, (checkpoint['mt'], checkpoint['mti'])
+
+    def _save_checkpoint(self, f_out, offset, state):
+        start = time.perf_counter()
+        f_out.flush()
+        os.fsync(f_out.fileno())
+        checkpoint = {'version': 1, 'offset': offset, 'mt': state[0], 'mti': state[1],
+                      'tail_crc': _tail_crc(f_out, offset)}
+        checkpoint.update(self._input_stamp())
+        _write_json_atomic(self.checkpoint_path, checkpoint)
+        f_out.seek(offset)
+        if self.metrics is not None:
+            self.metrics.add('checkpoint', time.perf_counter() - start)
+
+    def run(self):
+        """Convert the whole file, returns the number of bytes processed.
+
+        Raises:
+            ConversionCancelled: cancel() was called; a checkpoint was saved.
+        """
+        size = os.path.getsize(self.input_path)
+        resume = self._load_checkpoint() if os.path.exists(self.checkpoint_path) else None
+        if resume is not None:
+            offset, state = resume
+            engine = KeystreamEngine(self.seed, self.backend, state=state)
+            self._status(f"Resuming at byte {offset} of {size}.")
+            f_out = open(self.output_path, 'r+b')
+            f_out.truncate(offset)
+            f_out.seek(offset)
+        else:
+            offset = 0
+            engine = KeystreamEngine(self.seed, self.backend)
+            f_out = open(self.output_path, 'w+b') # Readable too, for the checkpoint CRC
+        if self.metrics is not None:
+            self.metrics.info['resumed_at'] = offset
+            engine = self.metrics.keystream(engine)
+
+        buf = bytearray(self.block_size)
+        view = memoryview(buf)
+        saved = offset
+        try:
+            with open(self.input_path, 'rb') as f_in, f_out:
+                f_in.seek(offset)
+                while True:
+                    n = _convert_block(f_in, f_out, view, engine, self.metrics)
+                    if n:
+                        offset += n
+                        # Only whole words were used unless this was the tail, which ends the file
+                        state = engine.get_state()
+                        if self.progress_callback:
+                            self.progress_callback(offset)
+                    if n < len(buf):
+                        break # Short read means EOF
+                    if self._cancel.is_set():
+                        self._save_checkpoint(f_out, offset, state)
+                        raise ConversionCancelled(f"Cancelled at byte {offset} of {size}, checkpoint saved.")
+                    if offset - saved >= self.checkpoint_interval:
+                        self._save_checkpoint(f_out, offset, state)
+                        saved = offset
+        finally:
+            self.processed = offset
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        return offset
+
+# --- Verification and Hashing ---
+# Decrypts in memory and hashes ciphertext and plaintext in the same pass,
+# nothing is written. XOR is its own inverse, so a plaintext hash matching
+# the source .mp4 also proves that re-encrypting gives the same .xxs back.
+
+HASH_ALGORITHMS = ('sha256', 'blake2b')
+MANIFEST_VERSION = 1
+
+def hash_xxs(path, algorithm='sha256', seed=None, backend=None, block_size=DEFAULT_BLOCK_SIZE,
+             progress_callback=None):
+    """Hash an .xxs file and its decrypted content in one streaming pass.
+
+    Args:
+        path (str): The .xxs file.
+        algorithm (str): 'sha256' or 'blake2b'.
+        seed (int): Keystream seed, defaults to gen_seed(path).
+        backend (str): Keystream backend name, None picks the fastest.
+        block_size (int): Bytes per read.
+        progress_callback (function): Called with the processed byte count.
+
+    Returns:
+        dict: size, seed, ciphertext and plaintext (hex digests), and mp4
+            (True if the plaintext starts with an ftyp box).
+    """
+    seed = gen_seed(path) if seed is None else seed & 0xFFFFFFFF
+    cipher_hash = hashlib.new(algorithm)
+    plain_hash = hashlib.new(algorithm)
+    engine = KeystreamEngine(seed, backend)
+    buf = bytearray(_normalize_block_size(block_size))
+    view = memoryview(buf)
+    size = 0
+    head = b''
+    with open(path, 'rb') as f_in:
+        while True:
+            n = _read_full(f_in, view)
+            if not n:
+                break
+            cipher_hash.update(view[:n])
+            xor_buffer(view, n, engine)
+            plain_hash.update(view[:n])
+            if not size:
+                head = bytes(view[:8])
+            size += n
+            if progress_callback:
+                progress_callback(size)
+            if n < len(buf):
+                break # Short read means EOF
+    return {
+        'size': size,
+        'seed': f"0x{seed:08x}",
+        'ciphertext': cipher_hash.hexdigest(),
+        'plaintext': plain_hash.hexdigest(),
+        'mp4': head[4:8] == b'ftyp',
+    }
+
+def hash_file(path, algorithm='sha256', block_size=DEFAULT_BLOCK_SIZE):
+    """Hex digest of a plain file"""
+    digest = hashlib.new(algorithm)
+    buf = bytearray(_normalize_block_size(block_size))
+    view = memoryview(buf)
+    with open(path, 'rb') as f:
+        while True:
+            n = _read_full(f, view)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+def new_manifest(algorithm='sha256'):
+    return {'version': MANIFEST_VERSION, 'algorithm': algorithm, 'files': {}}
+
+def read_manifest(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if (not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION
+            or manifest.get('algorithm') not in HASH_ALGORITHMS or not isinstance(manifest.get('files'), dict)):
+        raise ValueError(f"Unsupported manifest: {path}")
+    return manifest
+
+def write_manifest(path, manifest):
+    """Write a manifest atomically; file keys are relative to its folder, with '/'"""
+    _write_json_atomic(path, manifest, indent=2)
+
+def compare_manifest_entry(expected, actual):
+    """Names of the fields (size, ciphertext, plaintext) that differ"""
+    return [field for field in ('size', 'ciphertext', 'plaintext') if expected.get(field) != actual.get(field)]
+
+# --- Persistent Keystream Cache ---
+# One file per seed holding the first `length` keystream bytes. A longer entry
+# serves any shorter request, since the keystream for a seed never changes.
+# Entries are written to a temp file and renamed into place, so concurrent
+# workers only ever see complete files; mtime is the LRU clock.
+
+DEFAULT_CACHE_MAX_BYTES = 1024 ** 3
+CACHE_SUFFIX = ".ks"
+
+def default_cache_dir():
+    base = os.environ.get('LOCALAPPDATA') if os.name == 'nt' else None
+    base = base or os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'mg-rexxs', 'keystream')
+
+class BufferKeystream:
+    """Engine-compatible keystream served from a buffer (e.g. a cache mmap)"""
+    backend_name = "cache"
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self._view = memoryview(buffer)
+        self._pos = 0
+
+    def words(self, count):
+        start = self._pos
+        end = start + count * 4
+        if end > len(self._view):
+            raise ValueError("Cached keystream is shorter than the data")
+        self._pos = end
+        if np is not None:
+            return np.frombuffer(self._view, dtype='<u4', count=count, offset=start)
+        out = array.array('I')
+        out.frombytes(self._view[start:end])
+        if sys.byteorder == 'big':
+            out.byteswap()
+        return out
+
+    def next_block(self):
+        return self.words(N)
+
+    def read(self, nbytes):
+        return words_to_bytes(self.words((nbytes + 3) // 4))[:nbytes]
+
+    def close(self):
+        self._view.release()
+        if hasattr(self._buffer, 'close'):
+            self._buffer.close()
+
+class KeystreamCache:
+    """On-disk keystream cache with a total size cap and LRU eviction.
+
+    Args:
+        directory (str): Cache directory, defaults to default_cache_dir().
+        max_bytes (int): Total size cap, oldest entries are evicted first.
+    """
+    def __init__(self, directory=None, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, seed):
+        return os.path.join(self.directory, f"{seed & 0xFFFFFFFF:08x}{CACHE_SUFFIX}")
+
+    def _map(self, path, length):
+        """Read-only mmap of an entry if it covers length bytes, else None"""
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < max(length, 1):
+                    return None
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            os.utime(path) # LRU touch
+        except OSError:
+            pass
+        return mapped
+
+    def get(self, seed, length):
+        """Mapped keystream of at least length bytes, or None on a miss"""
+        return self._map(self.path_for(seed), length)
+
+    def put(self, seed, length, backend=None):
+        """Generate (or extend) the entry for seed to cover length bytes.
+
+        Returns the path of the entry, or None if it could not be stored
+        (too large for the cap, or replaced by another worker on Windows).
+        """
+        length = (length + 3) // 4 * 4
+        if length > self.max_bytes:
+            return None
+        path = self.path_for(seed)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        existing = self._map(path, 0)
+        try:
+            with open(tmp_path, 'wb') as f:
+                start = 0
+                if existing is not None:
+                    start = min(len(existing), length) // 4 * 4
+                    f.write(existing[:start])
+                engine = KeystreamEngine(seed, backend, start_word=start // 4)
+                for offset in range(start, length, DEFAULT_BLOCK_SIZE):
+                    f.write(engine.read(min(DEFAULT_BLOCK_SIZE, length - offset)))
+            if existing is not None:
+                existing.close()
+                existing = None
+            os.replace(tmp_path, path)
+        except OSError:
+            # Windows refuses to replace a file another worker has mapped
+            return None
+        finally:
+            if existing is not None:
+                existing.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+        return path
+
+    def open(self, seed, length, backend=None):
+        """Engine-compatible keystream for seed covering length bytes.
+
+        A hit maps the cached file and skips MersenneTwister entirely; a miss
+        generates and stores the keystream first. Call close() when done.
+        """
+        mapped = self.get(seed, length)
+        if mapped is None:
+            self.put(seed, length, backend)
+            mapped = self.get(seed, length)
+        if mapped is None: # Could not be cached, generate in memory
+            return BufferKeystream(keystream_at(seed, 0, (length + 3) // 4 * 4, backend))
+        return BufferKeystream(mapped)
+
+    def entries(self):
+        """(mtime, size, path) of every entry, oldest first"""
+        found = []
+        for name in os.listdir(self.directory):
+            if name.endswith(CACHE_SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                found.append((st.st_mtime, st.st_size, path))
+        return sorted(found)
+
+    def evict(self):
+        """Delete the least recently used entries until under max_bytes"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass # Already gone, or still mapped by a worker on Windows
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+# --- In-Memory Preview ---
+# Decrypts into an anonymous memory file (Linux memfd_create) that a player
+# can open by path, /proc/self/fd/N, while the body is still being written.
+# The ftyp and moov boxes are decrypted first, wherever moov sits, then the
+# first few MB of the body the player probes when opening the file. The rest
+# follows front to back at memory speed, well ahead of playback.
+
+PREVIEW_HEADER_BOXES = (b'ftyp', b'moov')
+PREVIEW_LEAD_BYTES = 8 * 1024 * 1024 # More than FFmpeg's default probesize (5 MB)
+
+def _open_anonymous_file(name, size):
+    """Returns (fd, path, temp_path); temp_path is None when nothing touches the disk"""
+    if hasattr(os, 'memfd_create') and os.path.isdir('/proc/self/fd'):
+        fd = os.memfd_create(name)
+        path, temp_path = f"/proc/self/fd/{fd}", None
+    else:
+        # No memfd (Windows, macOS): a private temp file, removed by close()
+        fd, temp_path = tempfile.mkstemp(prefix="mgrexxs_preview_", suffix=".mp4")
+        path = temp_path
+    os.ftruncate(fd, size)
+    return fd, path, temp_path
+
+class DecryptedPreview:
+    """Decrypt an .xxs in the background into an in-memory file for playback.
+
+    Open path with the player once header_ready is set, and call close()
+    after the player released it. done is set when the whole file is
+    decrypted (or failed, see error).
+
+    Args:
+        input_path (str): The .xxs file.
+        seed (int): Keystream seed, defaults to gen_seed(input_path).
+        backend (str): Keystream backend name, None picks the fastest.
+        block_size (int): Bytes per read.
+        progress_callback (function): Called with the decrypted byte count.
+        cancel_event (threading.Event): Shared stop flag, a private one is
+            made if not given. close() sets it.
+    """
+    def __init__(self, input_path, seed=None, backend=None, block_size=DEFAULT_BLOCK_SIZE, progress_callback=None,
+                 cancel_event=None):
+        self.input_path = input_path
+        self.seed = gen_seed(input_path) if seed is None else seed & 0xFFFFFFFF
+        self.backend = backend
+        self.block_size = block_size
+        self.progress_callback = progress_callback
+        self.size = os.path.getsize(input_path)
+        self.fd, self.path, self._temp_path = _open_anonymous_file(os.path.basename(input_path), self.size)
+        self.header_ready = threading.Event()
+        self.done = threading.Event()
+        self.error = None
+        self.written = 0
+        self._cancel = cancel_event or threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def wait_ready(self, timeout=None):
+        """Wait for the header, True if the file can be opened"""
+        return self.header_ready.wait(timeout) and self.error is None
+
+    def _write_header(self):
+        """Decrypt ftyp, moov and every top-level box header first.
+
+        The player walks the box headers to find moov, so the mdat header in
+        front of it is needed too. Returns False if there is no moov box.
+        """
+        with XxsReader(self.input_path, self.seed, self.backend) as reader:
+            ranges = []
+            start = 0 # Top-level boxes are contiguous, each starts where the last ended
+            for box_type, offset, size in iter_boxes(reader):
+                end = offset + size if box_type in PREVIEW_HEADER_BOXES else offset
+                ranges.append((box_type, start, end - start))
+                start = offset + size
+            if not any(box_type == b'moov' for box_type, _, _ in ranges):
+                return False
+            for _, offset, length in ranges:
+                reader.seek(offset)
+                _pwrite_all(self.fd, reader.read(length), offset)
+        return True
+
+    def _run(self):
+        try:
+            has_header = self._write_header()
+            engine = KeystreamEngine(self.seed, self.backend)
+            buf = bytearray(_normalize_block_size(self.block_size))
+            view = memoryview(buf)
+            with open(self.input_path, 'rb') as f_in:
+                while not self._cancel.is_set():
+                    n = _read_full(f_in, view)
+                    if not n:
+                        break
+                    xor_buffer(view, n, engine)
+                    _pwrite_all(self.fd, view[:n], self.written)
+                    self.written += n
+                    if has_header and self.written >= PREVIEW_LEAD_BYTES:
+                        self.header_ready.set()
+                    if self.progress_callback:
+                        self.progress_callback(self.written)
+                    if n < len(buf):
+                        break # Short read means EOF
+        except Exception as e:
+            self.error = e
+        finally:
+            self.header_ready.set() # Short file or no moov box: the player gets the finished file
+            self.done.set()
+
+    def close(self):
+        """Stop decrypting and free the memory file (or remove the temp file)"""
+        self._cancel.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self._temp_path and os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+# --- Progress Events ---
+# Conversions report progress through a ProgressThrottle, so however small
+# the blocks are, a job produces at most a few reports per second. Reports
+# from worker threads go to a ProgressBus, which a UI drains on its own
+# schedule (Tk polls it from the main loop) and other callers can wait on or
+# subscribe to.
+
+PROGRESS_INTERVAL = 0.1 # Seconds between progress reports of one job
+
+class ProgressThrottle:
+    """Decides which byte counts are worth reporting.
+
+    A count is reported when `interval` seconds have passed and it grew by
+    at least `min_bytes` since the last report, and the first and final
+    counts always are. Callers that show a rounded value set min_bytes to
+    one step of it, so no report repeats the previous one.
+    """
+    def __init__(self, total, interval=PROGRESS_INTERVAL, min_bytes=0, clock=time.monotonic):
+        self.total = total
+        self.interval = interval
+        self.min_bytes = min_bytes
+        self.clock = clock
+        self._last_time = None
+        self._last_bytes = 0
+
+    def ready(self, done):
+        now = self.clock()
+        if (self._last_time is not None and done < self.total
+                and (now - self._last_time < self.interval or done - self._last_bytes < self.min_bytes)):
+            return False
+        self._last_time = now
+        self._last_bytes = done
+        return True
+
+ProgressEvent = namedtuple('ProgressEvent', 'job kind value time')
+ProgressEvent.__doc__ = """One event from a job: kind is 'status' (message), 'progress' (0-100) or 'finished'
+(success bool from callbacks(), or an outcome such as process_file_threaded returns)"""
+
+class ProgressBus:
+    """Thread-safe event stream between conversion jobs and whoever shows them.
+
+    Producers call post() (or use callbacks() with process_file_threaded)
+    from any thread. Events stay queued until drain() or wait() takes them.
+    A job's pending 'progress' event is replaced by a newer one rather than
+    queued behind it, so a slow consumer only sees the latest value. Each
+    job's events stay in the order they were posted. Subscribers are called right
+    away, on the posting thread.
+    """
+    def __init__(self):
+        self._events = []
+        self._progress_index = {} # job -> index of its pending progress event
+        self._subscribers = []
+        self._condition = threading.Condition()
+
+    def subscribe(self, callback):
+        """Call callback(event) for every event as it is posted"""
+        self._subscribers.append(callback)
+
+    def post(self, job, kind, value):
+        event = ProgressEvent(job, kind, value, time.monotonic())
+        with self._condition:
+            if kind != 'progress':
+                self._progress_index.pop(job, None) # Later progress goes after this event
+            index = self._progress_index.get(job) if kind == 'progress' else None
+            if index is not None:
+                self._events[index] = event # Merge with the pending one
+            else:
+                if kind == 'progress':
+                    self._progress_index[job] = len(self._events)
+                self._events.append(event)
+            self._condition.notify_all()
+        for callback in self._subscribers:
+            callback(event)
+
+    def drain(self):
+        """Take every pending event, oldest first (never blocks)"""
+        with self._condition:
+            events, self._events = self._events, []
+            self._progress_index.clear()
+        return events
+
+    def wait(self, timeout=None):
+        """drain(), after waiting up to timeout seconds for an event"""
+        with self._condition:
+            if not self._events:
+                self._condition.wait(timeout)
+        return self.drain()
+
+    def callbacks(self, job):
+        """(status_callback, progress_callback, finished_callback) that post as job"""
+        return (lambda message: self.post(job, 'status', message),
+                lambda value: self.post(job, 'progress', value),
+                lambda success: self.post(job, 'finished', success))
+
+# --- Telemetry and Profiling ---
+# Opt-in numbers for when a conversion is slow on some machine. JobMetrics
+# adds up where one job spends its time, TelemetryLog appends such records
+# (and the viewer's) to a JSON-lines file, and JobProfiler wraps one job in
+# cProfile and/or tracemalloc and leaves the stats next to its output.
+
+TELEMETRY_VERSION = 1
+TELEMETRY_ENV = "MGREXXS_TELEMETRY" # Log file for the GUI, the CLI has --telemetry
+PROFILE_ENV = "MGREXXS_PROFILE" # "cpu", "memory" or "cpu,memory" for the GUI, the CLI has --profile
+PROFILE_MODES = ('cpu', 'memory')
+JOB_PHASES = ('seed', 'backend', 'prng', 'read', 'xor', 'write')
+MEMORY_TOP_STATS = 25 # Allocation sites listed in the .memory.txt dump
+
+def _windows_peak_rss():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in (
+                'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize
+
+def peak_rss(children=False):
+    """Peak resident set size in bytes, of this process or of its largest
+    finished child (children=True). None where it can't be read.
+
+    This is the process-wide peak so far, not just the last job's.
+    """
+    if resource is None:
+        if children or os.name != 'nt':
+            return None
+        try:
+            return _windows_peak_rss()
+        except (OSError, AttributeError):
+            return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024 # KB except on macOS
+
+class TimedKeystream:
+    """Keystream wrapper that adds the time spent in words() to a JobMetrics 'prng' phase"""
+    def __init__(self, keystream, metrics):
+        self._keystream = keystream
+        self._metrics = metrics
+
+    def words(self, count):
+        start = self._metrics.clock()
+        words = self._keystream.words(count)
+        self._metrics.add('prng', self._metrics.clock() - start)
+        return words
+
+    def __getattr__(self, name):
+        return getattr(self._keystream, name)
+
+class JobMetrics:
+    """Where one conversion spends its time.
+
+    phases holds seconds per step: 'seed' (seed derivation), 'backend'
+    (choosing the keystream backend, a one-off self-check on first use in a
+    process), 'prng' (keystream setup and generation), 'read', 'xor' and
+    'write', plus 'checkpoint' for resumable jobs. Modes that don't run the block loop
+    (parallel, in-place, incremental) time their whole conversion as
+    'convert'. info takes any extra fields for the record.
+    """
+    def __init__(self, input_path, output_path, clock=time.perf_counter):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.clock = clock
+        self.phases = dict.fromkeys(JOB_PHASES, 0.0)
+        self.bytes = 0
+        self.info = {}
+        self._start = clock()
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def timer(self, phase):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add(phase, self.clock() - start)
+
+    def keystream(self, keystream):
+        """Wrap a keystream so its generation time counts as 'prng'"""
+        return TimedKeystream(keystream, self)
+
+    def finish(self, status, error=None):
+        """The JSON-ready record of the job, status is 'ok', 'cancelled' or 'failed'"""
+        seconds = self.clock() - self._start
+        record = {
+            'event': 'job',
+            'version': TELEMETRY_VERSION,
+            'time': round(time.time(), 3),
+            'pid': os.getpid(),
+            'input': self.input_path,
+            'output': self.output_path,
+            'status': status,
+            'seconds': round(seconds, 6),
+            'bytes': self.bytes,
+            'bytes_per_s': round(self.bytes / seconds) if seconds > 0 else 0,
+            'phases': {name: round(value, 6) for name, value in self.phases.items()},
+            'peak_rss': peak_rss(),
+        }
+        record.update(self.info)
+        if error is not None:
+            record['error'] = error
+        return record
+
+class TelemetryLog:
+    """Appends telemetry records to a JSON-lines file.
+
+    The file is opened for every record and each record is one short
+    append, so worker processes (convert -j N) can share it.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls):
+        """Log named by MGREXXS_TELEMETRY, or None when it isn't set"""
+        path = os.environ.get(TELEMETRY_ENV)
+        return cls(path) if path else None
+
+    def write(self, record):
+        line = json.dumps(record, separators=(',', ':')) + "\n"
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+def parse_profile_modes(text):
+    """"cpu", "memory" or "cpu,memory" -> tuple of modes, () for an empty string"""
+    modes = tuple(mode.strip().lower() for mode in (text or "").split(',') if mode.strip())
+    unknown = [mode for mode in modes if mode not in PROFILE_MODES]
+    if unknown:
+        raise ValueError(f"Unknown profile mode '{unknown[0]}', use {' or '.join(PROFILE_MODES)}.")
+    return modes
+
+class JobProfiler:
+    """cProfile and/or tracemalloc around one job, stats saved next to the output.
+
+    'cpu' writes <output>.prof (open it with pstats or snakeviz), 'memory'
+    writes <output>.memory.txt with the traced peak and the top allocation
+    sites. cProfile only sees the thread that called start(), so parallel
+    workers (other processes) are not included.
+
+    Args:
+        output_path (str): Output of the job, the dumps go next to it.
+        modes (tuple): Any of PROFILE_MODES.
+    """
+    def __init__(self, output_path, modes):
+        self.output_path = output_path
+        self.modes = tuple(modes)
+        self.traced_peak = None
+        self._profile = None
+        self._owns_tracing = False
+
+    def start(self):
+        """Start profiling.
+
+        Raises:
+            ValueError: Another profiler is already active (Python 3.12+).
+        """
+        if 'cpu' in self.modes:
+            import cProfile
+            profile = cProfile.Profile()
+            profile.enable()
+            self._profile = profile
+        if 'memory' in self.modes:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+                self._owns_tracing = True
+
+    def stop(self):
+        """Stop profiling and write the dumps, returns their paths"""
+        paths = []
+        if self._profile is not None:
+            self._profile.disable()
+            path = self.output_path + ".prof"
+            self._profile.dump_stats(path)
+            self._profile = None
+            paths.append(path)
+        if 'memory' in self.modes:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                return paths
+            current, self.traced_peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__),))
+            if self._owns_tracing:
+                tracemalloc.stop()
+                self._owns_tracing = False
+            path = self.output_path + ".memory.txt"
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f"Peak traced: {self.traced_peak} bytes, still allocated at the end: {current} bytes\n\n")
+                for stat in snapshot.statistics('lineno')[:MEMORY_TOP_STATS]:
+                    f.write(f"{stat}\n")
+            paths.append(path)
+        return paths
+
+# --- File Processing (shared by the GUI and CLI) ---
+
+def output_path_for(input_path):
+    """Output path for a conversion, next to the input.
+
+    .xxs files decrypt to .mp4, anything else encrypts to .xxs.
+    """
+    dirname = os.path.dirname(input_path)
+    name_base, ext = os.path.splitext(os.path.basename(input_path))
+    if ext.lower() == '.xxs':
+        # Decrypting: default to .mp4, could be configurable later
+        output_ext = '.mp4'
+    else:
+        # Encrypting: always output .xxs
+        output_ext = '.xxs'
+    return os.path.join(dirname, name_base + output_ext)
+
+def collect_inputs(paths, pattern):
+    """Expand files, globs and directory trees into a list of input files.
+
+    Directories are walked recursively and filtered with pattern
+    (case-insensitive). Duplicates are dropped, order is kept.
+    """
+    found = []
+    seen = set()
+
+    def add(path):
+        key = os.path.normcase(os.path.abspath(path))
+        if key not in seen:
+            seen.add(key)
+            found.append(path)
+
+    def add_tree(root):
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if fnmatch.fnmatch(filename.lower(), pattern.lower()):
+                    add(os.path.join(dirpath, filename))
+
+    for path in paths:
+        if os.path.isdir(path):
+            add_tree(path)
+        elif glob.has_magic(path):
+            for match in sorted(glob.glob(path, recursive=True)):
+                if os.path.isdir(match):
+                    add_tree(match)
+                else:
+                    add(match)
+        else:
+            add(path) # Missing files are reported as failures
+    return found
+
+def format_rate(count, seconds):
+    return f"{count / max(seconds, 1e-9) / (1024 ** 2):.1f} MB/s"
+
+def format_duration(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    return f"{int(minutes):02d}:{seconds:04.1f}"
+
+def process_file_threaded(input_path, output_path, status_callback, progress_callback, finished_callback,
+                          block_size=DEFAULT_BLOCK_SIZE, backend=None, workers=1,
+                          segment_size=DEFAULT_SEGMENT_SIZE, in_place=False, cache=None, incremental=False,
+                          cancel_event=None, telemetry=None, profile=None):
+    """
+    Processes the file (encrypt/decrypt) in a background thread.
+
+    Args:
+        input_path (str): Path to the input file.
+        output_path (str): Path for the output file.
+        status_callback (function): Function to call with status string updates.
+        progress_callback (function): Function to call with progress updates (0-100),
+            rate-limited by a ProgressThrottle.
+        finished_callback (function): Function to call when processing is done (success or fail).
+        block_size (int): Bytes read and XORed per block.
+        backend (str): Keystream backend name, None picks the fastest.
+        workers (int): Worker processes for large files (1 = sequential,
+            None = one per CPU).
+        segment_size (int): Bytes per worker task in parallel mode.
+        in_place (bool): Convert input_path itself through an mmap and rename
+            it to output_path (no second copy on disk, resumable).
+        cache (KeystreamCache): Optional on-disk keystream cache, used by
+            the sequential path.
+        incremental (bool): When encrypting over an existing .xxs, only
+            rewrite the blocks that changed (see encrypt_incremental).
+            Can't be combined with cache.
+        cancel_event (threading.Event): Set it to stop the conversion early,
+            every mode checks it between blocks. The default sequential path,
+            in-place and incremental mode keep their progress, so processing
+            the same file again resumes it; the cache and parallel paths
+            start over.
+        telemetry (TelemetryLog): Gets a JobMetrics record of the job.
+        profile (tuple): PROFILE_MODES to run the job under (JobProfiler),
+            the stats are saved next to the output.
+
+    Returns:
+        str: 'ok', 'cancelled' (cancel_event stopped it) or 'failed'.
+    """
+    metrics = JobMetrics(input_path, output_path)
+    profiler = JobProfiler(output_path, profile) if profile else None
+    outcome, error = 'failed', None
+    try:
+        if profiler is not None:
+            try:
+                profiler.start()
+            except ValueError as e: # Another profiler is running, e.g. a second queue worker
+                status_callback(f"Profiling skipped: {e}")
+                profiler = None
+
+        status_callback(f"Processing: {os.path.basename(input_path)}")
+        # An in-place run that crashed right after its rename left just the
+        # journal, convert_in_place() tidies that up
+        leftover_journal = in_place and os.path.exists(journal_path_for(input_path))
+        if not os.path.exists(input_path) and not leftover_journal:
+            raise FileNotFoundError("Input file not found.")
+
+        # Determine which filename to use for seeding
+        is_encrypting = output_path.lower().endswith(".xxs")
+        seed_path = output_path if is_encrypting else input_path
+        base_seed_name = os.path.basename(seed_path)
+        status_callback(f"Mode: {'Encrypting' if is_encrypting else 'Decrypting'}")
+
+        # 1. Calculate Seed
+        with metrics.timer('seed'):
+            seed = gen_seed(seed_path)
+        status_callback(f"Seed: {seed} (0x{seed:08X}) for '{base_seed_name}'")
+
+        # 2. Pick the keystream backend. It self-checks once per process, which
+        # is timed apart so 'prng' stays per-job work. Every path below builds
+        # the engine it needs itself, and a cache hit needs none at all
+        with metrics.timer('backend'):
+            backend = select_keystream_backend(backend).name
+        status_callback(f"Keystream backend: {backend}.")
+
+        # 3. Get file size for progress
+        file_size = os.path.getsize(input_path if os.path.exists(input_path) else output_path)
+        status_callback(f"File size: {file_size} bytes.")
+        if file_size == 0:
+             raise ValueError("Input file is empty.")
+        metrics.info.update(mode='encrypt' if is_encrypting else 'decrypt', backend=backend,
+                            block_size=block_size, size=file_size)
+
+        status_callback("Starting file processing...")
+        throttle = ProgressThrottle(file_size, min_bytes=file_size // 100) # Whole percents only
+        throttle.ready(0) # Counts as the first report, the next one needs a whole percent more
+        progress_callback(0) # Start progress bar
+
+        def on_block(processed_bytes):
+            if throttle.ready(processed_bytes):
+                progress_callback(int((processed_bytes / file_size) * 100))
+
+        if incremental:
+            if not is_encrypting:
+                raise ValueError("Incremental mode only applies when encrypting to .xxs.")
+            if cache is not None:
+                raise ValueError("Incremental mode can't use the keystream cache.")
+            metrics.info['method'] = 'incremental'
+            with metrics.timer('convert'):
+                result = encrypt_incremental(input_path, output_path, seed, backend=backend,
+                                             progress_callback=on_block, status_callback=status_callback,
+                                             cancel_event=cancel_event)
+            metrics.bytes = file_size
+            metrics.info.update(blocks=result['blocks'], rewritten=result['rewritten'],
+                                bytes_written=result['bytes_written'])
+            status_callback(f"Incremental: rewrote {result['rewritten']}/{result['blocks']} blocks "
+                            f"({result['bytes_written']} bytes).")
+        elif in_place:
+            status_callback("In-place mode.")
+            metrics.info['method'] = 'in_place'
+            with metrics.timer('convert'):
+                convert_in_place(input_path, output_path, seed, backend=backend,
+                                 progress_callback=on_block, status_callback=status_callback,
+                                 cancel_event=cancel_event)
+            metrics.bytes = file_size
+        elif workers != 1 and file_size > segment_size:
+            worker_count = workers or os.cpu_count() or 1
+            status_callback(f"Parallel mode: {worker_count} workers.")
+            metrics.info.update(method='parallel', workers=worker_count)
+            with metrics.timer('convert'):
+                xor_file_parallel(input_path, output_path, seed, worker_count, segment_size,
+                                  block_size, backend, on_block, cancel_event)
+            metrics.bytes = file_size
+            metrics.info['peak_rss_workers'] = peak_rss(children=True)
+        elif cache is not None:
+            hit = cache.get(seed, file_size)
+            if hit is not None:
+                keystream = BufferKeystream(hit)
+            else:
+                with metrics.timer('prng'):
+                    keystream = cache.open(seed, file_size, backend)
+            status_callback(f"Keystream cache {'hit' if hit is not None else 'miss'}.")
+            metrics.info.update(method='cache', cache_hit=hit is not None)
+            try:
+                with open(input_path, 'rb') as f_in, open(output_path, 'wb') as f_out:
+                    xor_stream(f_in, f_out, keystream, block_size, on_block, metrics, cancel_event)
+            finally:
+                keystream.close()
+        else:
+            # Large blocks: one read, one XOR and one write per block, with
+            # checkpoints so an interrupted run picks up where it stopped
+            metrics.info['method'] = 'sequential'
+            job = ConversionJob(input_path, output_path, seed, block_size, backend,
+                                progress_callback=on_block, status_callback=status_callback,
+                                cancel_event=cancel_event, metrics=metrics)
+            job.run()
+
+        progress_callback(100) # Ensure progress hits 100%
+        final_status = f"Success! Output saved to {os.path.basename(output_path)}"
+        outcome = 'ok'
+
+    except ConversionCancelled as e:
+        final_status, outcome, error = str(e), 'cancelled', str(e)
+    except Exception as e:
+        final_status, error = f"Error: {e}", str(e)
+        # import traceback # Optional detailed error for console/log
+        # traceback.print_exc()
+
+    # Profile and telemetry go out before the final status, which callers show as the result
+    if profiler is not None:
+        try:
+            for path in profiler.stop():
+                status_callback(f"Profile saved to {path}")
+            if profiler.traced_peak is not None:
+                metrics.info['traced_peak'] = profiler.traced_peak
+        except OSError as e:
+            status_callback(f"Could not save the profile: {e}")
+    if telemetry is not None:
+        try:
+            telemetry.write(metrics.finish(outcome, error))
+        except OSError as e:
+            status_callback(f"Could not write telemetry: {e}")
+    status_callback(final_status)
+    finished_callback(outcome == 'ok') # Signal success or failure
+    return outcome
@@ -0,0 +1,248 @@
+"""Minimal MP4 (ISO BMFF) box reader, stdlib only.
+
+Works on any seekable binary file object, including a decrypting XxsReader,
+and only touches the boxes it needs, so sample data is never read.
+"""
+import bisect
+import io
+import struct
+
+# Boxes that only contain other boxes
+CONTAINER_BOXES = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'edts', b'dinf'}
+
+# --- Box Parsing ---
+
+def _stream_size(f):
+    position = f.tell()
+    size = f.seek(0, 2)
+    f.seek(position)
+    return size
+
+def iter_boxes(f, start=0, end=None):
+    """Yield (box_type, payload_offset, payload_size) for the boxes in [start, end)"""
+    if end is None:
+        end = _stream_size(f)
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1: # 64-bit size follows the type
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            size = struct.unpack('>Q', large)[0]
+            header_size = 16
+        elif size == 0: # Box runs to the end of its parent
+            size = end - offset
+        if size < header_size or offset + size > end:
+            return # Truncated or corrupt, stop here
+        yield box_type, offset + header_size, size - header_size
+        offset += size
+
+def find_box(f, path, start=0, end=None):
+    """Locate a nested box such as b'moov/mvhd', returns (payload_offset, payload_size) or None"""
+    names = path.split(b'/')
+    for box_type, offset, size in iter_boxes(f, start, end):
+        if box_type == names[0]:
+            if len(names) == 1:
+                return offset, size
+            return find_box(f, b'/'.join(names[1:]), offset, offset + size)
+    return None
+
+def read_payload(f, location):
+    offset, size = location
+    f.seek(offset)
+    return f.read(size)
+
+# --- Video Index ---
+
+class VideoIndex:
+    """Keyframes and presentation timestamps of the first video track.
+
+    Frame numbers are 0-based, like cv2.CAP_PROP_POS_FRAMES.
+    """
+    def __init__(self, keyframes, timestamps):
+        self.keyframes = keyframes
+        self.timestamps = timestamps
+
+    @property
+    def frame_count(self):
+        return len(self.timestamps)
+
+    def keyframe_before(self, frame_number):
+        """Nearest keyframe at or before frame_number"""
+        i = bisect.bisect_right(self.keyframes, frame_number)
+        return self.keyframes[i - 1] if i else 0
+
+    def timestamp(self, frame_number):
+        """Presentation time of frame_number in seconds"""
+        if not self.timestamps:
+            return 0.0
+        return self.timestamps[max(0, min(frame_number, len(self.timestamps) - 1))]
+
+def _video_sample_table(f):
+    moov = find_box(f, b'moov')
+    if moov is None:
+        return None
+    for box_type, offset, size in iter_boxes(f, moov[0], moov[0] + moov[1]):
+        if box_type != b'trak':
+            continue
+        mdia = find_box(f, b'mdia', offset, offset + size)
+        if mdia is None:
+            continue
+        hdlr = find_box(f, b'hdlr', *_span(mdia))
+        if hdlr is None or read_payload(f, hdlr)[8:12] != b'vide':
+            continue
+        mdhd = find_box(f, b'mdhd', *_span(mdia))
+        stbl = find_box(f, b'minf/stbl', *_span(mdia))
+        if mdhd is not None and stbl is not None:
+            return read_payload(f, mdhd), stbl
+    return None
+
+def _span(location):
+    return location[0], location[0] + location[1]
+
+def _timescale(mdhd):
+    version = mdhd[0]
+    # version 1 uses 64-bit creation/modification times
+    return struct.unpack_from('>I', mdhd, 20 if version == 1 else 12)[0] or 1
+
+def read_video_index(f):
+    """Build a VideoIndex from the moov box, or None if there is no usable video track.
+
+    Only the sample tables (stts, stss) are read, wherever moov sits in the file.
+    """
+    found = _video_sample_table(f)
+    if found is None:
+        return None
+    mdhd, stbl = found
+    timescale = _timescale(mdhd)
+
+    stts = find_box(f, b'stts', *_span(stbl))
+    if stts is None:
+        return None
+    data = read_payload(f, stts)
+    count = struct.unpack_from('>I', data, 4)[0]
+    timestamps = []
+    ticks = 0
+    for i in range(count):
+        samples, delta = struct.unpack_from('>II', data, 8 + 8 * i)
+        for _ in range(samples):
+            timestamps.append(ticks / timescale)
+            ticks += delta
+    if not timestamps:
+        return None # Fragmented MP4, samples live in moof boxes
+
+    stss = find_box(f, b'stss', *_span(stbl))
+    if stss is None:
+        keyframes = list(range(len(timestamps))) # No sync table: every sample is a keyframe
+    else:
+        data = read_payload(f, stss)
+        count = struct.unpack_from('>I', data, 4)[0]
+        keyframes = [n - 1 for n in struct.unpack_from(f'>{count}I', data, 8)]
+    return VideoIndex(keyframes, timestamps)
+
+def read_video_index_file(path):
+    with open(path, 'rb') as f:
+        return read_video_index(f)
+
+# --- Metadata Probe ---
+
+def _fourcc(data):
+    return data.decode('latin-1').strip('\x00 ')
+
+def _versioned(payload, v0_format, v1_format):
+    """Unpack a full box with 32-bit (version 0) or 64-bit (version 1) times"""
+    return struct.unpack_from(v1_format if payload[0] == 1 else v0_format, payload, 4)
+
+def _sample_entry(stsd, handler):
+    """Codec fourcc and the size/format fields of the first stsd entry"""
+    if len(stsd) < 16 or not struct.unpack_from('>I', stsd, 4)[0]:
+        return {}
+    entry = stsd[8:]
+    info = {'codec': _fourcc(entry[4:8])}
+    if handler == 'vide' and len(entry) >= 36:
+        info['width'], info['height'] = struct.unpack_from('>HH', entry, 32)
+    elif handler == 'soun' and len(entry) >= 36:
+        info['channels'] = struct.unpack_from('>H', entry, 24)[0]
+        info['sample_rate'] = struct.unpack_from('>I', entry, 32)[0] >> 16
+    return info
+
+def _probe_track(moov, offset, size):
+    span = (offset, offset + size)
+    track = {}
+    tkhd = find_box(moov, b'tkhd', *span)
+    if tkhd:
+        track['id'] = _versioned(read_payload(moov, tkhd), '>8xI', '>16xI')[0]
+    mdia = find_box(moov, b'mdia', *span)
+    if mdia is None:
+        return track
+    hdlr = find_box(moov, b'hdlr', *_span(mdia))
+    handler = _fourcc(read_payload(moov, hdlr)[8:12]) if hdlr else ''
+    track['type'] = handler
+    mdhd = find_box(moov, b'mdhd', *_span(mdia))
+    if mdhd:
+        timescale, duration = _versioned(read_payload(moov, mdhd), '>8xII', '>16xIQ')
+        if timescale:
+            track['duration'] = duration / timescale
+    stbl = find_box(moov, b'minf/stbl', *_span(mdia))
+    if stbl:
+        stsd = find_box(moov, b'stsd', *_span(stbl))
+        if stsd:
+            track.update(_sample_entry(read_payload(moov, stsd), handler))
+        stsz = find_box(moov, b'stsz', *_span(stbl)) or find_box(moov, b'stz2', *_span(stbl))
+        if stsz:
+            track['samples'] = struct.unpack_from('>I', read_payload(moov, stsz)[:12], 8)[0]
+    if handler == 'vide' and track.get('samples') and track.get('duration'):
+        track['fps'] = track['samples'] / track['duration']
+    return track
+
+def probe_mp4(f):
+    """Container metadata from the ftyp and moov boxes only.
+
+    f is any seekable binary file object (an XxsReader decrypts just the
+    bytes read). The top-level box headers are walked to find moov wherever
+    it sits, then moov is read in one go and parsed in memory; sample data
+    is never touched.
+
+    Returns:
+        dict: brand, compatible_brands, duration (seconds), moov_offset,
+            faststart (moov before mdat), size and tracks, a list of dicts
+            with type ('vide', 'soun', ...), codec and, where present, id,
+            duration, width, height, samples, fps, channels and sample_rate.
+
+    Raises:
+        ValueError: Not an MP4 (for an .xxs usually a wrong filename/seed).
+    """
+    size = _stream_size(f)
+    info = {'size': size, 'tracks': []}
+    moov = None
+    mdat_offset = None
+    for box_type, offset, box_size in iter_boxes(f, 0, size):
+        if box_type == b'ftyp':
+            ftyp = read_payload(f, (offset, min(box_size, 64)))
+            info['brand'] = _fourcc(ftyp[:4])
+            info['compatible_brands'] = [_fourcc(ftyp[i:i + 4]) for i in range(8, len(ftyp) - 3, 4)]
+        elif box_type == b'moov':
+            moov = (offset, box_size)
+        elif box_type == b'mdat' and mdat_offset is None:
+            mdat_offset = offset
+    if 'brand' not in info or moov is None:
+        raise ValueError("Not an MP4 file (no ftyp/moov box)")
+    info['moov_offset'] = moov[0]
+    info['faststart'] = mdat_offset is None or moov[0] < mdat_offset
+
+    data = io.BytesIO(read_payload(f, moov))
+    mvhd = find_box(data, b'mvhd')
+    if mvhd:
+        timescale, duration = _versioned(read_payload(data, mvhd), '>8xII', '>16xIQ')
+        if timescale:
+            info['duration'] = duration / timescale
+    for box_type, offset, box_size in iter_boxes(data):
+        if box_type == b'trak':
+            info['tracks'].append(_probe_track(data, offset, box_size))
+    return info
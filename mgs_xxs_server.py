@@ -0,0 +1,200 @@
+"""Local HTTP server that plays .xxs files in any player, decrypted on the fly.
+
+Every .xxs under the served folder is available as video/mp4 (also under its
+.mp4 name, for players that go by the extension). Range requests only
+decrypt the requested bytes, with keystream pages shared between all
+clients, so seeking costs about the same as reading a plain file.
+
+Stdlib only (plus NumPy when installed, through mgs_xxs_core).
+"""
+import concurrent.futures
+import html
+import http.server
+import os
+import re
+import urllib.parse
+
+from mgs_xxs_core import KeystreamPageCache, XxsReader
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_THREADS = 8
+DEFAULT_PAGE_CACHE_MB = 64
+CHUNK_SIZE = 1024 * 1024 # Bytes decrypted and sent per write
+
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+def parse_range(header, size):
+    """Parse a single-range Range header.
+
+    Returns (start, end) inclusive, None to send the whole file (no or
+    unsupported header), or raises ValueError when it can't be satisfied.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None # Multiple ranges or other units: fall back to a full response
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first: # Suffix range: the last N bytes
+        length = int(last)
+        if not length:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
+def _xxs_sibling(base):
+    """base + '.xxs' as it exists on disk (any extension case), or None"""
+    if os.path.isfile(base + '.xxs'):
+        return base + '.xxs'
+    dirname, name = os.path.split(base)
+    try:
+        for filename in os.listdir(dirname):
+            if filename[:len(name)] == name and filename[len(name):].lower() == '.xxs':
+                return os.path.join(dirname, filename)
+    except OSError:
+        pass
+    return None
+
+class XxsRequestHandler(http.server.BaseHTTPRequestHandler):
+    server_version = "MG-REXXS"
+    protocol_version = "HTTP/1.1" # Keep-alive, players issue many range requests
+    timeout = 15 # Idle keep-alive connections give their pool thread back
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _resolve(self):
+        """Map the URL to an .xxs file under the served root, or None"""
+        relative = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path).lstrip('/')
+        path = os.path.realpath(os.path.join(self.server.root, relative))
+        try:
+            if os.path.commonpath([path, self.server.root]) != self.server.root:
+                return None # Outside the served folder
+        except ValueError: # Another drive on Windows
+            return None
+        base, ext = os.path.splitext(path)
+        if ext.lower() == '.mp4':
+            # The listing links every .xxs as .mp4, even next to a real .mp4 of the same name
+            path = _xxs_sibling(base)
+        if path is None or os.path.splitext(path)[1].lower() != '.xxs' or not os.path.isfile(path):
+            return None
+        return path
+
+    def _send_listing(self, head_only):
+        links = []
+        for dirpath, dirnames, filenames in os.walk(self.server.root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith('.xxs'):
+                    relative = os.path.relpath(os.path.join(dirpath, filename), self.server.root)
+                    url = urllib.parse.quote(os.path.splitext(relative)[0].replace(os.sep, '/') + '.mp4')
+                    links.append(f'<li><a href="/{url}">{html.escape(relative)}</a></li>')
+        body = ("<!DOCTYPE html><title>MG-REXXS</title><ul>\n" + "\n".join(links) + "\n</ul>\n").encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(body)
+
+    def _serve(self, head_only):
+        if urllib.parse.urlsplit(self.path).path in ('', '/'):
+            self._send_listing(head_only)
+            return
+        path = self._resolve()
+        if path is None:
+            self.send_error(404, "No such .xxs file")
+            return
+
+        size = os.path.getsize(path)
+        try:
+            byte_range = parse_range(self.headers.get("Range"), size)
+        except ValueError:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        start, end = byte_range if byte_range else (0, size - 1)
+        length = max(0, end - start + 1)
+
+        self.send_response(206 if byte_range else 200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(length))
+        if byte_range:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        if self.close_connection:
+            # Say so, otherwise clients like FFmpeg try to reuse the connection
+            self.send_header("Connection", "close")
+        self.end_headers()
+        if head_only or not length:
+            return
+
+        with XxsReader(path, page_cache=self.server.page_cache) as reader:
+            reader.seek(start)
+            remaining = length
+            try:
+                while remaining > 0:
+                    data = reader.read(min(CHUNK_SIZE, remaining))
+                    if not data:
+                        break
+                    self.wfile.write(data)
+                    remaining -= len(data)
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True # Players drop connections when seeking
+
+    def do_GET(self):
+        self._serve(head_only=False)
+
+    def do_HEAD(self):
+        self._serve(head_only=True)
+
+class XxsHTTPServer(http.server.HTTPServer):
+    """HTTPServer that handles connections on a fixed-size thread pool.
+
+    Args:
+        root (str): Folder whose .xxs files are served.
+        address (tuple): (host, port), localhost by default.
+        threads (int): Connections handled at once.
+        page_cache_mb (int): Size of the keystream page cache shared by all clients.
+        verbose (bool): Log every request to stderr.
+    """
+    daemon_threads = True
+
+    def __init__(self, root, address=(DEFAULT_HOST, DEFAULT_PORT), threads=DEFAULT_THREADS,
+                 page_cache_mb=DEFAULT_PAGE_CACHE_MB, verbose=False):
+        self.root = os.path.realpath(root)
+        self.verbose = verbose
+        pages = max(1, int(page_cache_mb * 1024 * 1024) // KeystreamPageCache.page_bytes)
+        self.page_cache = KeystreamPageCache(pages)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=threads, thread_name_prefix="xxs-http")
+        super().__init__(address, XxsRequestHandler)
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
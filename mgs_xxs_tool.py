@@ -1,5 +1,6 @@
+import concurrent.futures
 import os
-import struct
+import queue
 import sys
 import tkinter as tk
 from tkinter import ttk
@@ -7,8 +8,19 @@ from tkinter import filedialog
 from tkinter import messagebox
 import threading
 import time
-import cv2
-from PIL import Image, ImageTk
+import bisect
+from collections import OrderedDict, deque
+
+# The crypto core has no GUI dependencies and lives in mgs_xxs_core
+from mgs_xxs_core import (output_path_for, process_file_threaded, DecryptedPreview, ProgressBus, TelemetryLog,
+                          TELEMETRY_VERSION, PROFILE_ENV, parse_profile_modes, collect_inputs, format_duration,
+                          format_rate)
+from mgs_xxs_mp4 import read_video_index_file
+
+# OpenCV and Pillow are only used by the Video Viewer and are imported on
+# first use, see load_video_modules(). NumPy is bound here at the same time,
+# but mgs_xxs_core already imports it at startup when it is installed
+cv2 = np = Image = ImageTk = None
 
 # --- Custom Dark Mode Dialog Classes ---
 
@@ -140,164 +152,425 @@ def ask_dark_yesno(parent, title, message):
     dialog = DarkMessageBox(parent, title, message, "yesno")
     return dialog.result
 
-# --- Constants and Core Logic (Copied from the base script) ---
+# --- Lazy Video Dependencies ---
+
+_video_modules_lock = threading.Lock()
+
+def load_video_modules():
+    """Import OpenCV and Pillow into this module, once, and bind NumPy.
 
-# Constants for Mersenne Twister (MT19937) - standard parameters
-N = 624
-M = 397
-MATRIX_A = 0x9908b0df
-UPPER_MASK = 0x80000000 # 32-bit MSB
-LOWER_MASK = 0x7fffffff # 32-bit LSBs
+    Loading OpenCV and Pillow takes longer than everything else at startup,
+    so the window doesn't wait for them: the Video Viewer calls this when its
+    tab is first shown or a video is loaded. NumPy is usually loaded already
+    by mgs_xxs_core.
+
+    Raises:
+        ImportError: One of them is not installed.
+    """
+    global cv2, np, Image, ImageTk
+    with _video_modules_lock:
+        if ImageTk is not None:
+            return
+        import cv2 as cv2_module
+        import numpy as np_module
+        from PIL import Image as image_module, ImageTk as imagetk_module
+        # ImageTk last, it marks the set as loaded
+        cv2, np, Image, ImageTk = cv2_module, np_module, image_module, imagetk_module
+
+# --- Video Decoding ---
+
+FRAME_QUEUE_SIZE = 8 # Decoded frames buffered ahead of the display
+DISPLAY_MAX_SIZE = (640, 480)
+THUMBNAIL_MAX_SIZE = (240, 180) # Scrub previews, upscaled while dragging
+THUMBNAIL_CACHE_MB = 64
+
+def fit_size(width, height, max_width, max_height):
+    """Size that fits (max_width, max_height) keeping the aspect ratio, never upscaled"""
+    if width > max_width or height > max_height:
+        scale = min(max_width / width, max_height / height)
+        return max(1, int(width * scale)), max(1, int(height * scale))
+    return width, height
+
+class FrameMetrics:
+    """Time per frame of each viewer stage, summed for telemetry.
+
+    decode, resize and convert are added by the decode thread, present by
+    the Tk thread, so every stage has a single writer.
+    """
+    STAGES = ('decode', 'resize', 'convert', 'present')
 
-class MersenneTwister:
     def __init__(self):
-        self.mt = [0] * N
-        self.mti = N + 1
-
-    def _initialize(self, seed):
-        current_value = seed & 0xFFFFFFFF
-        for i in range(N):
-            term1 = (current_value * 69069 + 1) & 0xFFFFFFFF
-            self.mt[i] = ((term1 >> 16) | (current_value & 0xffff0000)) & 0xFFFFFFFF
-            current_value = (term1 * 69069 + 1) & 0xFFFFFFFF
-        self.mti = N
-
-    def _twist(self):
-        for i in range(N):
-            val_term1 = self.mt[i] & UPPER_MASK
-            val_term2 = self.mt[(i + 1) % N] & LOWER_MASK
-            y = (val_term1 + val_term2) & 0xFFFFFFFF
-            self.mt[i] = self.mt[(i + M) % N] ^ (y >> 1)
-            if (y & 1) != 0:
-                self.mt[i] = (self.mt[i] ^ MATRIX_A) & 0xFFFFFFFF
-            self.mt[i] &= 0xFFFFFFFF
-        self.mti = 0
-
-    def gen_rand_int32(self):
-        if self.mti >= N:
-            if self.mti == N + 1: pass
-            self._twist()
-        y = self.mt[self.mti]
-        self.mti += 1
-        y ^= (y >> 11)
-        y ^= (y << 7) & 0x9d2c5680; y &= 0xFFFFFFFF
-        y ^= (y << 15) & 0xefc60000; y &= 0xFFFFFFFF
-        y ^= (y >> 18)
-        return y & 0xFFFFFFFF
-
-def gen_seed(file_path):
-    # Use the version that splits at the first dot, likely closer to eol code
-    filename = os.path.basename(file_path)
-    name_lower = filename
-    name_base = name_lower.split('.', 1)[0]
-    # Fallback if split didn't find a dot (shouldn't happen with .xxs/.mp4 but safe)
-    if not name_base:
-         name_base = name_lower
-
-    seed = 0
-    for char in name_base:
-        c = ord(char)
-        seed = (seed * 0x2356f + c * 0x1d35) & 0xFFFFFFFF
-    return seed & 0xFFFFFFFF
-
-# --- GUI Adapted Processing Function ---
-
-
-def process_file_threaded(input_path, output_path, status_callback, progress_callback, finished_callback):
+        self.totals = dict.fromkeys(self.STAGES, 0.0)
+        self.counts = dict.fromkeys(self.STAGES, 0)
+        self.worst = dict.fromkeys(self.STAGES, 0.0)
+
+    def add(self, stage, seconds):
+        self.totals[stage] += seconds
+        self.counts[stage] += 1
+        if seconds > self.worst[stage]:
+            self.worst[stage] = seconds
+
+    def summary(self):
+        """{stage: {'frames', 'ms_mean', 'ms_max'}} for the stages that ran"""
+        return {stage: {'frames': self.counts[stage],
+                        'ms_mean': round(self.totals[stage] / self.counts[stage] * 1000, 3),
+                        'ms_max': round(self.worst[stage] * 1000, 3)}
+                for stage in self.STAGES if self.counts[stage]}
+
+class FrameDecoder(threading.Thread):
+    """Decode thread that owns the single cv2.VideoCapture of a video.
+
+    Frames are read sequentially, resized and converted to RGB on this thread
+    and put on a bounded queue, so the Tk side only has to pop ready frames.
+    A seek bumps the generation; frames of older generations are dropped by
+    next_frame(). The queue holds (generation, frame_number, rgb) items, with
+    rgb None marking the end of the video.
+
+    Once a VideoIndex is set, seeks start from the nearest keyframe (or just
+    decode forward when the target is close ahead) and are abandoned as soon
+    as a newer seek arrives, so dragging the slider only decodes the latest
+    position.
+
+    Decoding, resizing and colour conversion write into preallocated buffers.
+    RGB frames come from a ring a few entries longer than the queue, so a
+    buffer is only reused once the Tk side is done with it. The buffers are
+    rebuilt only when the source resolution or max_size changes.
+
+    The time each frame spends in decode, resize and convert goes to
+    metrics (FrameMetrics).
     """
-    Processes the file (encrypt/decrypt) in a background thread.
-
-    Args:
-        input_path (str): Path to the input file.
-        output_path (str): Path for the output file.
-        status_callback (function): Function to call with status string updates.
-        progress_callback (function): Function to call with progress updates (0-100).
-        finished_callback (function): Function to call when processing is done (success or fail).
+    def __init__(self, cap, max_size=DISPLAY_MAX_SIZE, queue_size=FRAME_QUEUE_SIZE):
+        super().__init__(daemon=True)
+        load_video_modules()
+        self.cap = cap
+        self.max_size = max_size
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.generation = 0
+        self.drop_before = 0 # Playback is late: frames below this are grabbed, not decoded
+        self.index = None # VideoIndex, set by the background indexer when ready
+        self.metrics = FrameMetrics()
+        self._ring_size = queue_size + 4 # Queue + frames held by Tk + the one being written
+        self._layout = None # (source shape, max_size) the buffers below were made for
+        self._frame = None # Decode target for cap.read()
+        self._resized = None
+        self._rgb_ring = []
+        self._ring_pos = 0
+        self._seek_target = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+
+    def seek(self, frame_number):
+        """Restart decoding at frame_number (the latest request wins)"""
+        with self._lock:
+            self.generation += 1
+            self._seek_target = frame_number
+            self.drop_before = 0
+        self._wake.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+    def next_frame(self):
+        """Next ready (frame_number, rgb) of the current generation, or None.
+
+        rgb is None when the end of the video was reached.
+        """
+        while True:
+            try:
+                generation, frame_number, rgb = self.frames.get_nowait()
+            except queue.Empty:
+                return None
+            if generation == self.generation:
+                return frame_number, rgb
+
+    def _take_seek(self):
+        with self._lock:
+            target, self._seek_target = self._seek_target, None
+            return target, self.generation
+
+    def _put(self, item):
+        # Block while the display is behind, but give up if a seek came in
+        while not self._stop_event.is_set():
+            try:
+                self.frames.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                if self._seek_target is not None:
+                    return False
+        return False
+
+    def _drain(self):
+        while True:
+            try:
+                self.frames.get_nowait()
+            except queue.Empty:
+                return
+
+    def _read(self):
+        start = time.perf_counter()
+        ok, frame = self.cap.read(self._frame)
+        if ok:
+            self.metrics.add('decode', time.perf_counter() - start)
+            self._frame = frame # Same array unless the resolution changed
+        return ok, frame
+
+    def _allocate(self, shape, max_size):
+        height, width = shape[:2]
+        self._size = fit_size(width, height, *max_size)
+        new_width, new_height = self._size
+        self._resized = None
+        if self._size != (width, height):
+            self._resized = np.empty((new_height, new_width, 3), np.uint8)
+        self._rgb_ring = [np.empty((new_height, new_width, 3), np.uint8) for _ in range(self._ring_size)]
+        self._layout = (shape, max_size)
+
+    def _prepare(self, frame):
+        if (frame.shape, self.max_size) != self._layout:
+            self._allocate(frame.shape, self.max_size)
+        rgb = self._rgb_ring[self._ring_pos]
+        self._ring_pos = (self._ring_pos + 1) % self._ring_size
+        start = time.perf_counter()
+        if self._resized is not None:
+            frame = cv2.resize(frame, self._size, dst=self._resized)
+            resized = time.perf_counter()
+            self.metrics.add('resize', resized - start)
+            start = resized
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb)
+        self.metrics.add('convert', time.perf_counter() - start)
+        return rgb
+
+    def _seek(self, target, position):
+        """Read frame target, returns (position, ok, frame).
+
+        position is where the capture currently stands (-1 if unknown). ok is
+        None when a newer seek came in before the target was reached.
+        """
+        index = self.index
+        if index is None:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            position = target
+        else:
+            keyframe = index.keyframe_before(target)
+            if not keyframe <= position <= target:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+                position = keyframe
+            while position < target:
+                if self._seek_target is not None or self._stop_event.is_set():
+                    return position, None, None
+                if not self.cap.grab():
+                    break
+                position += 1
+        ok, frame = self._read()
+        # Seeking right at the end can fail, step back like before
+        while not ok and position > 0 and target - position < 5:
+            position -= 1
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+            ok, frame = self._read()
+        return position, ok, frame
+
+    def run(self):
+        position = -1 # Next frame the capture will return, -1 if unknown
+        generation = self.generation
+        at_end = True # Idle until the first seek
+        try:
+            while not self._stop_event.is_set():
+                target, latest = self._take_seek()
+                if target is not None:
+                    self._drain()
+                    generation, at_end = latest, False
+                    position, ok, frame = self._seek(target, position)
+                    if ok is None:
+                        continue # Superseded, go straight to the newer seek
+                elif at_end:
+                    self._wake.wait(0.1)
+                    self._wake.clear()
+                    continue
+                elif position < self.drop_before:
+                    # Skip without converting so playback can catch up
+                    if self.cap.grab():
+                        position += 1
+                        continue
+                    ok = False
+                else:
+                    ok, frame = self._read()
+
+                if not ok:
+                    at_end = True
+                    self._put((generation, position, None))
+                    position = -1
+                    continue
+                position += 1
+                self._put((generation, position - 1, self._prepare(frame)))
+        finally:
+            self.cap.release()
+
+class ThumbnailCache:
+    """LRU of downscaled RGB frames (NumPy arrays) keyed by frame number.
+
+    The total size of the stored arrays is kept under max_bytes by evicting
+    the least recently used thumbnails. Thread-safe: filled by the scan
+    thread, read by Tk.
+    """
+    def __init__(self, max_mb=THUMBNAIL_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.nbytes = 0
+        self.interval = 0 # Spacing of the thumbnails, set by fill_thumbnails()
+        self._frames = OrderedDict()
+        self._keys = [] # Sorted frame numbers, for nearest()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def put(self, frame_number, rgb):
+        with self._lock:
+            if frame_number in self._frames or rgb.nbytes > self.max_bytes:
+                return
+            self._frames[frame_number] = rgb
+            bisect.insort(self._keys, frame_number)
+            self.nbytes += rgb.nbytes
+            while self.nbytes > self.max_bytes:
+                evicted, old = self._frames.popitem(last=False)
+                del self._keys[bisect.bisect_left(self._keys, evicted)]
+                self.nbytes -= old.nbytes
+
+    def nearest(self, frame_number, max_distance):
+        """(frame_number, rgb) of the closest thumbnail within max_distance, or None"""
+        with self._lock:
+            i = bisect.bisect_left(self._keys, frame_number)
+            candidates = self._keys[max(0, i - 1):i + 1]
+            if not candidates:
+                return None
+            key = min(candidates, key=lambda k: abs(k - frame_number))
+            if abs(key - frame_number) > max_distance:
+                return None
+            self._frames.move_to_end(key)
+            return key, self._frames[key]
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._keys.clear()
+            self.nbytes = 0
+            self.interval = 0
+
+def thumbnail_interval(total_frames, fps, frame_bytes, max_bytes):
+    """Frames between thumbnails: one per second, sparser if the video would not fit"""
+    capacity = max(1, max_bytes // max(1, frame_bytes))
+    return max(1, int(round(fps)), -(-total_frames // capacity))
+
+def fill_thumbnails(video_path, cache, total_frames, fps, index=None, stop_event=None,
+                    max_size=THUMBNAIL_MAX_SIZE):
+    """Decode a thumbnail at regular intervals into cache, on a capture of its own.
+
+    With a VideoIndex, a keyframe close to the sample point is used instead,
+    since it decodes without touching the frames before it.
     """
+    load_video_modules()
+    cap = cv2.VideoCapture(video_path)
     try:
-        status_callback(f"Processing: {os.path.basename(input_path)}")
-        if not os.path.exists(input_path):
-            raise FileNotFoundError("Input file not found.")
-
-        # Determine which filename to use for seeding
-        is_encrypting = output_path.lower().endswith(".xxs")
-        seed_path = output_path if is_encrypting else input_path
-        base_seed_name = os.path.basename(seed_path)
-        status_callback(f"Mode: {'Encrypting' if is_encrypting else 'Decrypting'}")
-
-        # 1. Calculate Seed
-        seed = gen_seed(seed_path)
-        status_callback(f"Seed: {seed} (0x{seed:08X}) for '{base_seed_name}'")
-
-        # 2. Initialize Mersenne Twister
-        mt = MersenneTwister()
-        mt._initialize(seed)
-        status_callback("PRNG initialized.")
-
-        # 3. Get file size for progress
-        file_size = os.path.getsize(input_path)
-        status_callback(f"File size: {file_size} bytes.")
-        if file_size == 0:
-             raise ValueError("Input file is empty.")
-
-        processed_bytes = 0
-        update_interval = max(1, file_size // 100) # Update progress roughly 100 times
-
-        # Use chunked reading/writing for potentially large files
-        status_callback("Starting file processing...")
-        progress_callback(0) # Start progress bar
-
-        with open(input_path, 'rb') as f_in, open(output_path, 'wb') as f_out:
-            while True:
-                chunk = f_in.read(4) # Read 4 bytes
-                if not chunk:
-                    break # End of file
-
-                rand_num = mt.gen_rand_int32()
-
-                if len(chunk) == 4:
-                    original_value = struct.unpack('<I', chunk)[0]
-                    processed_value = (original_value ^ rand_num) & 0xFFFFFFFF
-                    f_out.write(struct.pack('<I', processed_value))
-                else: # Handle remaining bytes (1, 2, or 3)
-                    rand_bytes = struct.pack('<I', rand_num)
-                    processed_chunk = bytes([b ^ rand_bytes[i] for i, b in enumerate(chunk)])
-                    f_out.write(processed_chunk)
-
-                processed_bytes += len(chunk)
-
-                # Update progress (avoiding too frequent updates)
-                if processed_bytes % update_interval == 0 or processed_bytes == file_size:
-                    progress = int((processed_bytes / file_size) * 100)
-                    progress_callback(progress)
-                    # Give the event loop a tiny bit of time if needed, but usually IO bound
-                    # time.sleep(0.001) # Uncomment if GUI feels sluggish during IO
-
-        progress_callback(100) # Ensure progress hits 100%
-        status_callback(f"Success! Output saved to {os.path.basename(output_path)}")
-        finished_callback(True) # Signal success
-
-    except Exception as e:
-        status_callback(f"Error: {e}")
-        # import traceback # Optional detailed error for console/log
-        # traceback.print_exc()
-        finished_callback(False) # Signal failure
+        ok, frame = cap.read()
+        if not ok:
+            return
+        height, width = frame.shape[:2]
+        size = fit_size(width, height, *max_size)
+        interval = thumbnail_interval(total_frames, fps, size[0] * size[1] * 3, cache.max_bytes)
+        cache.interval = interval
+        for target in range(0, total_frames, interval):
+            if stop_event is not None and stop_event.is_set():
+                break
+            frame_number = target
+            if index is not None:
+                keyframe = index.keyframe_before(target)
+                if target - keyframe <= interval // 2:
+                    frame_number = keyframe
+            if target:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+                ok, frame = cap.read()
+                if not ok:
+                    break
+            cache.put(frame_number, cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_AREA),
+                                                 cv2.COLOR_BGR2RGB))
+    finally:
+        cap.release()
+
+# --- Playback Scheduling ---
+
+class PlaybackScheduler:
+    """Presents frames against a monotonic clock instead of sleeping 1/fps.
+
+    The clock is anchored at a frame number and a time; the frame due at any
+    moment follows from the FPS, so decode and display time never add up to
+    drift. Also keeps the achieved FPS and the number of dropped frames.
+    """
+    def __init__(self, fps, window=1.0):
+        self.fps = fps if fps > 0 else 30.0
+        self.window = window
+        self.dropped = 0
+        self._presented = deque()
+        self._last_frame = None
+        self.restart(0)
+
+    def restart(self, frame_number, now=None):
+        """Anchor the clock so frame_number is due now"""
+        self.anchor_frame = frame_number
+        self.anchor_time = time.monotonic() if now is None else now
+        self._last_frame = None
+
+    def due_frame(self, now=None):
+        now = time.monotonic() if now is None else now
+        return self.anchor_frame + int((now - self.anchor_time) * self.fps)
+
+    def delay_until(self, frame_number, now=None):
+        """Seconds until frame_number is due (0 if it already is)"""
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.anchor_time + (frame_number - self.anchor_frame) / self.fps - now)
+
+    def presented(self, frame_number, now=None):
+        now = time.monotonic() if now is None else now
+        if self._last_frame is not None and frame_number > self._last_frame + 1:
+            self.dropped += frame_number - self._last_frame - 1
+        self._last_frame = frame_number
+        self._presented.append(now)
+        while self._presented and now - self._presented[0] > self.window:
+            self._presented.popleft()
+
+    def achieved_fps(self):
+        if len(self._presented) < 2:
+            return 0.0
+        span = self._presented[-1] - self._presented[0]
+        return (len(self._presented) - 1) / span if span > 0 else 0.0
 
 # --- Video Viewer Class ---
 
 class VideoViewer:
-    def __init__(self, parent):
+    def __init__(self, parent, thumbnail_cache_mb=THUMBNAIL_CACHE_MB, telemetry=None):
         self.parent = parent
+        self.telemetry = telemetry # TelemetryLog, gets a 'viewer' record per loaded video
         self.video_path = None
-        self.cap = None
+        self.decoder = None
         self.is_playing = False
         self.current_frame = 0
         self.total_frames = 0
         self.fps = 0
-        self.video_thread = None
         self.is_updating_slider = False  # Flag to prevent recursive calls
         self.video_lock = threading.Lock()  # Lock for video operations
-        
+        self._awaiting_frame = False # A seek was requested, show its first frame
+        self._poll_id = None
+        self.scheduler = None
+        self._held_frame = None # Decoded frame that is not due yet
+        self._stats_shown = 0.0
+        self.thumbnails = ThumbnailCache(thumbnail_cache_mb)
+        self._scan_stop = threading.Event()
+        self.max_size = DISPLAY_MAX_SIZE # Shrinks to the space the label actually has
+        self.source_size = None
+        self.display_size = DISPLAY_MAX_SIZE
+        self._photo = None # One PhotoImage, updated in place with paste()
+        self.preview = None # DecryptedPreview behind video_path, owned by the viewer
+        self._preview_buffer = None
+
         # Create video display frame
         self.video_frame = ttk.Frame(parent)
         self.video_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -330,36 +603,70 @@ class VideoViewer:
         # Time label
         self.time_label = ttk.Label(self.control_frame, text="00:00 / 00:00")
         self.time_label.pack(side=tk.RIGHT, padx=(5, 0))
+
+        # Playback stats (achieved FPS, dropped frames)
+        self.stats_label = ttk.Label(self.control_frame, text="")
+        self.stats_label.pack(side=tk.RIGHT, padx=(5, 0))
+
+        self.video_frame.bind('<Configure>', self._on_frame_resize)
     
-    def load_video(self, video_path):
-        """Load a video file for playback"""
+    def load_video(self, video_path, preview=None):
+        """Load a video file for playback.
+
+        preview is the DecryptedPreview behind video_path, if any. The viewer
+        closes it once the video is replaced or the app exits; if loading
+        fails it stays with the caller.
+        """
         with self.video_lock:
-            if self.cap:
-                self.cap.release()
-            
+            self._stop_decoder()
+            self._close_preview()
+            self.is_playing = False
             self.video_path = video_path
+
+            if not self.ensure_video_modules():
+                show_dark_error(self.parent, "Error", self.video_label.cget('text'))
+                return False
             
             # Try to open video with different backends to avoid threading issues
             try:
                 # First try with default backend
-                self.cap = cv2.VideoCapture(video_path)
-                if not self.cap.isOpened():
+                cap = cv2.VideoCapture(video_path)
+                if not cap.isOpened():
                     # Try with different backend
-                    self.cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
+                    cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
                 
-                if not self.cap.isOpened():
+                if not cap.isOpened():
                     show_dark_error(self.parent, "Error", f"Could not open video: {video_path}")
                     return False
                 
                 # Get video properties
-                self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+                self.total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+                self.fps = cap.get(cv2.CAP_PROP_FPS)
                 
                 # Validate properties
                 if self.total_frames <= 0 or self.fps <= 0:
+                    cap.release()
                     show_dark_error(self.parent, "Error", f"Invalid video properties: {video_path}")
                     return False
                 
+                width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                self.source_size = (width, height) if width and height else None
+                self._update_display_size()
+
+                # From here on the capture belongs to the decode thread
+                self.decoder = FrameDecoder(cap, self.max_size)
+                self.decoder.start()
+                self.thumbnails = ThumbnailCache(self.thumbnails.max_bytes / (1024 * 1024))
+                self._scan_stop = threading.Event()
+                self.preview = preview
+                threading.Thread(target=self._scan_video, daemon=True,
+                                 args=(self.decoder, self.thumbnails, video_path, self.total_frames, self.fps,
+                                       self._scan_stop, preview.done if preview else None)).start()
+                self.scheduler = PlaybackScheduler(self.fps)
+                self._held_frame = None
+                self.stats_label.config(text="")
+
                 # Enable controls
                 self.btn_play.config(state='normal')
                 self.btn_pause.config(state='normal')
@@ -374,81 +681,207 @@ class VideoViewer:
             except Exception as e:
                 show_dark_error(self.parent, "Error", f"Error loading video: {e}")
                 return False
+
+    def ensure_video_modules(self):
+        """Load OpenCV, NumPy and Pillow if needed, returns False (with a note
+        in the video area) when one is missing"""
+        if ImageTk is not None:
+            return True
+        self.video_label.config(text="Loading video support...")
+        self.video_label.update_idletasks()
+        try:
+            load_video_modules()
+        except ImportError as e:
+            self.video_label.config(text=f"Video playback needs opencv-python, numpy and Pillow ({e}).")
+            return False
+        if self.video_path is None:
+            self.video_label.config(text="No video loaded")
+        return True
+
+    def _scan_video(self, decoder, thumbnails, video_path, total_frames, fps, stop_event, body_done=None):
+        """Background: read the keyframe/timestamp index, then fill the thumbnail cache"""
+        try:
+            index = read_video_index_file(video_path)
+        except Exception:
+            index = None # Not an MP4 or a broken moov; seeks fall back to the capture
+        if index is not None:
+            decoder.index = index
+        # A preview is still being decrypted, thumbnails need the whole body
+        while body_done is not None and not body_done.wait(0.2):
+            if stop_event.is_set():
+                return
+        if stop_event.is_set():
+            return
+        try:
+            fill_thumbnails(video_path, thumbnails, total_frames, fps, index, stop_event)
+        except Exception:
+            pass # Previews are optional, the decoder still shows exact frames
+
+    def _stop_decoder(self):
+        if self._poll_id is not None:
+            self.parent.after_cancel(self._poll_id)
+            self._poll_id = None
+        self._scan_stop.set()
+        if self.decoder:
+            self.decoder.stop()
+            self.decoder.join(timeout=1.0)
+            self._log_playback(self.decoder)
+            self.decoder = None
+
+    def _log_playback(self, decoder):
+        """Write the frame timings of the video being closed to the telemetry log"""
+        stages = decoder.metrics.summary()
+        if self.telemetry is None or not stages:
+            return
+        record = {'event': 'viewer', 'version': TELEMETRY_VERSION, 'time': round(time.time(), 3),
+                  'video': self.video_path, 'fps': self.fps, 'total_frames': self.total_frames,
+                  'display_size': list(self.display_size), 'dropped': self.scheduler.dropped if self.scheduler else 0,
+                  'stages': stages}
+        try:
+            self.telemetry.write(record)
+        except OSError:
+            pass # Telemetry never gets in the way of playback
     
     def show_frame(self, frame_number):
-        """Display a specific frame"""
-        if not self.video_path:
+        """Display a specific frame (decoded on the decode thread)"""
+        if not self.decoder:
             return
-        
-        try:
-            # Create a new capture for each frame to avoid threading issues
-            temp_cap = cv2.VideoCapture(self.video_path)
-            if not temp_cap.isOpened():
+        self.decoder.seek(frame_number)
+        self._awaiting_frame = True
+        self._schedule_poll(0)
+
+    def _schedule_poll(self, delay_ms):
+        if self._poll_id is None:
+            self._poll_id = self.parent.after(delay_ms, self._poll_frames)
+
+    def _poll_frames(self):
+        """Tk loop: pop ready frames from the decoder and present them on time"""
+        self._poll_id = None
+        if not self.decoder:
+            return
+        if self._awaiting_frame:
+            # The first frame after a seek is shown as soon as it's decoded
+            item = self.decoder.next_frame()
+            if item is None:
+                self._schedule_poll(5) # Decoder not ready yet
                 return
-            
-            temp_cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-            ret, frame = temp_cap.read()
-            temp_cap.release()
-            
-            if ret:
-                # Resize frame to fit display (max 640x480)
-                height, width = frame.shape[:2]
-                max_width, max_height = 640, 480
-                
-                if width > max_width or height > max_height:
-                    scale = min(max_width / width, max_height / height)
-                    new_width = int(width * scale)
-                    new_height = int(height * scale)
-                    frame = cv2.resize(frame, (new_width, new_height))
-                
-                # Convert BGR to RGB
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                
-                # Convert to PIL Image and then to PhotoImage
-                pil_image = Image.fromarray(frame_rgb)
-                photo = ImageTk.PhotoImage(pil_image)
-                
-                # Update GUI in main thread
-                self.parent.after(0, self._update_frame_gui, photo, frame_number)
-        except Exception as e:
-            print(f"Error reading frame {frame_number}: {e}")
-            # Try to recover by seeking to a different frame
-            if frame_number > 0:
-                self.show_frame(frame_number - 1)
+            self._awaiting_frame = False
+            self._held_frame = None
+            frame_number, rgb = item
+            if rgb is None:
+                self.is_playing = False # End of video
+                return
+            self._update_frame_gui(rgb, frame_number)
+            if self.is_playing:
+                self.scheduler.restart(frame_number)
+                self.scheduler.presented(frame_number)
+                self._schedule_poll(self._delay_ms(frame_number + 1))
+            return
+        if not self.is_playing:
+            return # Idle until play or seek
+
+        now = time.monotonic()
+        due = self.scheduler.due_frame(now)
+        item = self._held_frame or self.decoder.next_frame()
+        self._held_frame = None
+        # Behind the clock: skip to the newest ready frame that is not early
+        while item is not None and item[1] is not None and item[0] < due:
+            newer = self.decoder.next_frame()
+            if newer is None:
+                break
+            if newer[1] is not None and newer[0] > due:
+                self._held_frame = newer
+                break
+            item = newer
+        if item is None:
+            self.decoder.drop_before = due # Let the decoder skip what is already late
+            self._schedule_poll(2)
+            return
+
+        frame_number, rgb = item
+        if rgb is None:
+            self.is_playing = False # End of video
+            self._update_stats_label(force=True)
+            return
+        if frame_number > due:
+            self._held_frame = item # Early, keep it until its time
+            self._schedule_poll(self._delay_ms(frame_number, now))
+            return
+        self._update_frame_gui(rgb, frame_number)
+        self.scheduler.presented(frame_number, now)
+        self._update_stats_label()
+        self._schedule_poll(self._delay_ms(frame_number + 1))
+
+    def _delay_ms(self, frame_number, now=None):
+        return int(self.scheduler.delay_until(frame_number, now) * 1000)
+
+    def _update_stats_label(self, force=False):
+        """Show achieved FPS and dropped frames, a few times per second"""
+        now = time.monotonic()
+        if not force and now - self._stats_shown < 0.5:
+            return
+        self._stats_shown = now
+        self.stats_label.config(text=f"{self.scheduler.achieved_fps():.1f} fps, {self.scheduler.dropped} dropped")
     
-    def _update_frame_gui(self, photo, frame_number):
+    def _on_frame_resize(self, event):
+        """Fit the video into the space left above the controls"""
+        width = event.width
+        height = event.height - self.control_frame.winfo_height() - 10
+        max_size = (max(16, min(width, DISPLAY_MAX_SIZE[0])), max(16, min(height, DISPLAY_MAX_SIZE[1])))
+        if max_size == self.max_size:
+            return
+        self.max_size = max_size
+        self._update_display_size()
+        if self.decoder:
+            self.decoder.max_size = max_size # Buffers are rebuilt on the next frame
+            if not self.is_playing:
+                self.show_frame(self.current_frame) # Redraw the paused frame at the new size
+
+    def _update_display_size(self):
+        if self.source_size:
+            self.display_size = fit_size(*self.source_size, *self.max_size)
+        else:
+            self.display_size = self.max_size
+
+    def _show_preview(self, frame_number):
+        """Show the nearest cached thumbnail right away, the exact frame follows"""
+        if not self.thumbnails.interval:
+            return
+        found = self.thumbnails.nearest(frame_number, self.thumbnails.interval)
+        if found is None:
+            return
+        width, height = self.display_size
+        if self._preview_buffer is None or self._preview_buffer.shape[:2] != (height, width):
+            self._preview_buffer = np.empty((height, width, 3), np.uint8)
+        self._present(cv2.resize(found[1], self.display_size, dst=self._preview_buffer))
+
+    def _present(self, rgb):
+        """Copy rgb into the persistent PhotoImage, recreated only when the size changes"""
+        height, width = rgb.shape[:2]
+        if self._photo is None or (self._photo.width(), self._photo.height()) != (width, height):
+            self._photo = ImageTk.PhotoImage('RGB', (width, height))
+            self.video_label.config(image=self._photo, text="")
+        self._photo.paste(Image.fromarray(rgb)) # Wraps the buffer, no pixel copy on the Python side
+
+    def _update_frame_gui(self, rgb, frame_number):
         """Update GUI elements in the main thread"""
-        self.video_label.config(image=photo, text="")
-        self.video_label.image = photo  # Keep a reference
+        start = time.perf_counter()
+        self._present(rgb)
+        self.decoder.metrics.add('present', time.perf_counter() - start)
         self.current_frame = frame_number
         self.update_progress()
         self.update_time_label()
     
     def play_video(self):
         """Start video playback"""
-        if not self.cap or self.is_playing:
+        if not self.decoder or self.is_playing:
             return
-        
         self.is_playing = True
-        self.video_thread = threading.Thread(target=self._play_loop, daemon=True)
-        self.video_thread.start()
-    
-    def _play_loop(self):
-        """Video playback loop"""
-        try:
-            while self.is_playing and self.current_frame < self.total_frames - 1:
-                self.current_frame += 1
-                self.show_frame(self.current_frame)
-                
-                # Calculate delay based on FPS
-                delay = 1.0 / self.fps if self.fps > 0 else 0.033
-                time.sleep(delay)
-            
-            if self.current_frame >= self.total_frames - 1:
-                self.is_playing = False
-        except Exception as e:
-            print(f"Video playback error: {e}")
-            self.is_playing = False
+        if self.current_frame >= self.total_frames - 1:
+            self.show_frame(0) # Replay from the start
+        else:
+            self.scheduler.restart(self.current_frame + 1)
+            self._schedule_poll(0)
     
     def pause_video(self):
         """Pause video playback"""
@@ -463,24 +896,14 @@ class VideoViewer:
     
     def seek_video(self, value):
         """Seek to a specific position in the video"""
-        if not self.cap or self.is_updating_slider:
+        if not self.decoder or self.is_updating_slider:
             return
         
-        # Pause playback if it's currently playing
-        was_playing = self.is_playing
-        if was_playing:
-            self.is_playing = False
-        
         frame_number = int((float(value) / 100.0) * self.total_frames)
         frame_number = max(0, min(frame_number, self.total_frames - 1))
+        self._show_preview(frame_number)
+        # Playback (if any) simply continues from the new position
         self.show_frame(frame_number)
-        
-        # Resume playback if it was playing before
-        if was_playing:
-            self.is_playing = True
-            if not self.video_thread or not self.video_thread.is_alive():
-                self.video_thread = threading.Thread(target=self._play_loop, daemon=True)
-                self.video_thread.start()
     
     def update_progress(self):
         """Update progress slider"""
@@ -498,6 +921,11 @@ class VideoViewer:
         if self.fps > 0:
             current_time = self.current_frame / self.fps
             total_time = self.total_frames / self.fps
+            index = self.decoder.index if self.decoder else None
+            if index is not None and index.frame_count:
+                # Real timestamps, correct for variable frame rate too
+                current_time = index.timestamp(self.current_frame)
+                total_time = index.timestamp(index.frame_count - 1) + 1 / self.fps
             
             current_min = int(current_time // 60)
             current_sec = int(current_time % 60)
@@ -507,19 +935,319 @@ class VideoViewer:
             time_text = f"{current_min:02d}:{current_sec:02d} / {total_min:02d}:{total_sec:02d}"
             self.time_label.config(text=time_text)
     
+    def _close_preview(self):
+        # Only after the capture was released (temp file fallback can't be removed while open)
+        if self.preview:
+            try:
+                self.preview.close()
+            except OSError:
+                pass
+            self.preview = None
+
     def cleanup(self):
         """Clean up video resources"""
         self.is_playing = False
+        self._stop_decoder()
+        self._close_preview()
         self.video_path = None
 
+# --- Conversion Queue Tab ---
+
+QUEUE_TICK_MS = 100 # How often worker events are applied to the table
+QUEUE_MAX_WORKERS = 16
+QUEUE_FILETYPES = [('MGS XXS Files', '*.xxs'), ('MP4 Videos', '*.mp4'), ('All Files', '*.*')]
+
+class QueueItem:
+    """One row of the conversion queue, only touched by the Tk thread"""
+    def __init__(self, input_path):
+        self.input_path = input_path
+        self.output_path = output_path_for(input_path)
+        self.size = os.path.getsize(input_path) if os.path.isfile(input_path) else 0
+        self.status = "Queued"
+        self.percent = 0
+        self.done_bytes = 0
+        self.started = None
+        self.finished = None
+        self.ok = None
+        self.cancelled = False
+
+    @property
+    def pending(self):
+        """Waiting for Start: never run, or cancelled (the next run resumes it)"""
+        return (self.started is None and self.finished is None) or self.cancelled
+
+    def reset(self):
+        self.status = "Queued"
+        self.started = self.finished = self.ok = None
+        self.cancelled = False
+
+    def rate(self, now):
+        """Bytes per second while running or over the whole run once finished"""
+        if self.started is None:
+            return 0.0
+        return self.done_bytes / max((self.finished or now) - self.started, 1e-3)
+
+class ConversionQueue:
+    """Queue tab: convert many files on a pool of worker threads.
+
+    Workers never touch Tk. They post to a ProgressBus that the Tk thread
+    drains every QUEUE_TICK_MS, redrawing each changed row once per tick
+    however many events it got, so dozens of active jobs stay cheap for the
+    UI.
+    """
+    def __init__(self, parent, root, telemetry=None):
+        self.root = root
+        self.telemetry = telemetry
+        self.frame = ttk.Frame(parent)
+        self.items = OrderedDict() # Treeview row id -> QueueItem
+        self.events = ProgressBus()
+        self.batch = []
+        self.batch_started = None
+        self.cancel_event = None
+        self.pool = None
+        self._ticking = False
+
+        # --- Add Row ---
+        frame_add = ttk.Frame(self.frame, padding="10 5 10 5")
+        frame_add.pack(fill=tk.X)
+        ttk.Button(frame_add, text="Add Files...", command=self.add_files).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(frame_add, text="Add Folder...", command=self.add_folder).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Label(frame_add, text="Folder filter:").pack(side=tk.LEFT, padx=(5, 5))
+        self.pattern_var = tk.StringVar(value="*.xxs")
+        ttk.Entry(frame_add, textvariable=self.pattern_var, width=10).pack(side=tk.LEFT)
+        ttk.Button(frame_add, text="Clear Finished", command=self.clear_finished).pack(side=tk.RIGHT)
+        ttk.Button(frame_add, text="Remove", command=self.remove_selected).pack(side=tk.RIGHT, padx=(0, 5))
+
+        # --- Job Table ---
+        frame_table = ttk.Frame(self.frame, padding="10 0 10 0")
+        frame_table.pack(fill=tk.BOTH, expand=True)
+        columns = ('output', 'progress', 'speed', 'status')
+        self.tree = ttk.Treeview(frame_table, columns=columns, selectmode='extended')
+        self.tree.heading('#0', text="File")
+        self.tree.column('#0', width=170)
+        for column, title, width in (('output', "Output", 120), ('progress', "Progress", 70),
+                                     ('speed', "Speed", 80), ('status', "Status", 200)):
+            self.tree.heading(column, text=title)
+            self.tree.column(column, width=width, stretch=column in ('output', 'status'))
+        scrollbar = ttk.Scrollbar(frame_table, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        # --- Run Row ---
+        frame_run = ttk.Frame(self.frame, padding="10 5 10 5")
+        frame_run.pack(fill=tk.X)
+        ttk.Label(frame_run, text="Workers:").pack(side=tk.LEFT, padx=(0, 5))
+        self.workers_var = tk.IntVar(value=min(4, os.cpu_count() or 1))
+        ttk.Spinbox(frame_run, from_=1, to=QUEUE_MAX_WORKERS, textvariable=self.workers_var,
+                    width=4).pack(side=tk.LEFT, padx=(0, 10))
+        self.btn_start = ttk.Button(frame_run, text="Start", command=self.start)
+        self.btn_start.pack(side=tk.LEFT, padx=(0, 5))
+        self.btn_cancel = ttk.Button(frame_run, text="Cancel", state='disabled', command=self.cancel)
+        self.btn_cancel.pack(side=tk.LEFT)
+        self.summary_label = ttk.Label(frame_run, text="Add files to convert.", anchor=tk.E)
+        self.summary_label.pack(side=tk.RIGHT, fill=tk.X, expand=True)
+
+    @property
+    def running(self):
+        return any(item.finished is None for item in self.batch)
+
+    # --- Adding and Removing Rows ---
+
+    def add_paths(self, paths):
+        # Only a file that converted fine can be queued again
+        queued = {os.path.normcase(os.path.abspath(item.input_path))
+                  for item in self.items.values() if not item.ok}
+        added = 0
+        for path in paths:
+            key = os.path.normcase(os.path.abspath(path))
+            if key in queued or not os.path.isfile(path):
+                continue
+            queued.add(key)
+            item = QueueItem(path)
+            row = self.tree.insert('', tk.END, text=os.path.basename(path))
+            self.items[row] = item
+            self._refresh_row(row, time.monotonic())
+            added += 1
+        if added and not self.running:
+            self.summary_label.config(text=f"{self._pending_count()} file(s) queued.")
+        return added
+
+    def add_files(self):
+        self.add_paths(filedialog.askopenfilenames(filetypes=QUEUE_FILETYPES))
+
+    def add_folder(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            self.add_paths(collect_inputs([folder], self.pattern_var.get() or "*"))
+
+    def remove_selected(self):
+        for row in self.tree.selection():
+            if self.items[row] not in self.batch or self.items[row].finished is not None:
+                self.tree.delete(row)
+                del self.items[row]
+
+    def clear_finished(self):
+        for row, item in list(self.items.items()):
+            if item.finished is not None:
+                self.tree.delete(row)
+                del self.items[row]
+        self.batch = [item for item in self.batch if item.finished is None]
+
+    def _pending_count(self):
+        return sum(1 for item in self.items.values() if item.pending)
+
+    # --- Running ---
+
+    def start(self):
+        if self.running:
+            return
+        pending = [(row, item) for row, item in self.items.items() if item.pending]
+        if not pending:
+            return
+        encrypting = [item for _, item in pending if item.output_path.lower().endswith('.xxs')]
+        if encrypting and not ask_dark_yesno(
+                self.root, "Encryption Filename Confirmation",
+                f"{len(encrypting)} file(s) will be encrypted to .xxs.\n\n"
+                "IMPORTANT: Each encryption key is *directly tied* to the output filename, which MUST "
+                "EXACTLY match the one the game expects for that video.\n\nDo you want to proceed?"):
+            return
+        try:
+            workers = max(1, min(QUEUE_MAX_WORKERS, int(self.workers_var.get())))
+        except (tk.TclError, ValueError):
+            workers = 1
+
+        for _, item in pending:
+            item.reset()
+        self.batch = [item for _, item in pending]
+        self.batch_started = time.monotonic()
+        self.cancel_event = threading.Event()
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="xxs-queue")
+        for row, item in pending:
+            self.pool.submit(self._run_item, row, item.input_path, item.output_path)
+        self.pool.shutdown(wait=False) # Threads exit once the batch is done
+        self.btn_start.config(state='disabled')
+        self.btn_cancel.config(state='normal')
+        if not self._ticking:
+            self._ticking = True
+            self.root.after(QUEUE_TICK_MS, self._tick)
+
+    def _run_item(self, row, input_path, output_path):
+        """Worker thread: convert one file, reporting only through self.events"""
+        if self.cancel_event.is_set():
+            self.events.post(row, 'finished', 'cancelled') # Never started
+            return
+        # The outcome is posted instead of the success flag, so a real failure
+        # during a cancel isn't mistaken for a cancelled (resumable) file.
+        # No profiling here: cProfile can't follow several worker threads at once
+        status_callback, progress_callback, _ = self.events.callbacks(row)
+        outcome = process_file_threaded(input_path, output_path, status_callback, progress_callback,
+                                        lambda success: None, cancel_event=self.cancel_event,
+                                        telemetry=self.telemetry)
+        self.events.post(row, 'finished', outcome)
+
+    def cancel(self):
+        """Stop running conversions at a block boundary (resumable) and skip the rest"""
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.btn_cancel.config(state='disabled')
+            self.summary_label.config(text="Cancelling...")
+
+    def _tick(self):
+        """Tk thread: apply every pending worker event, then redraw changed rows once"""
+        changed = set()
+        for event in self.events.drain():
+            item = self.items.get(event.job)
+            if item is None:
+                continue
+            if event.kind == 'finished':
+                item.ok = event.value == 'ok'
+                item.finished = event.time
+                if item.ok:
+                    item.status = "Done"
+                    item.percent, item.done_bytes = 100, item.size
+                else:
+                    item.cancelled = event.value == 'cancelled'
+                    if item.cancelled and item.started is None:
+                        item.status = "Cancelled"
+            else:
+                if item.started is None:
+                    item.started = event.time
+                if event.kind == 'progress':
+                    item.percent = event.value
+                    item.done_bytes = item.size * event.value // 100
+                else:
+                    item.status = event.value
+            changed.add(event.job)
+
+        now = time.monotonic()
+        # Running rows also get a fresh speed even without new events
+        changed.update(row for row, item in self.items.items() if item.started is not None and item.finished is None)
+        for row in changed:
+            self._refresh_row(row, now)
+        self._update_summary(now)
+
+        if self.running:
+            self.root.after(QUEUE_TICK_MS, self._tick)
+        else:
+            self._ticking = False
+            self.btn_start.config(state='normal')
+            self.btn_cancel.config(state='disabled')
+
+    def _refresh_row(self, row, now):
+        item = self.items[row]
+        speed = format_rate(item.rate(now), 1) if item.started is not None else ""
+        self.tree.item(row, values=(os.path.basename(item.output_path), f"{item.percent}%", speed, item.status))
+
+    def _update_summary(self, now):
+        if not self.batch:
+            return
+        done = [item for item in self.batch if item.finished is not None]
+        failed = sum(1 for item in done if not item.ok and not item.cancelled)
+        cancelled = sum(1 for item in done if item.cancelled)
+        total_bytes = sum(item.size for item in self.batch)
+        done_bytes = sum(item.done_bytes for item in self.batch)
+        elapsed = now - self.batch_started
+        text = f"{len(done) - failed - cancelled}/{len(self.batch)} done"
+        if failed:
+            text += f", {failed} failed"
+        if cancelled:
+            text += f", {cancelled} cancelled"
+        text += f"  |  {format_rate(done_bytes, elapsed)}"
+        if len(done) < len(self.batch):
+            if done_bytes and not self.cancel_event.is_set():
+                eta = (total_bytes - done_bytes) * elapsed / done_bytes
+                text += f"  |  ETA {format_duration(eta)}"
+        else:
+            text += f"  |  finished in {format_duration(elapsed)}"
+        self.summary_label.config(text=text)
+
+    def cleanup(self):
+        """Cancel running conversions and wait for their checkpoints"""
+        if self.pool is not None:
+            self.cancel_event.set()
+            self.pool.shutdown(wait=True)
+
 # --- Tkinter GUI Application ---
 
+EVENT_TICK_MS = 50 # How often worker progress/status events reach the widgets
+
 class MgRexxsApp:
     def __init__(self, root):
         self.root = root
         self.root.title("MG-REXXS")
         self.root.geometry("700x500")
         self.root.resizable(True, True) # Allow resizing for video viewer
+        self.processing_thread = None
+        self.cancel_event = None
+        self.events = ProgressBus()
+        # Opt-in telemetry and profiling for the GUI (the CLI has --telemetry and --profile)
+        self.telemetry = TelemetryLog.from_environment()
+        try:
+            self.profile = parse_profile_modes(os.environ.get(PROFILE_ENV))
+        except ValueError as e:
+            print(f"{PROFILE_ENV}: {e}", file=sys.stderr)
+            self.profile = ()
         
         # --- Color Palette (Dark Mode) ---
         self.bg_color = "#2E2E2E"
@@ -574,6 +1302,13 @@ class MgRexxsApp:
                         background=self.progress_bar_color, # The actual bar color
                         bordercolor=self.bg_color, # Match background
                         lightcolor=self.bg_color, darkcolor=self.bg_color)
+
+        # Queue table styling
+        style.configure('Treeview', background=self.entry_bg_color, fieldbackground=self.entry_bg_color,
+                        foreground=self.fg_color, bordercolor=self.button_bg_color)
+        style.map('Treeview', background=[('selected', self.progress_bar_color)])
+        style.configure('Treeview.Heading', background=self.button_bg_color, foreground=self.fg_color, relief='flat')
+        style.map('Treeview.Heading', background=[('active', self.button_active_bg_color)])
         
 
         self.input_file_path = tk.StringVar()
@@ -615,9 +1350,40 @@ class MgRexxsApp:
         self.entry_output = ttk.Entry(frame_output, textvariable=self.output_file_path, state='readonly', width=60)
         self.entry_output.pack(side=tk.LEFT, expand=True, fill=tk.X)
 
-        # --- Process Button ---
-        self.btn_process = ttk.Button(self.converter_frame, text="Process File", state='disabled', command=self.start_processing_thread)
-        self.btn_process.pack(pady=10)
+        # --- Options Row ---
+        frame_options = ttk.Frame(self.converter_frame, padding="10 0 10 0")
+        frame_options.pack(fill=tk.X)
+
+        self.in_place_var = tk.BooleanVar(value=False)
+        self.chk_in_place = ttk.Checkbutton(frame_options, text="Convert in place (no extra disk space, resumable)",
+                                            variable=self.in_place_var)
+        self.chk_in_place.pack(side=tk.LEFT)
+
+        self.incremental_var = tk.BooleanVar(value=False)
+        self.chk_incremental = ttk.Checkbutton(frame_options, text="Only rewrite changed blocks of an existing .xxs",
+                                               variable=self.incremental_var)
+        self.chk_incremental.pack(side=tk.LEFT, padx=(15, 0))
+
+        # Large files split over several processes (not used in place or incrementally)
+        self.file_workers_var = tk.IntVar(value=1)
+        ttk.Spinbox(frame_options, from_=1, to=os.cpu_count() or 1, textvariable=self.file_workers_var,
+                    width=3).pack(side=tk.RIGHT)
+        ttk.Label(frame_options, text="Processes per file:").pack(side=tk.RIGHT, padx=(15, 5))
+
+        # --- Process / Preview Buttons ---
+        frame_buttons = ttk.Frame(self.converter_frame)
+        frame_buttons.pack(pady=10)
+
+        self.btn_process = ttk.Button(frame_buttons, text="Process File", state='disabled', command=self.start_processing_thread)
+        self.btn_process.pack(side=tk.LEFT, padx=(0, 5))
+
+        # Stops after the current block; processing the file again resumes it
+        self.btn_cancel = ttk.Button(frame_buttons, text="Cancel", state='disabled', command=self.cancel_processing)
+        self.btn_cancel.pack(side=tk.LEFT, padx=(0, 5))
+
+        # Decrypt into memory and play, nothing is written next to the input
+        self.btn_preview = ttk.Button(frame_buttons, text="Preview", state='disabled', command=self.start_preview)
+        self.btn_preview.pack(side=tk.LEFT)
 
         # --- Progress Bar ---
         self.progress_var = tk.DoubleVar()
@@ -627,8 +1393,13 @@ class MgRexxsApp:
         self.progress_bar.pack(pady=5, padx=10)
 
         # --- Video Viewer Tab ---
-        self.video_viewer = VideoViewer(self.notebook)
+        self.video_viewer = VideoViewer(self.notebook, telemetry=self.telemetry)
         self.notebook.add(self.video_viewer.video_frame, text="Video Viewer")
+        self.notebook.bind('<<NotebookTabChanged>>', self._on_tab_changed)
+
+        # --- Queue Tab ---
+        self.conversion_queue = ConversionQueue(self.notebook, self.root, self.telemetry)
+        self.notebook.add(self.conversion_queue.frame, text="Queue")
 
         # --- Status Bar ---
         # Using tk.Label for easier background/foreground control if needed, styled similarly
@@ -636,8 +1407,15 @@ class MgRexxsApp:
                                    anchor=tk.W, padx=5, pady=2,
                                    bg=self.status_bg_color, fg=self.status_fg_color)
         self.lbl_status.pack(side=tk.BOTTOM, fill=tk.X, pady=(5,0), padx=0)
+
+        self.root.after(EVENT_TICK_MS, self._drain_events)
         
     
+    def _on_tab_changed(self, event):
+        # Video support is loaded once the viewer tab is up, after it was drawn
+        if self.notebook.select() == str(self.video_viewer.video_frame):
+            self.root.after_idle(self.video_viewer.ensure_video_modules)
+
     def create_menu(self):
         # Note: Menu bar styling is limited by OS native rendering on Windows
         # The system may override our custom colors
@@ -687,22 +1465,9 @@ Credits:
 
         # Determine output path automatically
         try:
-            dirname = os.path.dirname(filepath)
-            filename = os.path.basename(filepath)
-            name_base, ext = os.path.splitext(filename)
-            ext_lower = ext.lower()
-
-            if ext_lower == '.xxs':
-                # Decrypting: default to .mp4, could be configurable later
-                output_ext = '.mp4'
-                output_filename = name_base + output_ext
-            else:
-                # Encrypting: always output .xxs
-                output_ext = '.xxs'
-                output_filename = name_base + output_ext
-
-            self.output_file_path.set(os.path.join(dirname, output_filename))
+            self.output_file_path.set(output_path_for(filepath))
             self.btn_process.config(state='normal') # Enable process button
+            self.btn_preview.config(state='normal' if filepath.lower().endswith('.xxs') else 'disabled')
         except Exception as e:
              show_dark_error(self.root, "Error", f"Could not determine output filename: {e}")
              self.output_file_path.set("")
@@ -734,33 +1499,111 @@ Credits:
                 self.status_text.set("Encryption cancelled by user.")
                 return  # Stop here if user clicks No
 
+        in_place = self.in_place_var.get()
+        if in_place:
+            proceed = ask_dark_yesno(
+                self.root, "In-Place Conversion",
+                f"'{os.path.basename(in_path)}' will be converted in place and renamed to "
+                f"'{os.path.basename(out_path)}'. No copy of the original is kept.\n\n"
+                "If the conversion is interrupted, processing the same file again resumes it.\n\n"
+                "Do you want to continue?")
+            if not proceed:
+                self.status_text.set("In-place conversion cancelled by user.")
+                return
+
+        # Read the options before locking the UI, a bad Spinbox entry must not leave it disabled
+        max_workers = os.cpu_count() or 1
+        try:
+            file_workers = int(self.file_workers_var.get())
+        except (tk.TclError, ValueError):
+            file_workers = 1
+            print("Processes per file: not a number, using 1.", file=sys.stderr)
+        if not 1 <= file_workers <= max_workers:
+            print(f"Processes per file: {file_workers} is out of range, using "
+                  f"{max(1, min(max_workers, file_workers))}.", file=sys.stderr)
+            file_workers = max(1, min(max_workers, file_workers))
+        self.file_workers_var.set(file_workers)
 
         # Disable buttons during processing
         self.btn_browse.config(state='disabled')
         self.btn_process.config(state='disabled')
+        self.btn_cancel.config(state='normal')
         self.status_text.set("Starting...")
         self.progress_var.set(0) # Reset progress
 
         # Run processing in a separate thread
+        self.cancel_event = threading.Event()
         self.processing_thread = threading.Thread(
             target=process_file_threaded,
             args=(in_path, out_path, self.update_status, self.update_progress, self.on_finished),
+            kwargs={'in_place': in_place, 'workers': file_workers,
+                    'incremental': is_encrypting and not in_place and self.incremental_var.get(),
+                    'cancel_event': self.cancel_event,
+                    'telemetry': self.telemetry, 'profile': self.profile},
             daemon=True # Allows closing window even if thread is running (use cautiously)
         )
         self.processing_thread.start()
 
+    def start_preview(self):
+        in_path = self.input_file_path.get()
+        if not in_path.lower().endswith('.xxs'):
+            return
+        size = os.path.getsize(in_path)
+        try:
+            preview = DecryptedPreview(in_path,
+                                       progress_callback=lambda done: self.update_progress(done * 100 / max(size, 1)))
+        except Exception as e:
+            show_dark_error(self.root, "Error", f"Could not start preview: {e}")
+            return
+        self.btn_preview.config(state='disabled')
+        self.status_text.set("Decrypting preview in memory...")
+        self.progress_var.set(0)
+        preview.start()
+        self._wait_for_preview(preview)
+
+    def _wait_for_preview(self, preview):
+        # Poll until the header (and the start of the body) is decrypted
+        if not preview.header_ready.is_set():
+            self.root.after(20, self._wait_for_preview, preview)
+            return
+        self.btn_preview.config(state='normal')
+        if preview.error is not None:
+            preview.close()
+            show_dark_error(self.root, "Error", f"Preview failed: {preview.error}")
+            return
+        self.notebook.select(1) # Switch to video viewer tab
+        if self.video_viewer.load_video(preview.path, preview=preview):
+            self.status_text.set(f"Previewing {os.path.basename(preview.input_path)} (decrypted in memory)")
+        else:
+            preview.close()
+
     # --- Callback Functions (Must update GUI safely) ---
+    # Worker threads only post to self.events; _drain_events applies them on
+    # the Tk thread every EVENT_TICK_MS, keeping just the latest progress.
     def update_status(self, message):
-        # Schedule GUI update from the main thread
-        self.root.after(0, lambda: self.status_text.set(message))
+        self.events.post('converter', 'status', message)
 
     def update_progress(self, value):
-         # Schedule GUI update from the main thread
-        self.root.after(0, lambda: self.progress_var.set(value))
+        self.events.post('converter', 'progress', value)
+
+    def _drain_events(self):
+        for event in self.events.drain():
+            if event.kind == 'status':
+                self.status_text.set(event.value)
+            elif event.kind == 'progress':
+                self.progress_var.set(event.value)
+            elif event.kind == 'finished':
+                self._on_finished_gui(event.value)
+        self.root.after(EVENT_TICK_MS, self._drain_events)
+
+    def cancel_processing(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.btn_cancel.config(state='disabled')
+            self.status_text.set("Cancelling...")
 
     def on_finished(self, success):
-        # Schedule GUI update from the main thread
-        self.root.after(0, self._on_finished_gui, success) # Pass success flag
+        self.events.post('converter', 'finished', success)
 
     def _on_finished_gui(self, success):
         # This runs in the main GUI thread
@@ -775,18 +1618,25 @@ Credits:
             else:
                 # Status bar already shows success message
                 pass
-        else:
+        elif not self.cancel_event.is_set():
             # Status bar already shows error message
             show_dark_error(self.root, "Error", "File processing failed. Check status bar for details.")
 
         # Re-enable buttons
         self.btn_browse.config(state='normal')
         self.btn_process.config(state='normal')
+        self.btn_cancel.config(state='disabled')
         # Keep progress bar at 100 or 0 depending on success? Or reset?
         # self.progress_var.set(0) # Reset progress bar
 
     def on_closing(self):
         """Clean up resources when closing the app"""
+        if self.processing_thread is not None and self.processing_thread.is_alive():
+            # Let the conversion stop at a block boundary and save its checkpoint
+            self.cancel_event.set()
+            self.processing_thread.join(timeout=10)
+        if hasattr(self, 'conversion_queue'):
+            self.conversion_queue.cleanup()
         if hasattr(self, 'video_viewer'):
             self.video_viewer.cleanup()
         self.root.destroy()
@@ -794,6 +1644,10 @@ Credits:
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # Any arguments: run headless (see mgs_xxs_cli.py)
+        from mgs_xxs_cli import main
+        sys.exit(main())
     root = tk.Tk()
     app = MgRexxsApp(root)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)  # Handle window closing
@@ -0,0 +1,46 @@
+import contextlib
+import io
+import json
+import unittest
+
+from mgs_xxs_cli import main
+from test_core import TempDirTestCase, convert, make_mp4
+
+
+def run_cli(*argv):
+    out, err = io.StringIO(), io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        code = main(list(argv))
+    return code, out.getvalue(), err.getvalue()
+
+
+class VerifyTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ("s000a", "s001a"):
+            make_mp4(self.path(name + ".mp4"))
+            self.assertTrue(convert(self.path(name + ".mp4"), self.path(name + ".xxs"))[0])
+        code, out, err = run_cli("verify", self.dir, "-j", "1", "--write", self.path("sums.json"))
+        self.assertEqual(code, 0, out + err)
+
+    def test_corrupt_entry_fails_only_that_file(self):
+        with open(self.path("sums.json"), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        manifest['files']['s000a.xxs'] = "garbage"
+        with open(self.path("sums.json"), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        code, out, err = run_cli("verify", "--check", self.path("sums.json"), "-j", "1")
+        self.assertEqual(code, 1)
+        self.assertIn("manifest entry is corrupt", out)
+        self.assertRegex(out, r"OK +\S*s001a\.xxs")
+
+    def test_truncated_manifest_is_reported(self):
+        with open(self.path("sums.json"), 'r+b') as f:
+            f.truncate(20)
+        code, out, err = run_cli("verify", "--check", self.path("sums.json"))
+        self.assertEqual(code, 1)
+        self.assertIn("Could not read manifest", err)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,405 @@
+import os
+import struct
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import mgs_xxs_core
+from mgs_xxs_core import (JUMP_MIN_BLOCKS, KEYSTREAM_BACKENDS, N, ConversionCancelled, ConversionJob,
+                          DecryptedPreview, KeystreamCache, KeystreamEngine, encrypt_incremental,
+                          MersenneTwister, ProgressBus, ProgressThrottle, XxsReader, _page_crcs, _write_journal, advance_state,
+                          convert_in_place, gen_seed, initial_state, journal_path_for, keystream_at,
+                          process_file_threaded, recover_names, rollback_in_place, xor_buffer,
+                          xor_file_parallel)
+
+
+def box(box_type, payload):
+    return struct.pack('>I', 8 + len(payload)) + box_type + payload
+
+
+def make_mp4(path, body_size=300 * 1024):
+    data = box(b'ftyp', b'isom\0\0\0\0isom') + box(b'moov', box(b'free', b'\0' * 64))
+    data += box(b'mdat', os.urandom(body_size))
+    with open(path, 'wb') as f:
+        f.write(data)
+    return data
+
+
+def convert(input_path, output_path, **kwargs):
+    messages, outcome = [], []
+    process_file_threaded(input_path, output_path, messages.append, lambda value: None, outcome.append, **kwargs)
+    return outcome == [True], messages
+
+
+class TempDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.dir = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+
+class KeystreamAtTest(unittest.TestCase):
+    """keystream_at() on both sides of JUMP_MIN_BLOCKS, against the original generator"""
+    first_block = JUMP_MIN_BLOCKS - 1 # Reached by generating forward from the seed
+    jump_block = JUMP_MIN_BLOCKS + 1 # Reached by the GF(2) jump unless a cached state is closer
+
+    @classmethod
+    def setUpClass(cls):
+        cls.seed = gen_seed("s000a.xxs")
+        mt = MersenneTwister()
+        mt.mt = [int(v) for v in advance_state(initial_state(cls.seed), cls.first_block)]
+        mt.mti = N
+        words = [mt.gen_rand_int32() for _ in range(4 * N)]
+        cls.reference = struct.pack(f'<{len(words)}I', *words)
+
+    def setUp(self):
+        mgs_xxs_core._state_cache.clear()
+        self.addCleanup(mgs_xxs_core._state_cache.clear)
+
+    def check(self, backend, block, skip=3, length=N * 4):
+        offset = block * N * 4 + skip
+        start = offset - self.first_block * N * 4
+        self.assertEqual(keystream_at(self.seed, offset, length, backend), self.reference[start:start + length])
+
+    def backends(self):
+        return [name for name, backend_cls in KEYSTREAM_BACKENDS.items() if backend_cls.available()]
+
+    def test_cold(self):
+        for backend in self.backends():
+            with self.subTest(backend=backend):
+                mgs_xxs_core._state_cache.clear()
+                self.check(backend, self.first_block)
+                mgs_xxs_core._state_cache.clear()
+                self.check(backend, self.jump_block)
+
+    def test_cached(self):
+        for backend in self.backends():
+            with self.subTest(backend=backend):
+                mgs_xxs_core._state_cache.clear()
+                self.check(backend, self.first_block, skip=0, length=3 * N * 4) # Reads across both blocks
+                self.check(backend, self.jump_block) # Two blocks on from the cached snapshot
+                self.check(backend, self.jump_block, skip=N * 4 - 2) # Exact cache hit
+
+
+class ParallelTest(TempDirTestCase):
+    def test_matches_sequential(self):
+        make_mp4(self.path("s000a.mp4"), body_size=7 * 9984 + 1234 + 3) # Segments and words don't divide it
+        ok, messages = convert(self.path("s000a.mp4"), self.path("s000a.xxs"))
+        self.assertTrue(ok, messages)
+        with open(self.path("s000a.xxs"), 'rb') as f:
+            sequential = f.read()
+
+        xor_file_parallel(self.path("s000a.mp4"), self.path("parallel.xxs"), gen_seed("s000a.xxs"), workers=2,
+                          segment_size=10000, block_size=4098)
+        with open(self.path("parallel.xxs"), 'rb') as f:
+            self.assertEqual(f.read(), sequential)
+
+        os.mkdir(self.path("jobs"))
+        ok, messages = convert(self.path("s000a.mp4"), self.path(os.path.join("jobs", "s000a.xxs")), workers=2,
+                               segment_size=7000)
+        self.assertTrue(ok, messages)
+        self.assertIn("Parallel mode: 2 workers.", messages)
+        with open(self.path(os.path.join("jobs", "s000a.xxs")), 'rb') as f:
+            self.assertEqual(f.read(), sequential)
+
+
+class XxsReaderTest(TempDirTestCase):
+    def test_seek_and_read_match_plaintext(self):
+        plain = make_mp4(self.path("s000a.mp4"))
+        ok, messages = convert(self.path("s000a.mp4"), self.path("s000a.xxs"))
+        self.assertTrue(ok, messages)
+        page = mgs_xxs_core.KeystreamPageCache.page_bytes
+        with XxsReader(self.path("s000a.xxs"), cache_pages=2) as reader:
+            self.assertEqual(reader.read(10), plain[:10])
+            for offset, length in ((page - 5, 20), (3, page * 2 + 7), (len(plain) - 9, 100), (1, 1)):
+                self.assertEqual(reader.seek(offset), offset)
+                self.assertEqual(reader.read(length), plain[offset:offset + length])
+            reader.seek(-100, os.SEEK_END)
+            self.assertEqual(reader.read(), plain[-100:])
+            self.assertEqual(reader.read(1), b'')
+            self.assertEqual(reader.tell(), len(plain))
+
+
+class RecoverNamesTest(TempDirTestCase):
+    def test_finds_the_original_name(self):
+        make_mp4(self.path("s000a.mp4"))
+        ok, messages = convert(self.path("s000a.mp4"), self.path("s000a.xxs"))
+        self.assertTrue(ok, messages)
+        os.rename(self.path("s000a.xxs"), self.path("renamed.xxs"))
+        candidates = ["s%03d%s" % (i, c) for i in range(20) for c in "abc"] + ["S000A", "s000a.mp4"]
+        self.assertEqual(recover_names(self.path("renamed.xxs"), candidates, batch_size=16),
+                         [("s000a", gen_seed("s000a")), ("s000a.mp4", gen_seed("s000a"))])
+
+
+class DecryptedPreviewTest(TempDirTestCase):
+    def test_preview_decrypts_whole_file(self):
+        plain = make_mp4(self.path("s000a.mp4"))
+        ok, messages = convert(self.path("s000a.mp4"), self.path("s000a.xxs"))
+        self.assertTrue(ok, messages)
+
+        preview = DecryptedPreview(self.path("s000a.xxs"), block_size=64 * 1024).start()
+        try:
+            self.assertTrue(preview.wait_ready(10))
+            self.assertTrue(preview.done.wait(10))
+            self.assertIsNone(preview.error)
+            with open(preview.path, 'rb') as f:
+                self.assertEqual(f.read(), plain)
+        finally:
+            preview.close()
+
+
+class CancelTest(TempDirTestCase):
+    def assert_cancelled(self, **kwargs):
+        make_mp4(self.path("s000a.mp4"))
+        cancel_event = threading.Event()
+        cancel_event.set()
+        ok, messages = convert(self.path("s000a.mp4"), self.path("s000a.xxs"), block_size=64 * 1024,
+                               cancel_event=cancel_event, **kwargs)
+        self.assertFalse(ok)
+        self.assertTrue(messages[-1].startswith("Cancelled"), messages[-1])
+
+    def test_cache_path_stops(self):
+        self.assert_cancelled(cache=KeystreamCache(self.path("cache")))
+
+    def test_incremental_stops(self):
+        self.assert_cancelled(incremental=True)
+
+    def test_outcome_tells_cancel_from_failure(self):
+        make_mp4(self.path("s000a.mp4"))
+        cancel_event = threading.Event()
+        cancel_event.set()
+        ignore = lambda value: None
+        self.assertEqual(process_file_threaded(self.path("s000a.mp4"), self.path("s000a.xxs"), ignore, ignore, ignore,
+                                               block_size=64 * 1024, cancel_event=cancel_event), 'cancelled')
+        self.assertEqual(process_file_threaded(self.path("missing.mp4"), self.path("missing.xxs"), ignore, ignore,
+                                               ignore, cancel_event=cancel_event), 'failed')
+
+
+class ProgressThrottleTest(unittest.TestCase):
+    def test_needs_both_interval_and_bytes(self):
+        now = [0.0]
+        throttle = ProgressThrottle(1000, interval=1.0, min_bytes=100, clock=lambda: now[0])
+        self.assertTrue(throttle.ready(0))
+        now[0] = 5.0
+        self.assertFalse(throttle.ready(50)) # Time passed, too few bytes
+        self.assertTrue(throttle.ready(100))
+        self.assertFalse(throttle.ready(900)) # Enough bytes, too soon
+        now[0] = 6.0
+        self.assertTrue(throttle.ready(900))
+        self.assertTrue(throttle.ready(1000)) # The final count always goes out
+
+
+class ResumeTest(TempDirTestCase):
+    def test_cancel_then_resume_matches(self):
+        plain = make_mp4(self.path("s000a.mp4"))
+        keystream = keystream_at(gen_seed("s000a.xxs"), 0, len(plain))
+        expected = bytes(a ^ b for a, b in zip(plain, keystream))
+        for name, backend_cls in KEYSTREAM_BACKENDS.items():
+            if not backend_cls.available():
+                continue
+            with self.subTest(backend=name):
+                output = self.path(f"{name}/s000a.xxs")
+                os.makedirs(os.path.dirname(output))
+                # Blocks that don't line up with twist blocks, cancelled mid-file
+                job = ConversionJob(self.path("s000a.mp4"), output, block_size=10004, backend=name,
+                                    checkpoint_interval=30000)
+                job.progress_callback = lambda done: done >= 100000 and job.cancel()
+                with self.assertRaises(ConversionCancelled):
+                    job.run()
+                self.assertTrue(os.path.exists(job.checkpoint_path))
+                self.assertLess(os.path.getsize(output), len(plain))
+
+                messages = []
+                ConversionJob(self.path("s000a.mp4"), output, block_size=10004, backend=name,
+                              status_callback=messages.append).run()
+                self.assertTrue(any(message.startswith("Resuming at byte") for message in messages), messages)
+                with open(output, 'rb') as f:
+                    self.assertEqual(f.read(), expected)
+                self.assertFalse(os.path.exists(job.checkpoint_path))
+
+
+class ProgressBusTest(unittest.TestCase):
+    def test_merges_progress_in_order(self):
+        bus = ProgressBus()
+        seen = []
+        bus.subscribe(seen.append)
+        bus.post('a', 'progress', 1)
+        bus.post('b', 'progress', 5)
+        bus.post('a', 'progress', 2) # Replaces a's pending 1, keeps its place
+        bus.post('a', 'status', "half")
+        bus.post('a', 'progress', 3) # Queued after the status, not merged into 2
+        bus.post('a', 'progress', 4)
+        bus.post('b', 'finished', True)
+        self.assertEqual([(e.job, e.kind, e.value) for e in bus.drain()],
+                         [('a', 'progress', 2), ('b', 'progress', 5), ('a', 'status', "half"),
+                          ('a', 'progress', 4), ('b', 'finished', True)])
+        self.assertEqual(len(seen), 7) # Subscribers get every event
+        self.assertEqual(bus.drain(), [])
+        bus.post('a', 'progress', 5) # Nothing pending to merge into after a drain
+        self.assertEqual([e.value for e in bus.wait(0)], [5])
+
+
+class ProgressReportTest(TempDirTestCase):
+    def test_whole_percents_only(self):
+        make_mp4(self.path("s000a.mp4"))
+        progress = []
+        ignore = lambda value: None
+
+        class NoIntervalThrottle(ProgressThrottle): # Only the byte threshold is left
+            def __init__(self, total, min_bytes=0):
+                super().__init__(total, interval=0, min_bytes=min_bytes)
+
+        with mock.patch('mgs_xxs_core.ProgressThrottle', NoIntervalThrottle):
+            self.assertEqual(process_file_threaded(self.path("s000a.mp4"), self.path("s000a.xxs"), ignore,
+                                                   progress.append, ignore, block_size=1024), 'ok')
+        # 1 KB blocks are about 0.3% of the file, yet every report moves the bar
+        self.assertGreater(len(progress), 50)
+        self.assertEqual(progress[-1], 100)
+        self.assertEqual(progress[:-1], sorted(set(progress[:-1])))
+
+
+class KeystreamCacheTest(TempDirTestCase):
+    def test_hit_skips_keystream_generation(self):
+        make_mp4(self.path("s000a.mp4"))
+        cache = KeystreamCache(self.path("cache"))
+        os.mkdir(self.path("first"))
+        ok, messages = convert(self.path("s000a.mp4"), self.path(os.path.join("first", "s000a.xxs")), cache=cache)
+        self.assertTrue(ok, messages)
+        with mock.patch('mgs_xxs_core.KeystreamEngine', side_effect=AssertionError("engine built on a hit")):
+            ok, messages = convert(self.path("s000a.mp4"), self.path("s000a.xxs"), cache=cache)
+        self.assertTrue(ok, messages)
+        self.assertIn("Keystream cache hit.", messages)
+        with open(self.path(os.path.join("first", "s000a.xxs")), 'rb') as a, open(self.path("s000a.xxs"), 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+
+    def test_evicts_least_recently_used(self):
+        cache = KeystreamCache(self.path("cache"), max_bytes=3 * 4096)
+        for seed, mtime in ((1, 100), (2, 300), (3, 200)):
+            cache.put(seed, 4096)
+            os.utime(cache.path_for(seed), (mtime, mtime))
+        cache.get(1, 4096).close() # A hit makes seed 1 the most recent
+        cache.put(4, 4096)
+        self.assertIsNone(cache.get(3, 4096))
+        for seed in (1, 2, 4):
+            mapped = cache.get(seed, 4096)
+            self.assertEqual(mapped[:4096], keystream_at(seed, 0, 4096))
+            mapped.close()
+        self.assertEqual(sum(size for _, size, _ in cache.entries()), 3 * 4096)
+
+    def test_incremental_rejects_cache(self):
+        make_mp4(self.path("s000a.mp4"))
+        ok, messages = convert(self.path("s000a.mp4"), self.path("s000a.xxs"), incremental=True,
+                               cache=KeystreamCache(self.path("cache")))
+        self.assertFalse(ok)
+        self.assertIn("cache", messages[-1])
+
+
+class IncrementalTest(TempDirTestCase):
+    block_size = 4096
+
+    def reencrypt(self, data):
+        with open(self.path("s000a.mp4"), 'wb') as f:
+            f.write(data)
+        result = encrypt_incremental(self.path("s000a.mp4"), self.path("s000a.xxs"), block_size=self.block_size)
+        keystream = keystream_at(gen_seed("s000a.xxs"), 0, len(data))
+        with open(self.path("s000a.xxs"), 'rb') as f:
+            self.assertEqual(f.read(), bytes(a ^ b for a, b in zip(data, keystream)))
+        return result
+
+    def test_grow_and_shrink(self):
+        data = bytearray(os.urandom(10 * self.block_size + 100))
+        self.assertEqual(self.reencrypt(data)['rewritten'], 11)
+
+        data[2 * self.block_size + 7] ^= 0xFF
+        data += os.urandom(5000) # Now 12 blocks
+        result = self.reencrypt(data)
+        self.assertEqual(result['blocks'], 12)
+        self.assertLess(result['rewritten'], 12) # Blocks 0 and 1 are kept
+        self.assertEqual(self.reencrypt(data)['rewritten'], 0) # The manifest matches the grown file
+
+        del data[6 * self.block_size + 10:]
+        result = self.reencrypt(data)
+        self.assertEqual((result['blocks'], result['rewritten']), (7, 1)) # Only the new partial last block
+        self.assertEqual(self.reencrypt(data)['rewritten'], 0)
+
+
+class InPlaceRecoveryTest(TempDirTestCase):
+    window_size = 256 * 1024
+
+    def crash_mid_copy(self, name, tear):
+        """Leave name.mp4 as if convert_in_place died while copying window 1
+        into the mapping, tear bytes into it. Returns (original, converted)."""
+        path = self.path(name + ".mp4")
+        original = os.urandom(3 * self.window_size + 123)
+        converted = bytearray(original)
+        xor_buffer(memoryview(converted), len(converted), KeystreamEngine(gen_seed(name + ".xxs")))
+        start = self.window_size
+        with open(path, 'wb') as f:
+            f.write(converted[:start + tear] + original[start + tear:])
+        end = start + self.window_size
+        _write_journal(journal_path_for(path), {
+            'version': 1, 'target': name + ".xxs", 'seed': gen_seed(name + ".xxs"), 'size': len(original),
+            'window_size': self.window_size, 'completed': 1,
+            'pending': {'index': 1, 'before': _page_crcs(original[start:end]),
+                        'after': _page_crcs(bytes(converted[start:end]))}})
+        return original, bytes(converted)
+
+    def test_resume_after_torn_page(self):
+        original, converted = self.crash_mid_copy("s000a", self.window_size // 3)
+        convert_in_place(self.path("s000a.mp4"), window_size=self.window_size)
+        with open(self.path("s000a.xxs"), 'rb') as f:
+            self.assertEqual(f.read(), converted)
+        self.assertFalse(os.path.exists(journal_path_for(self.path("s000a.mp4"))))
+
+    def crash_after_rename(self, name):
+        """Leave name.xxs converted, with the journal of name.mp4 still next to it"""
+        original = os.urandom(2 * self.window_size + 123)
+        with open(self.path(name + ".mp4"), 'wb') as f:
+            f.write(original)
+        convert_in_place(self.path(name + ".mp4"), window_size=self.window_size)
+        _write_journal(journal_path_for(self.path(name + ".mp4")), {
+            'version': 1, 'target': name + ".xxs", 'seed': gen_seed(name + ".xxs"), 'size': len(original),
+            'window_size': self.window_size, 'completed': 3, 'pending': None})
+        with open(self.path(name + ".xxs"), 'rb') as f:
+            return f.read()
+
+    def test_leftover_journal_after_rename(self):
+        converted = self.crash_after_rename("s000a")
+        self.assertEqual(convert_in_place(self.path("s000a.mp4")), len(converted))
+        self.assertFalse(os.path.exists(journal_path_for(self.path("s000a.mp4"))))
+        with open(self.path("s000a.xxs"), 'rb') as f:
+            self.assertEqual(f.read(), converted)
+
+    def test_leftover_journal_through_process_file(self):
+        converted = self.crash_after_rename("s000a")
+        ok, messages = convert(self.path("s000a.mp4"), self.path("s000a.xxs"), in_place=True)
+        self.assertTrue(ok, messages)
+        self.assertFalse(os.path.exists(journal_path_for(self.path("s000a.mp4"))))
+        with open(self.path("s000a.xxs"), 'rb') as f:
+            self.assertEqual(f.read(), converted)
+
+    def test_rollback_with_only_the_journal_left(self):
+        journal_path = journal_path_for(self.path("s000a.mp4"))
+        _write_journal(journal_path, {
+            'version': 1, 'target': "s000a.xxs", 'seed': gen_seed("s000a.xxs"), 'size': self.window_size,
+            'window_size': self.window_size, 'completed': 0, 'pending': None})
+        with open(journal_path + ".tmp", 'w') as f:
+            f.write("{") # A journal update that never got renamed into place
+        self.assertIsNone(rollback_in_place(self.path("s000a.mp4")))
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_rollback_after_torn_page(self):
+        original, converted = self.crash_mid_copy("s000a", self.window_size // 3)
+        rollback_in_place(self.path("s000a.mp4"))
+        with open(self.path("s000a.mp4"), 'rb') as f:
+            self.assertEqual(f.read(), original)
+
+
+if __name__ == '__main__':
+    unittest.main()
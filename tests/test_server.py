@@ -0,0 +1,50 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+
+from mgs_xxs_server import XxsHTTPServer
+from test_core import convert, make_mp4
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        # Plain .mp4 and its .xxs side by side, plus an upper-case extension
+        self.plain = make_mp4(os.path.join(self.dir, "s000a.mp4"))
+        self.assertTrue(convert(os.path.join(self.dir, "s000a.mp4"), os.path.join(self.dir, "s000a.xxs"))[0])
+        self.upper = make_mp4(os.path.join(self.dir, "s001a.mp4"))
+        self.assertTrue(convert(os.path.join(self.dir, "s001a.mp4"), os.path.join(self.dir, "s001a.XXS"))[0])
+        os.remove(os.path.join(self.dir, "s001a.mp4"))
+        self.server = XxsHTTPServer(self.dir, ('127.0.0.1', 0))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def test_listed_links_serve_the_decrypted_xxs(self):
+        with urllib.request.urlopen(self.server.url) as response:
+            links = re.findall(r'href="/([^"]+)"', response.read().decode('utf-8'))
+        self.assertEqual(links, ["s000a.mp4", "s001a.mp4"])
+        for link, expected in zip(links, (self.plain, self.upper)):
+            with urllib.request.urlopen(self.server.url + link) as response:
+                self.assertEqual(response.read(), expected)
+
+    def test_path_on_another_drive_is_not_found(self):
+        # What os.path.commonpath does on Windows for C:\... against a root on D:
+        with mock.patch('mgs_xxs_server.os.path.commonpath', side_effect=ValueError("Paths don't have the same drive")):
+            with self.assertRaises(urllib.error.HTTPError) as raised:
+                urllib.request.urlopen(self.server.url + "C:/Windows/s000a.mp4")
+        self.assertEqual(raised.exception.code, 404)
+        raised.exception.close()
+
+
+if __name__ == '__main__':
+    unittest.main()